@@ -2,6 +2,7 @@ from __future__ import absolute_import, unicode_literals
 import os
 from datetime import datetime, timedelta
 from celery import Celery
+from celery.signals import celeryd_after_setup
 
 # Set the default Django settings module for the 'celery' program.
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "core.settings")
@@ -11,25 +12,43 @@ app = Celery(
     "celery_app", broker="redis://127.0.0.1:6379", backend="redis://127.0.0.1:6379"
 )
 
-# set the schedule in seconds
-schedule = [
-    30,
-    45,
-    60,
-    120,
-    180,
-    300,
-    600,
-    900,
-    1800,
-]
-
-# schedule the task
-for sec in schedule:
-    app.conf.beat_schedule[f"task_{sec}"] = {
-        "task": "logger.tasks.prepare_logs",
-        "schedule": timedelta(seconds=sec),
-        "args": (sec,),
-    }
+# probe cycles are fanned out as shards, reserve one at a time so they spread across workers
+app.conf.worker_prefetch_multiplier = 1
+
+# the scheduler claims due endpoints and crons on every tick, so any frequency works
+app.conf.beat_schedule["schedule_probes"] = {
+    "task": "logger.tasks.schedule_probes",
+    "schedule": timedelta(seconds=int(os.environ.get("SCHEDULER_TICK", 5))),
+}
+# certificates and domains are checked in the background, each host at most once a day
+app.conf.beat_schedule["check_expirations"] = {
+    "task": "logger.tasks.check_expirations",
+    "schedule": timedelta(seconds=int(os.environ.get("EXPIRY_CHECK_INTERVAL", 3600))),
+}
+# log partitions are created ahead of time and dropped once past retention
+app.conf.beat_schedule["manage_log_partitions"] = {
+    "task": "logger.tasks.manage_log_partitions",
+    "schedule": timedelta(hours=1),
+}
+# minute and hour rollups are kept for a limited time
+app.conf.beat_schedule["prune_old_rollups"] = {
+    "task": "logger.tasks.prune_old_rollups",
+    "schedule": timedelta(hours=1),
+}
+
+
+@celeryd_after_setup.connect
+def add_probe_queue(sender, instance, **kwargs):
+    """
+    Probe shards are routed to the queue of their region and lane
+    workers declare theirs through PROBE_REGION and PROBE_LANE and consume it besides the default queue
+    """
+    from util.queue_util import get_worker_queue
+
+    queue = get_worker_queue()
+    if queue:
+        instance.app.amqp.queues.select_add(queue)
+
+
 # Load task modules from all registered Django apps.
 app.autodiscover_tasks()
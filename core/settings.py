@@ -198,3 +198,146 @@ ELASTICSEARCH_DSL = {
 ELASTICSEARCH_INDEX_NAMES = {
     "logger.log": "logs",
 }
+
+# probe engine
+# maximum number of requests in flight during a probe cycle
+PROBE_CONCURRENCY = int(os.environ.get("PROBE_CONCURRENCY", 200))
+# connections kept per (scheme, host, port, verify_ssl) pool
+PROBE_POOL_MAXSIZE = int(os.environ.get("PROBE_POOL_MAXSIZE", 10))
+# seconds an idle keep-alive connection is held open
+PROBE_POOL_KEEPALIVE = int(os.environ.get("PROBE_POOL_KEEPALIVE", 60))
+# seconds before an unused pool is closed altogether
+PROBE_POOL_IDLE_TIMEOUT = int(os.environ.get("PROBE_POOL_IDLE_TIMEOUT", 900))
+# endpoints per shard, each shard is probed by a single worker
+PROBE_SHARD_SIZE = int(os.environ.get("PROBE_SHARD_SIZE", 100))
+
+# scheduler
+# seconds between scheduler ticks, rows due within the next tick are claimed ahead of time
+SCHEDULER_TICK = int(os.environ.get("SCHEDULER_TICK", 5))
+# rows claimed per SELECT ... FOR UPDATE SKIP LOCKED batch
+SCHEDULER_BATCH_SIZE = int(os.environ.get("SCHEDULER_BATCH_SIZE", 1000))
+
+REDIS_URL = os.environ.get("REDIS_URL", "redis://127.0.0.1:6379")
+
+# compiled keyword and status patterns kept per worker
+MATCH_CACHE_SIZE = int(os.environ.get("MATCH_CACHE_SIZE", 1024))
+# characters carried over between chunks when a regex is matched against a streamed body
+MATCH_OVERLAP = int(os.environ.get("MATCH_OVERLAP", 1024))
+# bytes read per chunk when streaming a response body
+PROBE_CHUNK_SIZE = int(os.environ.get("PROBE_CHUNK_SIZE", 65536))
+# default cap on the bytes downloaded per keyword probe
+PROBE_MAX_BODY_SIZE = int(os.environ.get("PROBE_MAX_BODY_SIZE", 1048576))
+
+# resolver cache
+# seconds before a dns query is abandoned
+DNS_TIMEOUT = int(os.environ.get("DNS_TIMEOUT", 5))
+# bounds applied to the record TTLs
+DNS_MIN_TTL = int(os.environ.get("DNS_MIN_TTL", 30))
+DNS_MAX_TTL = int(os.environ.get("DNS_MAX_TTL", 3600))
+# seconds a host which doesn't resolve is cached for
+DNS_NEGATIVE_TTL = int(os.environ.get("DNS_NEGATIVE_TTL", 60))
+
+# ping monitors
+# echo requests sent to every host per check
+PING_COUNT = int(os.environ.get("PING_COUNT", 3))
+# milliseconds between two rounds of echo requests
+PING_INTERVAL = int(os.environ.get("PING_INTERVAL", 200))
+# bytes of payload carried by every echo request
+PING_PAYLOAD_SIZE = int(os.environ.get("PING_PAYLOAD_SIZE", 56))
+
+# ssl certificate and domain expiry
+# seconds between two runs of the expiry checker, every host is checked at most once per EXPIRY_CACHE_TTL
+# or EXPIRY_RETRY_TTL once a lookup failed
+EXPIRY_CHECK_INTERVAL = int(os.environ.get("EXPIRY_CHECK_INTERVAL", 3600))
+# seconds the expiry dates of a host are cached for
+EXPIRY_CACHE_TTL = int(os.environ.get("EXPIRY_CACHE_TTL", 86400))
+# seconds before a failed lookup is retried
+EXPIRY_RETRY_TTL = int(os.environ.get("EXPIRY_RETRY_TTL", 3600))
+# seconds before a certificate or RDAP lookup is abandoned
+EXPIRY_TIMEOUT = int(os.environ.get("EXPIRY_TIMEOUT", 10))
+# RDAP redirector, forwards domain lookups to the registry in charge
+RDAP_URL = os.environ.get("RDAP_URL", "https://rdap.org/domain/")
+
+# per-host politeness, request handlers can override both, 0 disables the limit
+# requests in flight per host, matches the connection pool so waiting for a connection doesn't count as latency
+ORIGIN_CONCURRENCY = int(os.environ.get("ORIGIN_CONCURRENCY", 10))
+# requests per second sent to a host
+ORIGIN_RATE = int(os.environ.get("ORIGIN_RATE", 0))
+
+# adaptive timeouts
+# probe durations kept per endpoint, timeouts included
+LATENCY_SAMPLES = int(os.environ.get("LATENCY_SAMPLES", 100))
+# samples needed before the adaptive timeout kicks in
+ADAPTIVE_MIN_SAMPLES = int(os.environ.get("ADAPTIVE_MIN_SAMPLES", 20))
+# percentile of the recent durations considered normal
+ADAPTIVE_PERCENTILE = int(os.environ.get("ADAPTIVE_PERCENTILE", 99))
+# how far beyond the normal range a probe may go before it's given up on
+ADAPTIVE_MULTIPLIER = int(os.environ.get("ADAPTIVE_MULTIPLIER", 3))
+# seconds, lower bound of the adaptive timeout
+ADAPTIVE_MIN_TIMEOUT = int(os.environ.get("ADAPTIVE_MIN_TIMEOUT", 2))
+
+# slow lane
+# chronically slow or timing out endpoints are probed from their own queue, consumed by dedicated workers
+# queue names are suffixed with the region, e.g. probes_slow.eu
+SLOW_LANE_QUEUE = os.environ.get("SLOW_LANE_QUEUE", "probes_slow")
+# requests in flight per slow lane worker, and endpoints per slow lane shard
+SLOW_LANE_CONCURRENCY = int(os.environ.get("SLOW_LANE_CONCURRENCY", 50))
+SLOW_LANE_SHARD_SIZE = int(os.environ.get("SLOW_LANE_SHARD_SIZE", 20))
+# recent samples the lane is decided on, and the least needed to move an endpoint
+LANE_WINDOW = int(os.environ.get("LANE_WINDOW", 20))
+LANE_MIN_SAMPLES = int(os.environ.get("LANE_MIN_SAMPLES", 10))
+# percent of timeouts, or seconds of p95 latency, which demote an endpoint, half of both promotes it back
+SLOW_LANE_TIMEOUT_RATE = int(os.environ.get("SLOW_LANE_TIMEOUT_RATE", 20))
+SLOW_LANE_LATENCY = int(os.environ.get("SLOW_LANE_LATENCY", 5))
+
+# regions
+# probe queues are suffixed with the region, e.g. probes.eu, workers declare theirs through PROBE_REGION
+PROBE_QUEUE = os.environ.get("PROBE_QUEUE", "probes")
+# region endpoints without any region enabled are probed from
+DEFAULT_REGION = os.environ.get("DEFAULT_REGION", "us")
+# region and lane (fast, slow or priority) of the probe queue the worker consumes, unset on workers which only run the default queue
+PROBE_REGION = os.environ.get("PROBE_REGION")
+PROBE_LANE = os.environ.get("PROBE_LANE", "fast")
+
+# re-checks
+# SUSPECT, DOWN and RECOVERING endpoints are probed again from their own queue, suffixed with the region
+RECHECK_QUEUE = os.environ.get("RECHECK_QUEUE", "probes_priority")
+# seconds before the first re-check, doubled after every re-check up to the max
+RECHECK_INTERVAL = int(os.environ.get("RECHECK_INTERVAL", 10))
+RECHECK_MAX_INTERVAL = int(os.environ.get("RECHECK_MAX_INTERVAL", 120))
+# seconds an endpoint has to be DOWN before it's back on its regular schedule
+RECHECK_STEADY_DOWN = int(os.environ.get("RECHECK_STEADY_DOWN", 900))
+
+# log writer
+# the logs of a probe cycle are written in batches of at most this many rows
+LOG_FLUSH_SIZE = int(os.environ.get("LOG_FLUSH_SIZE", 5000))
+
+# log partitions
+# the log table is partitioned by created_at per "day" or "week", partitions are created this many intervals ahead
+LOG_PARTITION_INTERVAL = os.environ.get("LOG_PARTITION_INTERVAL", "day")
+LOG_PARTITIONS_AHEAD = int(os.environ.get("LOG_PARTITIONS_AHEAD", 7))
+# days of logs to keep, older partitions are dropped, 0 keeps everything
+LOG_RETENTION_DAYS = int(os.environ.get("LOG_RETENTION_DAYS", 90))
+
+# rollups
+# days of per minute, per hour and per day rollups to keep, 0 keeps everything
+ROLLUP_RETENTION_DAYS = {
+    "minute": int(os.environ.get("ROLLUP_MINUTE_RETENTION_DAYS", 7)),
+    "hour": int(os.environ.get("ROLLUP_HOUR_RETENTION_DAYS", 90)),
+    "day": int(os.environ.get("ROLLUP_DAY_RETENTION_DAYS", 0)),
+}
+
+# sla
+# default uptime target in percent, the error budget is what's left of it
+SLA_TARGET = float(os.environ.get("SLA_TARGET", 99.9))
+# seconds per slot the window is split in, coarser when the window would need more than SLA_MAX_SLOTS slots
+SLA_RESOLUTION = int(os.environ.get("SLA_RESOLUTION", 60))
+SLA_MAX_SLOTS = int(os.environ.get("SLA_MAX_SLOTS", 10080))
+# seconds at the end of the window the burn rate is measured over
+SLA_BURN_WINDOW = int(os.environ.get("SLA_BURN_WINDOW", 3600))
+
+# log archive
+# logs are moved out of the log table and index into columnar files, per entity and day, by the archive_logs command
+LOG_ARCHIVE_ROOT = os.environ.get("LOG_ARCHIVE_ROOT", BASE_DIR / "archive/")
+# days after which logs are archived
+LOG_ARCHIVE_AFTER_DAYS = int(os.environ.get("LOG_ARCHIVE_AFTER_DAYS", 30))
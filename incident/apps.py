@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class IncidentConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "incident"
+
+    def ready(self):
+        # connects the receivers
+        from . import signals
@@ -0,0 +1,38 @@
+from django.db import transaction
+from django.db.models import signals
+from django.dispatch import receiver
+from logger.models import CronHandler, Endpoint
+from .tasks import prune_outages
+
+
+def schedule_prune(service_ids):
+    # pruned once the change is committed, the task reads the memberships which are left
+    service_ids = list(service_ids)
+    if service_ids:
+        transaction.on_commit(lambda: prune_outages.delay(service_ids))
+
+
+@receiver(signals.m2m_changed, sender=Endpoint.service.through)
+@receiver(signals.m2m_changed, sender=CronHandler.service.through)
+def monitors_left_services(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Endpoints and crons leaving a service are taken out of its outage
+    """
+    if action not in ("pre_remove", "pre_clear"):
+        return
+    if reverse:
+        # service.endpoints / service.crons changed
+        schedule_prune([instance.pk])
+    elif action == "pre_remove":
+        schedule_prune(pk_set)
+    else:
+        schedule_prune(instance.service.values_list("id", flat=True))
+
+
+@receiver(signals.pre_delete, sender=Endpoint)
+@receiver(signals.pre_delete, sender=CronHandler)
+def monitor_deleted(sender, instance, **kwargs):
+    """
+    Deleted endpoints and crons are taken out of the outages of their services
+    """
+    schedule_prune(instance.service.values_list("id", flat=True))
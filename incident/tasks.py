@@ -1,50 +1,125 @@
 from core.celery import app
 from django.core.exceptions import ValidationError
-import datetime
+from django.utils import timezone
 from incident.models import EscalationLevelAssignment
-from logger.models import Incident, Service
-from logger.signals import escalation_builder
+from logger.models import CronHandler, Endpoint, Incident, Service
+from util.state_util import (
+    apply_results,
+    get_cron_state_id,
+    get_outages,
+    get_state_owner,
+    get_states,
+    leave_outages,
+    UP,
+)
+
+# incidents of an outage which isn't over yet
+ACTIVE_STATUSES = ("Open", "Acknowledged")
 
 
 # TODO: figure out reason why the incident was created
 # TODO: prepare events model
 # TODO: incident builder can be shared across calls
 @app.task
-def create_incident(service_id):
+def create_incident(service_id, cause="outage"):
     """
-    Create a new incident and returns it's id
+    Opens an incident for the service and returns it's id
+    Sent by the state machine when the service's outage starts, and by the expiry checker with cause="expiry"
+    Nothing is opened during a maintainance window
     """
-    service = Service.objects.get(id=service_id)
+    service = (
+        Service.objects.select_related("maintainance_policy")
+        .filter(id=service_id)
+        .first()
+    )
+    if service is None:
+        return None
     window = service.maintainance_policy
-
-    current_time = datetime.datetime.now()
-    incident = None
+    current_time = timezone.now()
     # check if maintainance window is in effect
-    if window.start_time > current_time or window.end_time < current_time:
-        # deduplicate incidents associated with the given service
-        if not (
-            Incident.objects.filter(service=service, status="Acknowledged").exists()
-            or Incident.objects.filter(service=service, status="Resolved").exists()
-        ):
-            incident = Incident.objects.get_or_create(
-                service=service,
-                status="Open",
-            )[0]
+    if window is not None and window.start_time <= current_time <= window.end_time:
+        return None
 
-    return incident.id if incident is not None else None
+    # deduplicate with the incident still open for the service, e.g. when the task is retried
+    incident = Incident.objects.filter(
+        service=service, cause=cause, status__in=ACTIVE_STATUSES
+    ).first()
+    if incident is None:
+        incident = Incident.objects.create(service=service, cause=cause, status="Open")
+    return incident.id
 
 
 @app.task
-def resolve_incident(service_id):
+def resolve_incident(service_id, cause="outage"):
     """
     Resolves an existing incident
     """
-    if Service.objects.filter(id=service_id).exists():
-        # de-duplicate open incidents
-        service = Service.objects.get(id=service_id)
-        incident = Incident.objects.get(
-            service=service,
-            status="Open",
-        )
+    # de-duplicate open incidents, an outage ending leaves the expiry incidents open
+    incident = Incident.objects.filter(
+        service_id=service_id, cause=cause, status__in=ACTIVE_STATUSES
+    ).first()
+    # nothing to resolve when the outage fell within a maintainance window
+    if incident is not None:
         incident.status = "Resolved"
         incident.save()
+
+
+def dispatch_incidents(results):
+    """
+    Moves the endpoints and crons of the results through the state machine
+    Opens the incidents of the services whose outage started and resolves the ones whose outage ended
+    """
+    started, ended = apply_results(results)
+    for service_id in started:
+        create_incident.delay(service_id=service_id)
+    for service_id in ended:
+        resolve_incident.delay(service_id=service_id)
+
+
+@app.task
+def prune_outages(service_ids):
+    """
+    Takes the endpoints and crons which left the services out of their outages
+    Sent whenever endpoints or crons leave a service, one removed while DOWN would keep the outage open forever
+    Resolves the incidents of the outages which ended with them
+    """
+    members = {service_id: set() for service_id in service_ids}
+    for kind, model, field in (
+        ("endpoint", Endpoint, "endpoint_id"),
+        ("cron", CronHandler, "cronhandler_id"),
+    ):
+        for service_id, monitor_id in model.service.through.objects.filter(
+            service_id__in=service_ids
+        ).values_list("service_id", field):
+            members[service_id].add((kind, monitor_id))
+    stale = {
+        service_id: [
+            state_id
+            for state_id in state_ids
+            if get_state_owner(state_id) not in members[service_id]
+        ]
+        for service_id, state_ids in get_outages(service_ids).items()
+    }
+    for service_id in leave_outages(stale):
+        resolve_incident.delay(service_id=service_id)
+
+
+def record_heartbeat(cron):
+    """
+    Ends the outage of the cron, if it's in one, a heartbeat is all it takes to recover
+    """
+    state_id = get_cron_state_id(cron.pk)
+    state, _ = get_states([state_id])[state_id]
+    if state == UP:
+        return
+    dispatch_incidents(
+        [
+            {
+                "cron_id": cron.pk,
+                "status": "UP",
+                "service_ids": list(
+                    cron.service.filter(is_active=True).values_list("id", flat=True)
+                ),
+            }
+        ]
+    )
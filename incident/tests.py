@@ -1,3 +1,114 @@
+import datetime
+from unittest import mock
 from django.test import TestCase
+from django.utils import timezone
+from incident import tasks
+from incident.tasks import create_incident, resolve_incident
+from logger.models import Endpoint, Incident, MaintainancePolicy, Service
+from util import state_util
+from util.redis_util import get_redis
+from util.state_util import apply_results, get_outages, get_state_id, STATE_KEY
 
-# Create your tests here.
+
+class IncidentTaskTests(TestCase):
+    def setUp(self):
+        self.service = Service.objects.create(name="api")
+
+    def test_every_outage_opens_its_own_incident(self):
+        first = create_incident(self.service.id)
+        resolve_incident(self.service.id)
+        second = create_incident(self.service.id)
+        self.assertNotEqual(first, second)
+        self.assertEqual(Incident.objects.get(id=first).status, "Resolved")
+        self.assertEqual(Incident.objects.get(id=second).status, "Open")
+
+    def test_open_incident_is_reused(self):
+        first = create_incident(self.service.id)
+        Incident.objects.filter(id=first).update(status="Acknowledged")
+        self.assertEqual(create_incident(self.service.id), first)
+        resolve_incident(self.service.id)
+        self.assertEqual(Incident.objects.get(id=first).status, "Resolved")
+
+    def test_nothing_is_opened_during_maintainance(self):
+        now = timezone.now()
+        self.service.maintainance_policy = MaintainancePolicy.objects.create(
+            name="upgrade",
+            start_time=now - datetime.timedelta(hours=1),
+            end_time=now + datetime.timedelta(hours=1),
+        )
+        self.service.save()
+        self.assertIsNone(create_incident(self.service.id))
+        self.assertFalse(Incident.objects.exists())
+        # nothing to resolve either
+        resolve_incident(self.service.id)
+
+    def test_outage_recovery_leaves_expiry_incidents_open(self):
+        expiry = create_incident(self.service.id, cause="expiry")
+        outage = create_incident(self.service.id)
+        self.assertNotEqual(expiry, outage)
+        self.assertEqual(create_incident(self.service.id, cause="expiry"), expiry)
+        resolve_incident(self.service.id)
+        self.assertEqual(Incident.objects.get(id=outage).status, "Resolved")
+        self.assertEqual(Incident.objects.get(id=expiry).status, "Open")
+
+
+class OutageTests(TestCase):
+    def setUp(self):
+        self.service = Service.objects.create(name="api")
+        self.endpoint = Endpoint.objects.create(url="http://api.local/")
+        self.endpoint.service.add(self.service)
+        self.state_id = get_state_id(self.endpoint.pk, "us")
+        self.addCleanup(get_redis().delete, STATE_KEY)
+        self.addCleanup(
+            get_redis().delete, state_util.OUTAGE_KEY.format(self.service.pk)
+        )
+
+    def get_result(self, status):
+        return {
+            "endpoint_id": self.endpoint.pk,
+            "region": "us",
+            "service_ids": [self.service.pk],
+            "status": status,
+        }
+
+    def test_concurrent_batch_is_read_again(self):
+        get_states = state_util.get_states
+
+        def concurrent_batch(*args, **kwargs):
+            states = get_states(*args, **kwargs)
+            if concurrent_batch.calls == 0:
+                # another batch takes the endpoint DOWN between the read and the write
+                get_redis().hset(STATE_KEY, self.state_id, "D100")
+            concurrent_batch.calls += 1
+            return states
+
+        concurrent_batch.calls = 0
+        with mock.patch.object(state_util, "get_states", concurrent_batch):
+            started, ended = apply_results([self.get_result("DOWN")], now=200)
+        self.assertEqual(concurrent_batch.calls, 2)
+        # the other batch already opened the outage
+        self.assertEqual((started, ended), (set(), set()))
+        self.assertEqual(get_redis().hget(STATE_KEY, self.state_id), b"D100")
+
+    @mock.patch("incident.tasks.resolve_incident")
+    @mock.patch("incident.signals.prune_outages")
+    def test_removed_endpoint_leaves_the_outage(self, prune_outages, resolve):
+        started, _ = apply_results([self.get_result("DOWN")], now=100)
+        self.assertEqual(started, {self.service.pk})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.endpoint.service.remove(self.service)
+        prune_outages.delay.assert_called_once_with([self.service.pk])
+
+        tasks.prune_outages([self.service.pk])
+        self.assertEqual(get_outages([self.service.pk]), {self.service.pk: set()})
+        resolve.delay.assert_called_once_with(service_id=self.service.pk)
+
+    @mock.patch("incident.tasks.resolve_incident")
+    def test_members_stay_in_the_outage(self, resolve):
+        apply_results([self.get_result("DOWN")], now=100)
+        tasks.prune_outages([self.service.pk])
+        self.assertEqual(
+            get_outages([self.service.pk]), {self.service.pk: {self.state_id}}
+        )
+        resolve.delay.assert_not_called()
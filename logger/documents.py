@@ -13,6 +13,7 @@ class LogDocument(Document):
         },
     )
     response_time = fields.Double()
+    created_at = fields.Date()
     message = fields.TextField(
         attr="message",
         fields={
@@ -0,0 +1,121 @@
+import datetime
+import itertools
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Min
+from django.utils import timezone
+from django.contrib.contenttypes.models import ContentType
+from elasticsearch.exceptions import ElasticsearchException
+from logger.models import Log
+from logger.documents import LogDocument
+from util.archive_util import write_day, to_milliseconds
+from util.partition_util import is_partitioned, drop_partitions
+
+
+class Command(BaseCommand):
+    help = "Moves the logs older than --days days from the log table and the log index to the columnar archive"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=settings.LOG_ARCHIVE_AFTER_DAYS,
+            help="Archive the days which ended at least this many days ago",
+        )
+        parser.add_argument(
+            "--keep",
+            action="store_true",
+            help="Archive without deleting the logs from the log table and the log index",
+        )
+
+    def handle(self, *args, days, keep, **options):
+        now = timezone.now()
+        # whole days only, the archive holds a file per entity and day
+        cutoff = (now - datetime.timedelta(days=days)).replace(
+            hour=0, minute=0, second=0, microsecond=0
+        )
+        oldest = Log.objects.filter(created_at__lt=cutoff).aggregate(
+            oldest=Min("created_at")
+        )["oldest"]
+        if oldest is None:
+            self.stdout.write("Nothing to archive.")
+            return
+
+        models = {
+            content_type.pk: content_type.model
+            for content_type in ContentType.objects.filter(app_label="logger")
+        }
+        start = oldest.astimezone(datetime.timezone.utc).replace(
+            hour=0, minute=0, second=0, microsecond=0
+        )
+        while start < cutoff:
+            end = start + datetime.timedelta(days=1)
+            logs, entities = self.archive_day(models, start, end)
+            self.stdout.write(
+                f"{start.date()}: archived {logs} logs of {entities} entities"
+            )
+            start = end
+
+        if keep:
+            return
+        self.delete_archived(cutoff, days, now)
+
+    def archive_day(self, models, start, end):
+        """
+        Writes the logs of the day, one entity at a time
+        """
+        rows = (
+            Log.objects.between(start, end)
+            .order_by("entity_type_id", "entity_id", "created_at")
+            .values_list(
+                "entity_type_id",
+                "entity_id",
+                "created_at",
+                "status",
+                "response_time",
+                "message",
+            )
+        )
+        logs = entities = 0
+        for (entity_type_id, entity_id), group in itertools.groupby(
+            rows.iterator(chunk_size=10000), key=lambda row: row[:2]
+        ):
+            group = list(group)
+            write_day(
+                models[entity_type_id],
+                entity_id,
+                start.date(),
+                np.array([to_milliseconds(row[2]) for row in group], dtype=np.int64),
+                np.array([row[3] == "DOWN" for row in group], dtype=bool),
+                np.array(
+                    [np.nan if row[4] is None else float(row[4]) for row in group],
+                    dtype=np.float32,
+                ),
+                [row[5] for row in group],
+            )
+            logs += len(group)
+            entities += 1
+        return logs, entities
+
+    def delete_archived(self, cutoff, days, now):
+        """
+        Drops the archived partitions, deletes what's left before the cutoff and removes the archived logs from the index
+        """
+        table = Log._meta.db_table
+        if is_partitioned(table):
+            for name in drop_partitions(table, retention_days=days, now=now):
+                self.stdout.write(f"dropped {name}")
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {connection.ops.quote_name(table)} WHERE created_at < %s",
+                [cutoff],
+            )
+            self.stdout.write(f"deleted {cursor.rowcount} archived logs")
+        try:
+            LogDocument.search().filter(
+                "range", created_at={"lt": cutoff.isoformat()}
+            ).delete()
+        except ElasticsearchException as error:
+            self.stderr.write(f"archived logs left in the log index: {error}")
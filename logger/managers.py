@@ -53,3 +53,18 @@ class RequestsManager(models.Manager):
             credentials["token"] = encrypt(token)
 
         return super().create(**credentials)
+
+
+class LogManager(models.Manager):
+    """
+    Manager for the Log Class
+    """
+
+    def between(self, start, end=None):
+        """
+        Logs created in [start, end), the bounds let Postgres skip the partitions outside of them
+        """
+        queryset = self.get_queryset().filter(created_at__gte=start)
+        if end is not None:
+            queryset = queryset.filter(created_at__lt=end)
+        return queryset
@@ -0,0 +1,22 @@
+# Generated by Django 4.2.1 on 2026-10-18 18:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("logger", "0020_delete_events"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="cronhandler",
+            name="next_run_at",
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="endpoint",
+            name="next_run_at",
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.2.1 on 2026-10-18 18:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("logger", "0021_cronhandler_next_run_at_endpoint_next_run_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="endpoint",
+            name="max_body_size",
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="log",
+            name="downloaded_bytes",
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 4.2.1 on 2026-10-18 18:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("logger", "0022_endpoint_max_body_size_log_downloaded_bytes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="log",
+            name="connect_time",
+            field=models.DecimalField(
+                blank=True, decimal_places=4, max_digits=8, null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="log",
+            name="dns_time",
+            field=models.DecimalField(
+                blank=True, decimal_places=4, max_digits=8, null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="log",
+            name="tls_time",
+            field=models.DecimalField(
+                blank=True, decimal_places=4, max_digits=8, null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="log",
+            name="transfer_time",
+            field=models.DecimalField(
+                blank=True, decimal_places=4, max_digits=8, null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="log",
+            name="ttfb",
+            field=models.DecimalField(
+                blank=True, decimal_places=4, max_digits=8, null=True
+            ),
+        ),
+    ]
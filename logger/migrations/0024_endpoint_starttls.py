@@ -0,0 +1,17 @@
+# Generated by Django 4.2.1 on 2026-10-18 18:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("logger", "0023_log_connect_time_log_dns_time_log_tls_time_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="endpoint",
+            name="starttls",
+            field=models.BooleanField(default=False),
+        ),
+    ]
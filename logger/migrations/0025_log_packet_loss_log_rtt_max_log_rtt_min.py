@@ -0,0 +1,33 @@
+# Generated by Django 4.2.1 on 2026-10-18 18:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("logger", "0024_endpoint_starttls"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="log",
+            name="packet_loss",
+            field=models.DecimalField(
+                blank=True, decimal_places=2, max_digits=5, null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="log",
+            name="rtt_max",
+            field=models.DecimalField(
+                blank=True, decimal_places=4, max_digits=8, null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="log",
+            name="rtt_min",
+            field=models.DecimalField(
+                blank=True, decimal_places=4, max_digits=8, null=True
+            ),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.1 on 2026-10-18 18:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("logger", "0025_log_packet_loss_log_rtt_max_log_rtt_min"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="log",
+            name="wait_time",
+            field=models.DecimalField(
+                blank=True, decimal_places=4, max_digits=8, null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="requesthandler",
+            name="max_concurrency",
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="requesthandler",
+            name="max_rate",
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
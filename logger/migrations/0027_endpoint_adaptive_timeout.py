@@ -0,0 +1,17 @@
+# Generated by Django 4.2.1 on 2026-10-18 18:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("logger", "0026_log_wait_time_requesthandler_max_concurrency_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="endpoint",
+            name="adaptive_timeout",
+            field=models.BooleanField(default=False),
+        ),
+    ]
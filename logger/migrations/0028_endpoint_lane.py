@@ -0,0 +1,21 @@
+# Generated by Django 4.2.1 on 2026-10-18 18:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("logger", "0027_endpoint_adaptive_timeout"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="endpoint",
+            name="lane",
+            field=models.CharField(
+                choices=[("fast", "Fast lane"), ("slow", "Slow lane")],
+                default="fast",
+                max_length=4,
+            ),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.1 on 2026-10-18 18:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("logger", "0028_endpoint_lane"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="log",
+            name="region",
+            field=models.CharField(
+                blank=True,
+                choices=[
+                    ("us", "United States"),
+                    ("eu", "Europe"),
+                    ("au", "Australia"),
+                    ("sn", "Singapore"),
+                ],
+                max_length=2,
+                null=True,
+            ),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.1 on 2026-10-18 18:32
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("logger", "0029_log_region"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="log",
+            name="created_at",
+            field=models.DateTimeField(
+                db_index=True, default=django.utils.timezone.now
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="log",
+            index=models.Index(
+                fields=["entity_type", "entity_id", "created_at"],
+                name="logger_log_entity_created",
+            ),
+        ),
+    ]
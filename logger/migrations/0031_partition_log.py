@@ -0,0 +1,116 @@
+from django.db import migrations
+
+TABLE = "logger_log"
+OLD_TABLE = "logger_log_unpartitioned"
+
+
+def get_definitions(cursor, table):
+    """
+    Returns the indexes and foreign keys of the table, besides its primary key
+    """
+    cursor.execute(
+        """
+        SELECT indexname, indexdef FROM pg_indexes
+        WHERE tablename = %s AND indexname NOT IN (
+            SELECT conname FROM pg_constraint WHERE conrelid = to_regclass(%s) AND contype = 'p'
+        )
+        """,
+        [table, table],
+    )
+    indexes = cursor.fetchall()
+    cursor.execute(
+        """
+        SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint
+        WHERE conrelid = to_regclass(%s) AND contype = 'f'
+        """,
+        [table],
+    )
+    return indexes, cursor.fetchall()
+
+
+def swap_table(cursor, create):
+    """
+    Moves the rows of the log table into a new table built by create, keeping its indexes, foreign keys and ids
+    """
+    indexes, foreign_keys = get_definitions(cursor, TABLE)
+    cursor.execute(f"ALTER TABLE {TABLE} RENAME TO {OLD_TABLE}")
+    cursor.execute(f"SELECT pg_get_serial_sequence('{OLD_TABLE}', 'id')")
+    sequence = cursor.fetchone()[0]
+    # names are reused by the new table
+    cursor.execute(
+        f"ALTER TABLE {OLD_TABLE} RENAME CONSTRAINT {TABLE}_pkey TO {OLD_TABLE}_pkey"
+    )
+    for name, _ in foreign_keys:
+        cursor.execute(f'ALTER TABLE {OLD_TABLE} DROP CONSTRAINT "{name}"')
+    for name, _ in indexes:
+        cursor.execute(f'DROP INDEX "{name}"')
+
+    create(cursor)
+    cursor.execute(f"INSERT INTO {TABLE} SELECT * FROM {OLD_TABLE}")
+    for name, definition in indexes:
+        cursor.execute(definition)
+    for name, definition in foreign_keys:
+        cursor.execute(f'ALTER TABLE {TABLE} ADD CONSTRAINT "{name}" {definition}')
+    cursor.execute(
+        f"SELECT setval(pg_get_serial_sequence('{TABLE}', 'id'), COALESCE(MAX(id), 1)) FROM {TABLE}"
+    )
+    cursor.execute(f"SELECT pg_get_serial_sequence('{TABLE}', 'id')")
+    new_sequence = cursor.fetchone()[0]
+    cursor.execute(f"DROP TABLE {OLD_TABLE}")
+    # the sequence of the new table got a suffixed name while the old one existed
+    if new_sequence != sequence:
+        cursor.execute(
+            f"ALTER SEQUENCE {new_sequence} RENAME TO {sequence.split('.')[-1]}"
+        )
+
+
+def partition(apps, schema_editor):
+    """
+    Turns the log table into a table partitioned by created_at
+    The primary key has to include the partition key, rows outside of every partition land in the default one
+    """
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    from util.partition_util import create_partitions
+
+    def create(cursor):
+        cursor.execute(
+            f"""
+            CREATE TABLE {TABLE} (LIKE {OLD_TABLE} INCLUDING DEFAULTS INCLUDING IDENTITY INCLUDING CONSTRAINTS)
+            PARTITION BY RANGE (created_at)
+            """
+        )
+        cursor.execute(f"ALTER TABLE {TABLE} ADD PRIMARY KEY (id, created_at)")
+        cursor.execute(f"CREATE TABLE {TABLE}_default PARTITION OF {TABLE} DEFAULT")
+        # partitions holding the existing rows, which are still in the old table
+        cursor.execute(f"SELECT MIN(created_at) FROM {OLD_TABLE}")
+        create_partitions(TABLE, start=cursor.fetchone()[0])
+
+    with schema_editor.connection.cursor() as cursor:
+        swap_table(cursor, create)
+
+
+def unpartition(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+
+    def create(cursor):
+        cursor.execute(
+            f"""
+            CREATE TABLE {TABLE} (LIKE {OLD_TABLE} INCLUDING DEFAULTS INCLUDING IDENTITY INCLUDING CONSTRAINTS)
+            """
+        )
+        cursor.execute(f"ALTER TABLE {TABLE} ADD PRIMARY KEY (id)")
+
+    with schema_editor.connection.cursor() as cursor:
+        swap_table(cursor, create)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("logger", "0030_log_created_at"),
+    ]
+
+    operations = [
+        migrations.RunPython(partition, unpartition),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 4.2.1 on 2026-10-18 18:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("logger", "0031_partition_log"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Rollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "entity",
+                    models.CharField(
+                        choices=[("endpoint", "Endpoint"), ("service", "Service")],
+                        max_length=8,
+                    ),
+                ),
+                ("entity_id", models.PositiveIntegerField()),
+                (
+                    "grain",
+                    models.CharField(
+                        choices=[
+                            ("minute", "Minute"),
+                            ("hour", "Hour"),
+                            ("day", "Day"),
+                        ],
+                        max_length=6,
+                    ),
+                ),
+                ("bucket", models.DateTimeField()),
+                ("count", models.PositiveIntegerField(default=0)),
+                ("up_count", models.PositiveIntegerField(default=0)),
+                ("down_count", models.PositiveIntegerField(default=0)),
+                ("min_response_time", models.FloatField(blank=True, null=True)),
+                ("max_response_time", models.FloatField(blank=True, null=True)),
+                ("mean_response_time", models.FloatField(blank=True, null=True)),
+                ("p50_response_time", models.FloatField(blank=True, null=True)),
+                ("p95_response_time", models.FloatField(blank=True, null=True)),
+                ("p99_response_time", models.FloatField(blank=True, null=True)),
+                ("sum_response_time", models.FloatField(default=0)),
+                ("histogram", models.JSONField(default=dict)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="rollup",
+            constraint=models.UniqueConstraint(
+                fields=("entity", "entity_id", "grain", "bucket"),
+                name="logger_rollup_unique_bucket",
+            ),
+        ),
+    ]
@@ -0,0 +1,26 @@
+import datetime
+from django.db import migrations
+from django.utils import timezone
+
+
+def backfill(apps, schema_editor):
+    """
+    Crons created before next_run_at existed are only checked once they have a deadline
+    They get a full period from now, like a new cron
+    """
+    CronHandler = apps.get_model("logger", "CronHandler")
+    now = timezone.now()
+    crons = list(CronHandler.objects.filter(next_run_at__isnull=True))
+    for cron in crons:
+        cron.next_run_at = now + datetime.timedelta(seconds=cron.period)
+    CronHandler.objects.bulk_update(crons, ["next_run_at"], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("logger", "0032_rollup"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.2.1 on 2026-10-18 19:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("logger", "0033_backfill_cronhandler_next_run_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="incident",
+            name="cause",
+            field=models.CharField(
+                choices=[
+                    ("outage", "Outage"),
+                    ("expiry", "Certificate or domain expiry"),
+                ],
+                default="outage",
+                max_length=20,
+            ),
+        ),
+    ]
@@ -1,19 +1,20 @@
 from uuid import uuid4
+from datetime import timedelta
 from django.db import models
+from django.utils import timezone
 from django.core.validators import MinValueValidator
 from django.core.exceptions import ValidationError
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.contenttypes.fields import GenericForeignKey
 from users.models import User, Guest, Team
 from incident.models import EscalationPolicy, OnCallCalendar
-from .managers import RequestsManager, CronManager
+from .managers import RequestsManager, CronManager, LogManager
 
 # from incident.models import Incident
 
 # from util.logger_util import generate_token
 # TODO: figure out M2M fields between Service and Endpoint
 # TODO: figure out a way to share Endpoints across clients
-# TODO: try to share the results instead
 # TODO: pause incident generation during maintance window
 
 
@@ -119,6 +120,16 @@ class Incident(models.Model):
             ("Resolved", "Resolved"),
         ],
     )
+    # what raised the incident, incidents are deduplicated and resolved per cause
+    # an outage recovering doesn't resolve an expiring certificate or domain
+    cause = models.CharField(
+        max_length=20,
+        choices=[
+            ("outage", "Outage"),
+            ("expiry", "Certificate or domain expiry"),
+        ],
+        default="outage",
+    )
     source = models.ImageField(
         upload_to=f"media/archive/",
         help_text="store the image of the resource",
@@ -189,6 +200,11 @@ class RequestHandler(models.Model):
     log_screen = models.BooleanField(default=False)
     # Should we verify SSL certificate validity
     verify_ssl = models.BooleanField(default=False)
+    # Politeness towards the host, falls back to ORIGIN_CONCURRENCY and ORIGIN_RATE. 0 disables the limit.
+    # The strictest limits among the endpoints sharing a host apply.
+    max_concurrency = models.PositiveIntegerField(null=True, blank=True)
+    # requests per second
+    max_rate = models.PositiveIntegerField(null=True, blank=True)
     is_active = models.BooleanField(default=True)
 
     objects = RequestsManager()
@@ -260,6 +276,18 @@ class Endpoint(models.Model):
         (300, "confirm after 300 seconds"),
     ]
 
+    REGION_CHOICES = [
+        ("us", "United States"),
+        ("eu", "Europe"),
+        ("au", "Australia"),
+        ("sn", "Singapore"),
+    ]
+
+    LANE_CHOICES = [
+        ("fast", "Fast lane"),
+        ("slow", "Slow lane"),
+    ]
+
     RECOVERY_CHOICES = [
         (0, "recover immediately"),
         (60, "recover after 1 minute"),
@@ -282,6 +310,8 @@ class Endpoint(models.Model):
     # Required if monitor_type is set to tcp, udp, smtp, pop, or imap.
     # tcp and udp monitors accept any ports, while smtp, pop, and imap accept only the specified ports corresponding with their servers (e.g. 25,465,587 for smtp).
     port = models.CharField(max_length=255, null=True, blank=True)
+    # smtp, pop, and imap monitors upgrade the connection through STARTTLS after the greeting, implicit TLS ports are always encrypted.
+    starttls = models.BooleanField(default=False)
 
     # notification perferences
     # NOT LONGER Needed, On-Call person would be notified based on their preference
@@ -295,6 +325,8 @@ class Endpoint(models.Model):
         default=180,
         choices=FREQUENCY_CHOICES,
     )
+    # when the next check is due, maintained by the scheduler
+    next_run_at = models.DateTimeField(null=True, blank=True, db_index=True)
 
     # holds the request body
     request_handler = models.ForeignKey(
@@ -302,6 +334,10 @@ class Endpoint(models.Model):
     )
     # check frequency must never be set to a shorter amount of time than the Request timeout period
     timeout = models.PositiveIntegerField(default=30, choices=TIMEOUT_CHOICES)
+    # probe lane, endpoints which are slow or time out too often are isolated in the slow lane, maintained by the probes
+    lane = models.CharField(max_length=4, choices=LANE_CHOICES, default="fast")
+    # give up once the request is clearly slower than usual and confirm with a retry, the timeout above stays the limit
+    adaptive_timeout = models.BooleanField(default=False)
 
     # logging configuration
     # how long we wait after observing a failure before we start a new incident.
@@ -322,6 +358,8 @@ class Endpoint(models.Model):
 
     # regex pattern for keyword and status code search
     regex = models.CharField(max_length=255)
+    # cap on the bytes downloaded by keyword monitors, falls back to PROBE_MAX_BODY_SIZE
+    max_body_size = models.PositiveIntegerField(null=True, blank=True)
 
     # How many days before the ssl expires/domain expires do you want to be alerted? Valid values are 1, 2, 3, 7, 14, 30, and 60.
     domain_expiration = models.PositiveIntegerField(
@@ -346,6 +384,15 @@ class Endpoint(models.Model):
     # collections relations
     service = models.ManyToManyField(Service, related_name="endpoints")
 
+    @property
+    def regions(self):
+        """
+        Returns the regions the endpoint is probed from
+        """
+        return [
+            region for region, _ in self.REGION_CHOICES if getattr(self, f"is_{region}")
+        ]
+
     def __str__(self):
         return str(self.id)
 
@@ -386,6 +433,9 @@ class CronHandler(models.Model):
         ],
         default=30,
     )
+    # deadline for the next heartbeat, pushed forward whenever a heartbeat arrives
+    next_run_at = models.DateTimeField(null=True, blank=True, db_index=True)
+
     # Recommend setting this to approx. 20% of period
     # Threshold for accepting delay Minimum value: 0 seconds
 
@@ -415,6 +465,7 @@ class CronHandler(models.Model):
             # This code only happens if the objects is not in the database yet.
             # Otherwise it would have pk
             self.token = str(uuid4())
+            self.next_run_at = timezone.now() + timedelta(seconds=self.period)
         super(CronHandler, self).save(*args, **kwargs)
 
     def __str__(self):
@@ -450,11 +501,43 @@ class Log(models.Model):
     )
 
     status = models.CharField(max_length=4, choices=STATUS_CHOICES, default="UP")
+    # partition key of the table, bound queries by it so they only scan the relevant partitions
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
     response_time = models.DecimalField(
         null=True, blank=True, decimal_places=4, max_digits=8
     )
+    # breakdown of the response time, reused connections skip dns, connect and tls
+    dns_time = models.DecimalField(
+        null=True, blank=True, decimal_places=4, max_digits=8
+    )
+    connect_time = models.DecimalField(
+        null=True, blank=True, decimal_places=4, max_digits=8
+    )
+    tls_time = models.DecimalField(
+        null=True, blank=True, decimal_places=4, max_digits=8
+    )
+    ttfb = models.DecimalField(null=True, blank=True, decimal_places=4, max_digits=8)
+    transfer_time = models.DecimalField(
+        null=True, blank=True, decimal_places=4, max_digits=8
+    )
+    # region the probe ran from, compare latency across regions
+    region = models.CharField(
+        max_length=2, choices=Endpoint.REGION_CHOICES, null=True, blank=True
+    )
+    # time spent waiting on the concurrency and rate limits, not part of the response time
+    wait_time = models.DecimalField(
+        null=True, blank=True, decimal_places=4, max_digits=8
+    )
     message = models.TextField(null=True, blank=True)
     response_body = models.TextField(null=True, blank=True)
+    # bytes of the response body actually downloaded
+    downloaded_bytes = models.PositiveIntegerField(null=True, blank=True)
+    # ping monitors, response_time holds the average round trip
+    rtt_min = models.DecimalField(null=True, blank=True, decimal_places=4, max_digits=8)
+    rtt_max = models.DecimalField(null=True, blank=True, decimal_places=4, max_digits=8)
+    packet_loss = models.DecimalField(
+        null=True, blank=True, decimal_places=2, max_digits=5
+    )
     # pointless, since we bound incident to service
     # incident = models.ForeignKey(
     #     Incident,
@@ -499,5 +582,64 @@ class Log(models.Model):
     # TODO: Implement screenshot support
     # screenshot = models.ImageField()
 
+    objects = LogManager()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["entity_type", "entity_id", "created_at"],
+                name="logger_log_entity_created",
+            )
+        ]
+
     def __str__(self):
         return self.status
+
+
+class Rollup(models.Model):
+    """
+    Probe results of an endpoint or a service aggregated per minute, hour or day
+    Maintained as the logs are written, read these instead of scanning the logs
+    """
+
+    ENTITY_CHOICES = [
+        ("endpoint", "Endpoint"),
+        ("service", "Service"),
+    ]
+
+    GRAIN_CHOICES = [
+        ("minute", "Minute"),
+        ("hour", "Hour"),
+        ("day", "Day"),
+    ]
+
+    entity = models.CharField(max_length=8, choices=ENTITY_CHOICES)
+    entity_id = models.PositiveIntegerField()
+    grain = models.CharField(max_length=6, choices=GRAIN_CHOICES)
+    # start of the minute, hour or day
+    bucket = models.DateTimeField()
+
+    count = models.PositiveIntegerField(default=0)
+    up_count = models.PositiveIntegerField(default=0)
+    down_count = models.PositiveIntegerField(default=0)
+    # response times in seconds, of the probes which were UP
+    min_response_time = models.FloatField(null=True, blank=True)
+    max_response_time = models.FloatField(null=True, blank=True)
+    mean_response_time = models.FloatField(null=True, blank=True)
+    p50_response_time = models.FloatField(null=True, blank=True)
+    p95_response_time = models.FloatField(null=True, blank=True)
+    p99_response_time = models.FloatField(null=True, blank=True)
+    # running sum and log-scale histogram of the response times, what the mean and percentiles are merged from
+    sum_response_time = models.FloatField(default=0)
+    histogram = models.JSONField(default=dict)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["entity", "entity_id", "grain", "bucket"],
+                name="logger_rollup_unique_bucket",
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.entity} {self.entity_id} {self.grain} {self.bucket}"
@@ -6,6 +6,7 @@ from .models import (
     CronHandler,
     Incident,
     Log,
+    Rollup,
     MaintainancePolicy,
     RequestHandler,
     Service,
@@ -53,7 +54,7 @@ class EndpointSerializer(serializers.ModelSerializer):
                 return ValidationError("Invalid port")
             elif type == "pop" and port not in [110, 995]:
                 return ValidationError("Invalid port")
-            elif type == "imap" and port not in [110, 143]:
+            elif type == "imap" and port not in [110, 143, 993]:
                 return ValidationError("Invalid port")
 
         timeout = attrs.get("timeout", None)
@@ -104,3 +105,9 @@ class MaintainanceWindowSerializer(serializers.ModelSerializer):
     class Meta:
         model = MaintainancePolicy
         fields = "__all__"
+
+
+class RollupSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Rollup
+        exclude = ["histogram", "sum_response_time"]
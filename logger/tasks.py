@@ -1,20 +1,54 @@
-import re
 import os
+import time
+import logging
+import traceback
+import datetime
 import requests
+from celery import chord
 from core.celery import app
 from django.core.mail import send_mail
 from django.contrib.contenttypes.models import ContentType
+from django.db import transaction, DatabaseError
+from django.db.models import F, Q, Prefetch
+from django.utils import timezone
 from twilio.rest import Client
 from django.conf import settings
 from uuid import uuid4
 from urllib.parse import urlencode
 from django_elasticsearch_dsl.registries import registry
+from elasticsearch.exceptions import ElasticsearchException
 from incident.models import EscalationLevelAssignment, Webhook
-from logger.models import Endpoint, Service, Log, Incident
-from incident.tasks import create_incident
+from logger.models import Endpoint, CronHandler, Service, Log, Incident
+from incident.tasks import create_incident, dispatch_incidents
 from django.template.loader import render_to_string
 from users.models import UserGroups, User
-from users.tasks import notify_user
+
+# users.tasks imports this module too, names are looked up when the tasks run
+from users import tasks as user_tasks
+from util.probe_util import process_endpoints
+from util.pool_util import session_pool
+from util.match_util import search, stream_search
+from util.metrics_util import record_probes, record_match_times
+from util.schedule_util import get_next_run
+from util.queue_util import get_queue
+from util.ingest_util import LogWriter
+from util.partition_util import is_partitioned, create_partitions, drop_partitions
+from util.rollup_util import update_rollups, prune_rollups
+from util.recheck_util import plan_rechecks, get_recheck_delay
+from util.latency_util import (
+    get_samples,
+    record_samples,
+    get_adaptive_timeout,
+    get_lane,
+)
+from util.expiry_util import (
+    get_tls_address,
+    get_certificate_expiry,
+    get_domain_expiry,
+    get_days_left,
+    claim_check,
+    retry_check,
+)
 
 # disable SSL warnings: handshakes are computationally expensive, could drop that overhead
 requests.urllib3.disable_warnings()
@@ -59,6 +93,28 @@ def update_index(instances):
         registry.update(_instance)
 
 
+def on_logs_written(instances):
+    """
+    Called by the log writer with every batch it wrote : rolls the endpoint logs up and updates the log index
+    The logs are already saved, a failing rollup or index update is logged instead of failing the batch
+    """
+    endpoint_type = ContentType.objects.get_for_model(Endpoint)
+    logs = [log for log in instances if log.entity_type_id == endpoint_type.pk]
+    try:
+        services = {}
+        for endpoint_id, service_id in Endpoint.service.through.objects.filter(
+            endpoint_id__in={log.entity_id for log in logs}
+        ).values_list("endpoint_id", "service_id"):
+            services.setdefault(endpoint_id, []).append(service_id)
+        update_rollups(logs, services)
+    except DatabaseError:
+        logging.getLogger("error_logger").error(traceback.format_exc())
+    try:
+        update_index(instances)
+    except ElasticsearchException:
+        logging.getLogger("error_logger").error(traceback.format_exc())
+
+
 @app.task
 def add_screenshot_to_log(incident_id, url):
     """
@@ -92,6 +148,8 @@ def process_endpoint(endpoint):
     message = ""
     context = {}
     response = None
+    reused = False
+    downloaded = 0
     try:
         headers = (
             {
@@ -112,25 +170,31 @@ def process_endpoint(endpoint):
             else None
         )
 
-        response = requests.request(
+        response, reused = session_pool.request(
             method=endpoint.request_handler.method,
             url=endpoint.url,
+            verify_ssl=endpoint.request_handler.verify_ssl,
             headers=headers,
             data=body,
             auth=auth,
             timeout=endpoint.timeout,
-            verify=endpoint.request_handler.verify_ssl,
         )
 
         response_time = response.elapsed.total_seconds()
 
-        regex = endpoint.regex
-
-        match = (
-            re.search(regex, str(response.status_code))
-            if endpoint.logger_type == "status"
-            else re.search(regex, str(response.content))
-        )
+        if endpoint.logger_type == "status":
+            match = search(endpoint.regex, str(response.status_code))
+            # drain the body, so the connection goes back to the pool
+            downloaded = len(response.content)
+        else:
+            # stop downloading as soon as the keyword shows up
+            match, downloaded, _ = stream_search(
+                endpoint.regex,
+                response.iter_content(settings.PROBE_CHUNK_SIZE),
+                response.encoding,
+                endpoint.max_body_size,
+            )
+        response.close()
 
         message = "Request sent successfully."
 
@@ -155,6 +219,8 @@ def process_endpoint(endpoint):
             "response_time": response_time,
             "status": "UP" if match else "DOWN",
             "message": message,
+            "reused": reused,
+            "downloaded_bytes": downloaded,
         }
 
         if not match:
@@ -165,39 +231,327 @@ def process_endpoint(endpoint):
 
 
 @app.task
-def prepare_logs(frequency=180):
+def schedule_probes():
     """
-    Optimized : Prepares all the endpoints which have the given frequency
+    Claims the endpoints due within the next tick and the crons past their heartbeat deadline
+    Rows are claimed in batches with SELECT ... FOR UPDATE SKIP LOCKED, so several schedulers can run side by side
     """
-    services = Service.objects.filter(is_active=True)
+    now = timezone.now()
+    horizon = now + datetime.timedelta(seconds=settings.SCHEDULER_TICK)
+    batch_size = settings.SCHEDULER_BATCH_SIZE
+
+    # endpoints are shared across services, probe each one once and share the result
+    active_endpoints = Endpoint.objects.filter(service__is_active=True).values("id")
+    while True:
+        with transaction.atomic():
+            endpoints = list(
+                Endpoint.objects.select_for_update(skip_locked=True)
+                .filter(
+                    Q(next_run_at__lte=horizon) | Q(next_run_at__isnull=True),
+                    id__in=active_endpoints,
+                )
+                .order_by(F("next_run_at").asc(nulls_first=True))
+                .only(
+                    "id",
+                    "check_frequency",
+                    "next_run_at",
+                    "lane",
+                    "is_us",
+                    "is_eu",
+                    "is_au",
+                    "is_sn",
+                )[:batch_size]
+            )
+            due = [
+                (
+                    endpoint.id,
+                    endpoint.next_run_at or now,
+                    endpoint.lane,
+                    endpoint.regions or [settings.DEFAULT_REGION],
+                )
+                for endpoint in endpoints
+            ]
+            for endpoint in endpoints:
+                endpoint.next_run_at = get_next_run(
+                    endpoint.id, endpoint.check_frequency, horizon
+                )
+            Endpoint.objects.bulk_update(endpoints, ["next_run_at"])
+        dispatch_probes(due, now)
+        if len(endpoints) < batch_size:
+            break
+
+    active_crons = CronHandler.objects.filter(service__is_active=True).values("id")
+    while True:
+        with transaction.atomic():
+            crons = list(
+                CronHandler.objects.select_for_update(skip_locked=True)
+                .filter(next_run_at__lte=now, id__in=active_crons)
+                .order_by("next_run_at")
+                .only("id", "period", "next_run_at")[:batch_size]
+            )
+            for cron in crons:
+                cron.next_run_at = now + datetime.timedelta(seconds=cron.period)
+            CronHandler.objects.bulk_update(crons, ["next_run_at"])
+        if crons:
+            process_crons.delay([cron.id for cron in crons])
+        if len(crons) < batch_size:
+            break
 
-    # Instead of creating each Log instance individually in a loop, can use the bulk_create() method to create multiple instances in a single database query
-    log_instances = []
-    for service in services:
-        for endpoint in service.endpoints.filter(check_frequency=frequency):
+
+def dispatch_probes(due, now):
+    """
+    Splits the claimed endpoints into shards, each shard is released at its due time
+    Every region an endpoint enables probes it, from the region's own queues
+    Slow lane endpoints get their own shards, queue and chord, so they don't hold up the rest
+    The chord callback writes the logs of the batch
+    """
+    due.sort(key=lambda item: item[1])
+    for region, _ in Endpoint.REGION_CHOICES:
+        for lane, shard_size, queue in [
+            ("fast", settings.PROBE_SHARD_SIZE, settings.PROBE_QUEUE),
+            ("slow", settings.SLOW_LANE_SHARD_SIZE, settings.SLOW_LANE_QUEUE),
+        ]:
+            lane_due = [item for item in due if item[2] == lane and region in item[3]]
+            if not lane_due:
+                continue
+            shards = []
+            for i in range(0, len(lane_due), shard_size):
+                shard = lane_due[i : i + shard_size]
+                countdown = max(0, (shard[0][1] - now).total_seconds())
+                shards.append(
+                    probe_shard.s(
+                        [endpoint_id for endpoint_id, _, _, _ in shard], lane, region
+                    ).set(countdown=countdown, queue=get_queue(queue, region))
+                )
+            chord(shards)(write_logs.s())
+
+
+@app.task
+def probe_shard(endpoint_ids, lane="fast", region=None, recheck=None):
+    """
+    Probes a shard of endpoints concurrently
+    Moves the endpoints whose recent latency no longer fits the lane to the other one
+    Returns the results tagged with the endpoint, its active services and the region
+    recheck is the number of the re-check when the shard probes endpoints ahead of their schedule
+    """
+    endpoints = (
+        Endpoint.objects.filter(id__in=endpoint_ids)
+        .select_related("request_handler")
+        .prefetch_related(
+            Prefetch(
+                "service",
+                queryset=Service.objects.filter(is_active=True),
+                to_attr="active_services",
+            )
+        )
+    )
+
+    samples = get_samples([endpoint.pk for endpoint in endpoints], region)
+    timeouts = {
+        endpoint.pk: get_adaptive_timeout(samples[endpoint.pk], endpoint.timeout)
+        for endpoint in endpoints
+        if endpoint.adaptive_timeout and endpoint.logger_type != "ping"
+    }
+
+    # probe the entire shard concurrently, instead of one endpoint at a time
+    record_probes(len(endpoint_ids))
+    results = process_endpoints(
+        endpoints,
+        concurrency=settings.SLOW_LANE_CONCURRENCY if lane == "slow" else None,
+        timeouts=timeouts,
+    )
+
+    for endpoint, result in zip(endpoints, results):
+        result["endpoint_id"] = endpoint.pk
+        result["service_ids"] = [service.id for service in endpoint.active_services]
+        result["confirmation_period"] = endpoint.confirmation_period
+        result["recovery_period"] = endpoint.recovery_period
+        result["region"] = region
+        result["check_frequency"] = endpoint.check_frequency
+        result["recheck"] = recheck
+    record_samples(results, samples)
+    moved = []
+    for endpoint in endpoints:
+        # the lane is shared by every region, only the endpoint's first region moves it
+        if region and region != (endpoint.regions or [settings.DEFAULT_REGION])[0]:
+            continue
+        next_lane = get_lane(samples[endpoint.pk], endpoint.lane)
+        if next_lane != endpoint.lane:
+            endpoint.lane = next_lane
+            moved.append(endpoint)
+    Endpoint.objects.bulk_update(moved, ["lane"])
+    record_match_times(
+        {
+            result["endpoint_id"]: result["match_time"]
+            for result in results
+            if result.get("match_time") is not None
+        }
+    )
+    return results
+
+
+@app.task
+def write_logs(shard_results):
+    """
+    Chord callback : Writes the logs of every shard and updates the log index once they're written
+    Incidents are opened and resolved on state transitions, not on every DOWN result
+    """
+    # rows are streamed to the database in batches instead of one INSERT per log
+    writer = LogWriter(Log, on_flush=on_logs_written)
+    entity_type = ContentType.objects.get_for_model(Endpoint)
+    all_results = []
+    for results in shard_results:
+        for result in results:
             # TODO: decouple request queue for longer timeouts etc.
-            # TODO: figure out a fix, some queues could be overwhelmed by request volume
-            # TODO: automatically resolve incidents after a given recovery period
-            result = process_endpoint(endpoint)
-            status = result.get("status", "UP")
-            if status == "DOWN":
-                # create new incident
-                create_incident.delay(service_id=service.id)
-            log = Log(
+            all_results.append(result)
+            writer.add(
                 response_time=result.get("response_time", 0),
-                status=status,
+                dns_time=result.get("dns_time"),
+                connect_time=result.get("connect_time"),
+                tls_time=result.get("tls_time"),
+                ttfb=result.get("ttfb"),
+                transfer_time=result.get("transfer_time"),
+                wait_time=result.get("wait_time"),
+                region=result.get("region"),
+                status=result.get("status", "UP"),
                 message=result.get("message"),
-                entity_type=ContentType.objects.get_for_model(Endpoint),
-                entity_id=endpoint.pk,
+                response_body=result.get("response_body"),
+                downloaded_bytes=result.get("downloaded_bytes"),
+                rtt_min=result.get("rtt_min"),
+                rtt_max=result.get("rtt_max"),
+                packet_loss=result.get("packet_loss"),
+                entity_type_id=entity_type.pk,
+                entity_id=result["endpoint_id"],
             )
-            response_body = result.get("response_body", None)
-            if response_body is not None:
-                log.response_body = response_body
-            log_instances.append(log)
-    created_instances = Log.objects.bulk_create(log_instances)
-    # TODO: update log index after bulk creation
+
+    # confirmation and recovery periods are tracked per endpoint, an outage spans every endpoint of the service
+    # alerting comes first, it doesn't wait on the log table or the log index
+    dispatch_incidents(all_results)
+    dispatch_rechecks(all_results)
+
+    # the chord is acked once this returns, nothing is kept in the worker
     # TODO: reduce the overhead of updating log index, try async
+    writer.flush()
+
+
+def dispatch_rechecks(results):
+    """
+    Probes the endpoints which aren't UP again ahead of their schedule, from the high priority queue
+    Re-checks back off until the endpoint is UP or steadily DOWN, confirming and resolving outages sooner
+    """
+    planned = plan_rechecks(results, int(time.time()))
+    for (region, attempt), endpoint_ids in planned.items():
+        region = region or settings.DEFAULT_REGION
+        chord(
+            [
+                probe_shard.s(endpoint_ids, "fast", region, attempt).set(
+                    countdown=get_recheck_delay(attempt),
+                    queue=get_queue(settings.RECHECK_QUEUE, region),
+                )
+            ]
+        )(write_logs.s())
+
+
+@app.task
+def process_crons(cron_ids):
+    """
+    Logs a missed heartbeat for every cron whose deadline has passed
+    An incident is opened once the heartbeat has been missing for the confirmation period, once per outage
+    """
+    crons = CronHandler.objects.filter(id__in=cron_ids).prefetch_related(
+        Prefetch(
+            "service",
+            queryset=Service.objects.filter(is_active=True),
+            to_attr="active_services",
+        )
+    )
+    entity_type = ContentType.objects.get_for_model(CronHandler)
+    log_instances = []
+    results = []
+    for cron in crons:
+        results.append(
+            {
+                "cron_id": cron.pk,
+                "status": "DOWN",
+                "service_ids": [service.id for service in cron.active_services],
+                "confirmation_period": cron.confirmation_period,
+            }
+        )
+        log_instances.append(
+            Log(
+                status="DOWN",
+                message="Heartbeat missed.",
+                entity_type=entity_type,
+                entity_id=cron.pk,
+            )
+        )
+    created_instances = Log.objects.bulk_create(log_instances)
     update_index(created_instances)
+    dispatch_incidents(results)
+
+
+@app.task
+def check_expirations():
+    """
+    Dispatches an expiry check for every distinct host which wasn't checked within EXPIRY_CACHE_TTL
+    Runs on its own schedule, the probe path isn't involved
+    """
+    endpoints = (
+        Endpoint.objects.filter(service__is_active=True)
+        .values_list("url", "port", "logger_type")
+        .distinct()
+    )
+    addresses = {
+        get_tls_address(url, port, logger_type)
+        for url, port, logger_type in endpoints.iterator()
+    }
+    for host, port in addresses:
+        if host and claim_check(host, port):
+            check_host_expiry.delay(host, port)
+
+
+@app.task
+def check_host_expiry(host, port=None):
+    """
+    Fetches the certificate and domain expiry of the host, shared by every endpoint on it
+    Raises an expiry incident for the services whose endpoints expire within their configured window
+    Expiry incidents are kept apart from outages, a recovery doesn't resolve them
+    """
+    ssl_expiry = get_certificate_expiry(host, port) if port else None
+    domain_expiry = get_domain_expiry(host)
+    if ssl_expiry is False or domain_expiry is False:
+        # a lookup failed, check the host again once the failure can be retried
+        retry_check(host, port)
+    ssl_days = get_days_left(ssl_expiry)
+    domain_days = get_days_left(domain_expiry)
+    if ssl_days is None and domain_days is None:
+        return
+
+    endpoints = (
+        Endpoint.objects.filter(service__is_active=True, url__icontains=host)
+        .distinct()
+        .prefetch_related(
+            Prefetch(
+                "service",
+                queryset=Service.objects.filter(is_active=True),
+                to_attr="active_services",
+            )
+        )
+    )
+    service_ids = set()
+    for endpoint in endpoints:
+        if get_tls_address(endpoint.url, endpoint.port, endpoint.logger_type) != (
+            host,
+            port,
+        ):
+            continue
+        if (ssl_days is not None and ssl_days <= endpoint.ssl_expiration) or (
+            domain_days is not None and domain_days <= endpoint.domain_expiration
+        ):
+            service_ids.update(service.id for service in endpoint.active_services)
+
+    for service_id in service_ids:
+        create_incident.delay(service_id=service_id, cause="expiry")
 
 
 @app.task
@@ -281,7 +635,7 @@ def notify_user_groups(
 ):
     user_group = UserGroups.objects.get(id=user_group_id)
     for user in user_group.users.all():
-        notify_user(
+        user_tasks.notify_user(
             user_id=user.id,
             team_id=team_id,
             incident_id=incident_id,
@@ -303,7 +657,7 @@ def escalate_incident(incident_id, priority):
         entity_type = action.entity_type
 
         if entity_type == ContentType.objects.get_for_model(User):
-            notify_user(
+            user_tasks.notify_user(
                 user_id=entity_id,
                 team_id=service.team.id,
                 incident_id=incident_id,
@@ -325,3 +679,24 @@ def escalate_incident(incident_id, priority):
 
     incident.escalation_level += 1
     incident.save()
+
+
+@app.task
+def manage_log_partitions():
+    """
+    Creates the log partitions ahead of time and drops the ones past the retention period
+    Does nothing unless the log table is partitioned, i.e. on Postgres
+    """
+    table = Log._meta.db_table
+    if not is_partitioned(table):
+        return
+    create_partitions(table)
+    drop_partitions(table)
+
+
+@app.task
+def prune_old_rollups():
+    """
+    Deletes the rollups past the retention of their grain
+    """
+    prune_rollups()
@@ -1,3 +1,1071 @@
-from django.test import TestCase
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import asyncio
+import datetime
+import os
+import socket
+import ssl
+import tempfile
+import dns.exception
+import dns.resolver
+import requests
+from types import SimpleNamespace
+from unittest import mock
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+from django.contrib.contenttypes.models import ContentType
+from django.db import DatabaseError, connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from elasticsearch.exceptions import ConnectionError as ElasticsearchConnectionError
+from logger import tasks
+from logger.models import Endpoint, Log, Rollup, Service
+from util.dns_util import CachingResolver, ResolverCache
+from util.ingest_util import LogWriter, escape
+from util.expiry_util import get_domain_expiry
+from util.match_util import StreamMatcher, get_matcher, search, stream_search
+from util import limit_util
+from util.latency_util import (
+    get_adaptive_timeout,
+    get_lane,
+    get_latency_key,
+    get_samples,
+    record_samples,
+)
+from util.limit_util import OriginLimiter, TokenBucket, get_limiters, strictest
+from util.ping_util import build_echo, checksum, open_socket, ping_requests
+from util.partition_util import (
+    create_partitions,
+    drop_partitions,
+    get_partition_bounds,
+    get_partitions,
+    is_partitioned,
+)
+from util.pool_util import SessionPool
+from util.queue_util import get_worker_queue
+from util.probe_util import process_endpoints
+from util.redis_util import get_redis
+from util.rollup_util import (
+    aggregate,
+    get_bucket,
+    get_histogram_percentile,
+    merge,
+    update_rollups,
+)
+from util.schedule_util import get_next_run, get_phase_offset
+from util.sla_util import compute_sla
+from util.state_util import transition, UP, SUSPECT, DOWN, RECOVERING
 
-# Create your tests here.
+
+class PageHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # path => status and body
+    pages = {
+        "/": (200, b"OK"),
+        "/health": (200, b"status: healthy"),
+        "/missing": (404, b"not found"),
+    }
+
+    def do_GET(self):
+        status, body = self.pages.get(self.path, (404, b""))
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class SlowHandler(PageHandler):
+    delay = 1.5
+
+    def do_GET(self):
+        time.sleep(self.delay)
+        super().do_GET()
+
+
+def serve(testcase, handler, context=None):
+    """
+    Serves the handler on a local port for the duration of the test, returns its base url
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    if context is not None:
+        server.socket = context.wrap_socket(server.socket, server_side=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    testcase.addCleanup(server.server_close)
+    testcase.addCleanup(server.shutdown)
+    scheme = "https" if context is not None else "http"
+    return "{}://127.0.0.1:{}".format(scheme, server.server_port)
+
+
+class StateMachineTests(SimpleTestCase):
+    """
+    An endpoint with a 60s confirmation period and a 120s recovery period
+    """
+
+    def step(self, state, since, status, now):
+        return transition(state, since, status, now, 60, 120)
+
+    def test_outage_goes_through_every_state(self):
+        state, since = UP, 0
+        steps = [
+            ("DOWN", 100, SUSPECT, 100),
+            # still within the confirmation period
+            ("DOWN", 130, SUSPECT, 100),
+            ("DOWN", 160, DOWN, 160),
+            ("DOWN", 200, DOWN, 160),
+            ("UP", 220, RECOVERING, 220),
+            # still within the recovery period
+            ("UP", 300, RECOVERING, 220),
+            ("UP", 340, UP, 340),
+            ("UP", 400, UP, 340),
+        ]
+        for status, now, expected_state, expected_since in steps:
+            state, since = self.step(state, since, status, now)
+            self.assertEqual((state, since), (expected_state, expected_since), now)
+
+    def test_suspect_recovers_without_going_down(self):
+        state, since = self.step(UP, 0, "DOWN", 100)
+        self.assertEqual((state, since), (SUSPECT, 100))
+        self.assertEqual(self.step(state, since, "UP", 130), (UP, 130))
+
+    def test_failure_while_recovering_goes_back_down(self):
+        state, since = self.step(DOWN, 100, "UP", 200)
+        self.assertEqual((state, since), (RECOVERING, 200))
+        self.assertEqual(self.step(state, since, "DOWN", 250), (DOWN, 250))
+
+    def test_zero_periods_switch_right_away(self):
+        self.assertEqual(transition(UP, 0, "DOWN", 100, 0, 0), (DOWN, 100))
+        self.assertEqual(transition(DOWN, 100, "UP", 200, 0, 0), (UP, 200))
+
+
+class WriteLogsTests(TestCase):
+    def setUp(self):
+        self.service = Service.objects.create(name="api")
+        self.endpoint = Endpoint.objects.create(url="http://api.local/")
+        self.endpoint.service.add(self.service)
+
+    def get_result(self, status):
+        return {
+            "endpoint_id": self.endpoint.pk,
+            "service_ids": [self.service.pk],
+            "status": status,
+            "response_time": 0.1,
+            "message": "Request sent successfully.",
+        }
+
+    @mock.patch("logger.tasks.dispatch_rechecks")
+    @mock.patch("logger.tasks.dispatch_incidents")
+    @mock.patch(
+        "logger.tasks.update_index",
+        side_effect=ElasticsearchConnectionError("N/A", "index is down", None),
+    )
+    def test_incidents_dont_wait_on_the_log_index(
+        self, update_index, dispatch_incidents, dispatch_rechecks
+    ):
+        results = [self.get_result("DOWN")]
+        tasks.write_logs([results])
+        update_index.assert_called_once()
+        dispatch_incidents.assert_called_once_with(results)
+        dispatch_rechecks.assert_called_once_with(results)
+        self.assertEqual(Log.objects.filter(entity_id=self.endpoint.pk).count(), 1)
+
+
+class AdaptiveTimeoutTests(TestCase):
+    """
+    An endpoint slower than its adaptive timeout, but within its configured timeout
+    """
+
+    def setUp(self):
+        self.endpoint = Endpoint.objects.create(
+            url=serve(self, SlowHandler) + "/",
+            timeout=5,
+            regex="200",
+        )
+
+    def test_confirmation_gets_the_configured_budget(self):
+        enter = OriginLimiter.__aenter__
+        with mock.patch.object(
+            OriginLimiter, "__aenter__", autospec=True, side_effect=enter
+        ) as aenter:
+            (result,) = process_endpoints(
+                [self.endpoint], timeouts={self.endpoint.pk: 1}
+            )
+        self.assertEqual(result["status"], "UP")
+        self.assertTrue(result["retried"])
+        self.assertGreater(result["response_time"], 1)
+        # the confirmation took a token of its own
+        self.assertEqual(aenter.call_count, 2)
+
+
+class DomainExpiryTests(TestCase):
+    def setUp(self):
+        self.redis = mock.MagicMock()
+        self.redis.get.return_value = None
+        patcher = mock.patch("util.expiry_util.get_redis", return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @mock.patch("util.expiry_util.fetch_domain_expiry")
+    def test_failed_lookup_moves_on_to_the_parent_domain(self, fetch):
+        expires_at = datetime.datetime(2030, 1, 1, tzinfo=datetime.timezone.utc)
+        fetch.side_effect = [requests.Timeout(), False, expires_at]
+        self.assertEqual(get_domain_expiry("www.api.example.com"), expires_at)
+        self.assertEqual(
+            [call.args[0] for call in fetch.call_args_list],
+            ["www.api.example.com", "api.example.com", "example.com"],
+        )
+
+    @mock.patch("util.expiry_util.fetch_domain_expiry")
+    def test_answer_without_a_date_stops_the_lookup(self, fetch):
+        fetch.side_effect = [None]
+        self.assertIsNone(get_domain_expiry("api.example.com"))
+        fetch.assert_called_once_with("api.example.com")
+
+    @mock.patch("util.expiry_util.fetch_domain_expiry")
+    def test_no_answer_is_a_failure(self, fetch):
+        fetch.side_effect = requests.ConnectionError()
+        self.assertIs(get_domain_expiry("api.example.com"), False)
+
+
+@override_settings(SLA_RESOLUTION=60, SLA_BURN_WINDOW=120)
+class SLATests(TestCase):
+    """
+    Ten one minute slots, the first endpoint fails over the last two while the second stays up
+    """
+
+    def setUp(self):
+        self.end = timezone.now().replace(second=0, microsecond=0)
+        self.start = self.end - datetime.timedelta(minutes=10)
+        self.failing = Endpoint.objects.create(url="http://a.local/")
+        self.healthy = Endpoint.objects.create(url="http://b.local/")
+        logs = []
+        for minute in range(10):
+            created_at = self.start + datetime.timedelta(minutes=minute, seconds=30)
+            for endpoint in (self.failing, self.healthy):
+                down = endpoint == self.failing and minute >= 8
+                logs.append(
+                    Log(
+                        target=endpoint,
+                        status="DOWN" if down else "UP",
+                        response_time=None if down else 0.2,
+                        created_at=created_at,
+                    )
+                )
+        Log.objects.bulk_create(logs)
+
+    def get_sla(self, service_type):
+        service = Service.objects.create(name=service_type, service_type=service_type)
+        service.endpoints.add(self.failing, self.healthy)
+        (sla,) = compute_sla([service], self.start, self.end, target=90)
+        return sla
+
+    def test_coupled_service_is_down_with_any_endpoint(self):
+        sla = self.get_sla("coupled")
+        self.assertAlmostEqual(sla["uptime_percentage"], 80)
+        self.assertEqual(sla["downtime_minutes"], 2)
+        self.assertEqual(sla["degraded_minutes"], 0)
+        self.assertAlmostEqual(sla["error_budget_minutes"], 1)
+        # twice the budget is gone, and the last two minutes spend it ten times too fast
+        self.assertAlmostEqual(sla["error_budget_burned"], 2)
+        self.assertAlmostEqual(sla["burn_rate"], 10)
+        self.assertAlmostEqual(sla["mean_response_time"], 0.2)
+
+    def test_decoupled_service_is_degraded_with_some_endpoints(self):
+        sla = self.get_sla("decoupled")
+        self.assertAlmostEqual(sla["uptime_percentage"], 100)
+        self.assertEqual(sla["downtime_minutes"], 0)
+        self.assertEqual(sla["degraded_minutes"], 2)
+        self.assertEqual(sla["error_budget_burned"], 0)
+        self.assertEqual(sla["burn_rate"], 0)
+
+    def test_burn_rate_only_covers_the_end_of_the_window(self):
+        Log.objects.filter(status="DOWN").update(status="UP")
+        Log.objects.filter(
+            entity_id=self.failing.pk,
+            created_at__lt=self.start + datetime.timedelta(minutes=2),
+        ).update(status="DOWN")
+        sla = self.get_sla("coupled")
+        self.assertAlmostEqual(sla["error_budget_burned"], 2)
+        self.assertEqual(sla["burn_rate"], 0)
+
+    def test_window_without_data(self):
+        service = Service.objects.create(name="idle", service_type="coupled")
+        service.endpoints.add(Endpoint.objects.create(url="http://c.local/"))
+        (sla,) = compute_sla([service], self.start, self.end, target=90)
+        self.assertIsNone(sla["uptime_percentage"])
+        self.assertEqual(sla["monitored_minutes"], 0)
+        self.assertEqual(sla["error_budget_minutes"], 0)
+        self.assertIsNone(sla["error_budget_burned"])
+        self.assertIsNone(sla["burn_rate"])
+        self.assertIsNone(sla["mean_response_time"])
+
+
+class StreamMatcherTests(SimpleTestCase):
+    def feed(self, pattern, chunks, overlap=None):
+        matcher = StreamMatcher(pattern, overlap=overlap)
+        return any(matcher.feed(chunk) for chunk in chunks)
+
+    def test_literal_across_chunks(self):
+        self.assertTrue(self.feed("healthy", [b"status: hea", b"lthy\n"]))
+        self.assertFalse(self.feed("healthy", [b"status: hea", b"vy\n"]))
+
+    def test_regex_across_chunks(self):
+        chunks = [b'{"status": "o', b'k", "version": 3}']
+        self.assertTrue(self.feed(r'"status": "ok"', chunks, overlap=16))
+
+    def test_multibyte_character_split_across_chunks(self):
+        body = "état: opérationnel".encode()
+        self.assertTrue(self.feed(r"op.rationnel", [body[:11], body[11:]], overlap=16))
+
+    def test_anchors_only_match_at_the_beginning_of_the_body(self):
+        # the second window starts with the carried over "ok"
+        chunks = [b"error:\nok", b"!"]
+        self.assertFalse(self.feed(r"^ok", chunks, overlap=2))
+        self.assertFalse(self.feed(r"\Aok", chunks, overlap=2))
+        self.assertTrue(self.feed(r"(?m)^ok", chunks, overlap=2))
+        self.assertTrue(self.feed(r"^error", chunks, overlap=2))
+
+    def test_lookbehind_sees_the_character_before_the_tail(self):
+        chunks = [b"xxxxxxab", b"c"]
+        self.assertFalse(self.feed(r"(?<!a)bc", chunks, overlap=2))
+        self.assertTrue(self.feed(r"(?<=a)bc", chunks, overlap=2))
+
+
+class SessionPoolTests(SimpleTestCase):
+    def setUp(self):
+        self.url = serve(self, PageHandler) + "/"
+        self.pool = SessionPool(maxsize=1)
+
+    def send(self):
+        response, reused = self.pool.request("GET", self.url, timeout=5)
+        response.content
+        response.close()
+        return reused
+
+    def test_connection_is_reused(self):
+        self.assertEqual([self.send(), self.send(), self.send()], [False, True, True])
+
+    def test_dropped_connection_is_new(self):
+        self.send()
+        self.pool.get(self.url, False)[1].close()
+        self.assertFalse(self.send())
+        self.assertTrue(self.send())
+
+
+def write_self_signed_certificate(directory):
+    """
+    Writes a certificate for 127.0.0.1 and its key, returns their paths
+    """
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "127.0.0.1")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    certificate = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(days=1))
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .sign(key, hashes.SHA256())
+    )
+    certfile = os.path.join(directory, "cert.pem")
+    keyfile = os.path.join(directory, "key.pem")
+    with open(certfile, "wb") as f:
+        f.write(certificate.public_bytes(serialization.Encoding.PEM))
+    with open(keyfile, "wb") as f:
+        f.write(
+            key.private_bytes(
+                serialization.Encoding.PEM,
+                serialization.PrivateFormat.PKCS8,
+                serialization.NoEncryption(),
+            )
+        )
+    return certfile, keyfile
+
+
+class PhaseTimingTests(TestCase):
+    """
+    PhaseTimingConnector overrides private aiohttp hooks, an upgrade renaming them would silently
+    stop the connect and TLS phases from being timed
+    """
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(*write_self_signed_certificate(directory.name))
+        self.endpoint = Endpoint.objects.create(
+            url=serve(self, PageHandler, context) + "/",
+            timeout=5,
+            regex="200",
+        )
+
+    def test_connect_and_tls_phases_are_timed(self):
+        (result,) = process_endpoints([self.endpoint])
+        self.assertEqual(result["status"], "UP")
+        self.assertFalse(result["reused"])
+        self.assertGreater(result["connect_time"], 0)
+        self.assertGreater(result["tls_time"], 0)
+        self.assertEqual(result["handshake"], "full")
+
+
+class WorkerQueueTests(SimpleTestCase):
+    @override_settings(PROBE_REGION=None)
+    def test_worker_without_region(self):
+        self.assertIsNone(get_worker_queue())
+
+    @override_settings(
+        PROBE_REGION="eu",
+        PROBE_QUEUE="probes",
+        SLOW_LANE_QUEUE="probes_slow",
+        RECHECK_QUEUE="probes_priority",
+    )
+    def test_queue_of_every_lane(self):
+        for lane, queue in [
+            ("fast", "probes.eu"),
+            ("slow", "probes_slow.eu"),
+            ("priority", "probes_priority.eu"),
+        ]:
+            with self.settings(PROBE_LANE=lane):
+                self.assertEqual(get_worker_queue(), queue)
+
+
+class ProbeEngineTests(TestCase):
+    def setUp(self):
+        self.url = serve(self, PageHandler)
+
+    def create(self, path, logger_type, regex, url=None):
+        return Endpoint.objects.create(
+            url=(url or self.url) + path,
+            logger_type=logger_type,
+            regex=regex,
+            timeout=5,
+        )
+
+    def test_results_follow_the_endpoints(self):
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            refused = "http://127.0.0.1:{}".format(sock.getsockname()[1])
+        endpoints = [
+            self.create("/", "status", "200"),
+            self.create("/health", "keyword", "healthy"),
+            self.create("/health", "keyword", r"status: (sick|failing)"),
+            self.create("/missing", "status", "2\\d\\d"),
+            self.create("/", "status", "200", url=refused),
+        ]
+        results = process_endpoints(endpoints)
+        self.assertEqual(
+            [result["status"] for result in results],
+            ["UP", "UP", "DOWN", "DOWN", "DOWN"],
+        )
+        self.assertEqual(results[1]["downloaded_bytes"], len(b"status: healthy"))
+        self.assertIn("connection refused", results[4]["message"])
+        self.assertFalse(any(result["timed_out"] for result in results))
+
+    def test_connections_are_reused_across_cycles(self):
+        endpoint = self.create("/", "status", "200")
+        (first,) = process_endpoints([endpoint])
+        (second,) = process_endpoints([endpoint])
+        self.assertFalse(first["reused"])
+        self.assertTrue(second["reused"])
+        self.assertEqual(second["connect_time"], 0)
+
+
+@override_settings(
+    PROBE_SHARD_SIZE=2,
+    SLOW_LANE_SHARD_SIZE=2,
+    PROBE_QUEUE="probes",
+    SLOW_LANE_QUEUE="probes_slow",
+)
+class ShardTests(TestCase):
+    @mock.patch("logger.tasks.chord")
+    def test_due_endpoints_are_split_per_region_and_lane(self, chord):
+        now = timezone.now()
+        due = [
+            (1, now + datetime.timedelta(seconds=3), "fast", ["us"]),
+            (2, now, "fast", ["us", "eu"]),
+            (3, now + datetime.timedelta(seconds=1), "fast", ["us"]),
+            (4, now, "slow", ["us"]),
+        ]
+        tasks.dispatch_probes(due, now)
+        chords = [
+            [
+                (shard.args, shard.options["queue"], shard.options["countdown"])
+                for shard in call.args[0]
+            ]
+            for call in chord.call_args_list
+        ]
+        self.assertEqual(
+            chords,
+            [
+                # shards are released at the due time of their first endpoint
+                [
+                    (([2, 3], "fast", "us"), "probes.us", 0),
+                    (([1], "fast", "us"), "probes.us", 3),
+                ],
+                [(([4], "slow", "us"), "probes_slow.us", 0)],
+                [(([2], "fast", "eu"), "probes.eu", 0)],
+            ],
+        )
+        chord.return_value.assert_called_with(tasks.write_logs.s())
+
+    def test_shard_results_are_tagged(self):
+        service = Service.objects.create(name="api")
+        inactive = Service.objects.create(name="old", is_active=False)
+        endpoint = Endpoint.objects.create(
+            url=serve(self, PageHandler) + "/",
+            regex="200",
+            timeout=5,
+            confirmation_period=60,
+        )
+        endpoint.service.add(service, inactive)
+        (result,) = tasks.probe_shard([endpoint.pk], "fast", "eu")
+        self.assertEqual(result["status"], "UP")
+        self.assertEqual(result["endpoint_id"], endpoint.pk)
+        self.assertEqual(result["service_ids"], [service.pk])
+        self.assertEqual(result["region"], "eu")
+        self.assertEqual(result["confirmation_period"], 60)
+        self.assertIsNone(result["recheck"])
+
+
+class MatchTests(SimpleTestCase):
+    def test_literal_patterns_skip_the_regex_engine(self):
+        self.assertEqual(get_matcher("healthy"), ("healthy", None))
+        literal, regex = get_matcher("health(y|ier)")
+        self.assertIsNone(literal)
+        self.assertEqual(regex.pattern, "health(y|ier)")
+        # compiled once per worker
+        self.assertIs(get_matcher("health(y|ier)")[1], regex)
+
+    def test_search_text_and_bytes(self):
+        self.assertTrue(search("200", "200"))
+        self.assertFalse(search("200", "404"))
+        self.assertTrue(search("état", "état: ok".encode("latin-1"), "latin-1"))
+        self.assertTrue(search(r"\d{3} OK", b"HTTP/1.1 200 OK"))
+        self.assertFalse(search(r"^OK", b"HTTP/1.1 200 OK"))
+
+    def test_stream_search_stops_at_the_match(self):
+        chunks = iter([b"aaaa", b"aaok", b"aaaa", b"aaaa"])
+        self.assertEqual(stream_search("ok", chunks, max_bytes=100)[:2], (True, 8))
+        # the rest of the body isn't downloaded
+        self.assertEqual(len(list(chunks)), 2)
+
+    def test_stream_search_stops_at_max_bytes(self):
+        chunks = [b"aaaa", b"aaok"]
+        self.assertEqual(stream_search("ok", chunks, max_bytes=6)[:2], (False, 6))
+
+
+class FakeAnswer(list):
+    def __init__(self, addresses, ttl):
+        super().__init__(SimpleNamespace(address=address) for address in addresses)
+        self.rrset = SimpleNamespace(ttl=ttl)
+
+
+class FakeResolver:
+    """
+    Answers from a {(host, record type): answer or exception} dict and keeps the queries it got
+    """
+
+    def __init__(self, answers):
+        self.answers = answers
+        self.queries = []
+
+    async def resolve(self, host, record):
+        self.queries.append((host, record))
+        await asyncio.sleep(0)
+        answer = self.answers.get((host, record), dns.resolver.NoAnswer())
+        if isinstance(answer, BaseException):
+            raise answer
+        return answer
+
+
+@override_settings(DNS_MIN_TTL=10, DNS_MAX_TTL=300, DNS_NEGATIVE_TTL=30)
+class ResolverCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.cache = ResolverCache()
+        self.cache.resolver = FakeResolver(
+            {
+                ("api.local", "A"): FakeAnswer(["10.0.0.1"], 60),
+                ("api.local", "AAAA"): FakeAnswer(["fd00::1"], 120),
+                ("missing.local", "A"): dns.resolver.NXDOMAIN(),
+                ("missing.local", "AAAA"): dns.resolver.NXDOMAIN(),
+                ("slow.local", "A"): dns.exception.Timeout(),
+                ("slow.local", "AAAA"): dns.exception.Timeout(),
+            }
+        )
+        # the system resolver is the fallback, keep it out of the tests
+        patcher = mock.patch("socket.getaddrinfo", side_effect=socket.gaierror())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def resolve(self, *hosts):
+        async def resolve_all():
+            return await asyncio.gather(
+                *[self.cache.resolve(host) for host in hosts], return_exceptions=True
+            )
+
+        return asyncio.run(resolve_all())
+
+    def test_answers_are_cached_for_their_ttl(self):
+        addresses = [(socket.AF_INET, "10.0.0.1"), (socket.AF_INET6, "fd00::1")]
+        self.assertEqual(self.resolve("api.local"), [addresses])
+        self.assertEqual(self.resolve("api.local"), [addresses])
+        self.assertEqual(len(self.cache.resolver.queries), 2)
+        self.assertEqual(self.cache.pop_stats()["hits"], 1)
+        # the shortest TTL of the records wins
+        with mock.patch("time.monotonic", return_value=time.monotonic() + 61):
+            self.resolve("api.local")
+        self.assertEqual(len(self.cache.resolver.queries), 4)
+
+    def test_concurrent_lookups_share_a_query(self):
+        results = self.resolve("api.local", "api.local", "api.local")
+        self.assertEqual(len(set(map(tuple, results))), 1)
+        self.assertEqual(
+            sorted(self.cache.resolver.queries),
+            [("api.local", "A"), ("api.local", "AAAA")],
+        )
+
+    def test_missing_hosts_are_cached(self):
+        (error,) = self.resolve("missing.local")
+        self.assertIsInstance(error, OSError)
+        (error,) = self.resolve("missing.local")
+        self.assertIsInstance(error, OSError)
+        self.assertEqual(len(self.cache.resolver.queries), 2)
+        self.assertEqual(self.cache.pop_stats()["negative_hits"], 1)
+
+    def test_timeouts_are_not_cached(self):
+        self.resolve("slow.local")
+        self.resolve("slow.local")
+        self.assertEqual(len(self.cache.resolver.queries), 4)
+
+    def test_addresses_bypass_the_cache(self):
+        self.assertEqual(self.resolve("10.0.0.2"), [[(socket.AF_INET, "10.0.0.2")]])
+        self.assertEqual(self.cache.resolver.queries, [])
+
+    def test_aiohttp_resolver_filters_the_family(self):
+        resolver = CachingResolver(self.cache)
+        hosts = asyncio.run(resolver.resolve("api.local", 443, socket.AF_INET6))
+        self.assertEqual(
+            [(host["host"], host["port"]) for host in hosts], [("fd00::1", 443)]
+        )
+
+
+@override_settings(PING_COUNT=2, PING_INTERVAL=10)
+class PingTests(SimpleTestCase):
+    def ping(self, *requests):
+        async def ping_all():
+            return await ping_requests(list(requests), asyncio.Semaphore(10))
+
+        return asyncio.run(ping_all())
+
+    def request(self, host, port=None):
+        return {"host": host, "port": port, "timeout": 2}
+
+    def test_echo_request_checksum(self):
+        echo = build_echo(socket.AF_INET, 7, b"\x00" * 56)
+        self.assertEqual(len(echo), 64)
+        self.assertEqual(echo[0], 8)
+        # summing a packet along with its own checksum gives zero
+        self.assertEqual(checksum(echo), 0)
+
+    def test_icmp(self):
+        sock = open_socket(socket.AF_INET)
+        if sock is None:
+            self.skipTest("unprivileged ICMP sockets aren't allowed on this host")
+        sock.close()
+        up, unresolved = self.ping(self.request("127.0.0.1"), self.request(None))
+        self.assertEqual(up["status"], "UP")
+        self.assertEqual(up["ping_method"], "icmp")
+        self.assertEqual(up["packet_loss"], 0)
+        self.assertLessEqual(up["rtt_min"], up["rtt_max"])
+        self.assertEqual(unresolved["status"], "DOWN")
+        self.assertEqual(unresolved["packet_loss"], 100)
+
+    @mock.patch("util.ping_util.open_socket", return_value=None)
+    def test_tcp_fallback_without_icmp(self, open_socket):
+        with socket.socket() as listener:
+            listener.bind(("127.0.0.1", 0))
+            listener.listen()
+            port = listener.getsockname()[1]
+            with socket.socket() as closed:
+                closed.bind(("127.0.0.1", 0))
+                closed_port = closed.getsockname()[1]
+            listening, refused = self.ping(
+                self.request("127.0.0.1", port), self.request("127.0.0.1", closed_port)
+            )
+        self.assertEqual(listening["ping_method"], "tcp")
+        self.assertEqual(listening["status"], "UP")
+        # a reset still proves the host is up
+        self.assertEqual(refused["status"], "UP")
+        self.assertEqual(refused["packet_loss"], 0)
+
+
+class LimiterTests(SimpleTestCase):
+    def test_token_bucket_allows_a_burst_then_the_rate(self):
+        async def acquire(bucket, count):
+            start_time = time.monotonic()
+            for _ in range(count):
+                await bucket.acquire()
+            return time.monotonic() - start_time
+
+        bucket = TokenBucket(20)
+        self.assertLess(asyncio.run(acquire(bucket, 20)), 0.05)
+        # five more tokens at 20 per second
+        self.assertGreaterEqual(asyncio.run(acquire(bucket, 5)), 0.2)
+
+    def test_origin_limiter_caps_requests_in_flight(self):
+        limiter = OriginLimiter(concurrency=2)
+        in_flight = []
+
+        async def request():
+            async with limiter:
+                in_flight.append(1)
+                peak = len(in_flight)
+                await asyncio.sleep(0.01)
+                in_flight.pop()
+                return peak
+
+        async def request_all():
+            return await asyncio.gather(*[request() for _ in range(6)])
+
+        self.assertEqual(max(asyncio.run(request_all())), 2)
+
+    def test_strictest_limit(self):
+        self.assertEqual(strictest(0, 5), 5)
+        self.assertEqual(strictest(10, 0), 10)
+        self.assertEqual(strictest(10, 5), 5)
+        self.assertEqual(strictest(None, 5), 5)
+
+    @mock.patch.dict(limit_util._limiters, clear=True)
+    def test_hosts_share_the_strictest_limiter(self):
+        def request(host, concurrency, rate):
+            return {
+                "host": host,
+                "origin_concurrency": concurrency,
+                "origin_rate": rate,
+            }
+
+        limiters = get_limiters(
+            [
+                request("a.local", 10, 0),
+                request("a.local", 4, 2),
+                request("b.local", 0, 0),
+            ]
+        )
+        self.assertEqual(limiters["a.local"].limits, (4, 2))
+        self.assertEqual(limiters["b.local"].limits, (0, 0))
+        self.assertIsNone(limiters["b.local"].semaphore)
+        # kept between cycles, so the buckets carry over, and replaced once the limits change
+        same = get_limiters([request("a.local", 4, 2)])
+        self.assertIs(same["a.local"], limiters["a.local"])
+        changed = get_limiters([request("a.local", 4, 1)])
+        self.assertIsNot(changed["a.local"], limiters["a.local"])
+
+
+@override_settings(
+    ADAPTIVE_MIN_SAMPLES=5,
+    ADAPTIVE_PERCENTILE=95,
+    ADAPTIVE_MULTIPLIER=3,
+    ADAPTIVE_MIN_TIMEOUT=2,
+    LANE_WINDOW=10,
+    LANE_MIN_SAMPLES=5,
+    SLOW_LANE_TIMEOUT_RATE=20,
+    SLOW_LANE_LATENCY=4,
+    LATENCY_SAMPLES=10,
+)
+class LatencyTests(SimpleTestCase):
+    def test_adaptive_timeout_needs_enough_samples(self):
+        self.assertEqual(get_adaptive_timeout([0.5] * 4, 30), 30)
+
+    def test_adaptive_timeout_follows_the_latency(self):
+        self.assertEqual(get_adaptive_timeout([2] * 10, 30), 6)
+        # timeouts aren't durations
+        self.assertEqual(get_adaptive_timeout([2] * 10 + [None] * 3, 30), 6)
+        # the high percentile catches a slow tail the average smooths over
+        self.assertEqual(get_adaptive_timeout([3, 3] + [1] * 18, 30), 9)
+
+    def test_adaptive_timeout_bounds(self):
+        self.assertEqual(get_adaptive_timeout([0.1] * 10, 30), 2)
+        self.assertEqual(get_adaptive_timeout([5] * 10, 10), 10)
+
+    def test_lane_needs_enough_samples(self):
+        self.assertEqual(get_lane([None] * 4, "fast"), "fast")
+
+    def test_slow_endpoints_are_demoted(self):
+        self.assertEqual(get_lane([0.5] * 8 + [None] * 2, "fast"), "slow")
+        self.assertEqual(get_lane([0.5] * 5 + [4] * 5, "fast"), "slow")
+
+    def test_lanes_dont_flap(self):
+        # between half and all of the thresholds, the endpoint stays where it is
+        between = [3] * 10
+        self.assertEqual(get_lane(between, "slow"), "slow")
+        self.assertEqual(get_lane(between, "fast"), "fast")
+        self.assertEqual(get_lane([0.5] * 9 + [None], "slow"), "slow")
+        self.assertEqual(get_lane([0.5] * 10, "slow"), "fast")
+        # only the window counts
+        self.assertEqual(get_lane([None] * 10 + [0.5] * 10, "slow"), "fast")
+
+    def test_samples_round_trip(self):
+        endpoint_id = 987654
+        key = get_latency_key(endpoint_id, "eu")
+        self.addCleanup(get_redis().delete, key)
+        samples = {endpoint_id: []}
+        results = [
+            {"endpoint_id": endpoint_id, "region": "eu", "response_time": 0.5},
+            {"endpoint_id": endpoint_id, "region": "eu", "timed_out": True},
+            # refused connections say nothing about latency
+            {"endpoint_id": endpoint_id, "region": "eu", "response_time": -1},
+            {
+                "endpoint_id": endpoint_id,
+                "region": "eu",
+                "response_time": 0.25,
+                "transfer_time": 0.25,
+            },
+        ]
+        record_samples(results, samples)
+        self.assertEqual(samples[endpoint_id], [0.5, None, 0.5])
+        self.assertEqual(get_samples([endpoint_id], "eu"), samples)
+        record_samples(results * 5)
+        self.assertEqual(len(get_samples([endpoint_id], "eu")[endpoint_id]), 10)
+
+
+@override_settings(LOG_FLUSH_SIZE=3)
+class LogWriterTests(TestCase):
+    def setUp(self):
+        self.endpoint = Endpoint.objects.create(url="http://api.local/")
+        self.flushed = []
+        self.writer = LogWriter(Log, on_flush=self.flushed.append)
+
+    def add(self, count, **values):
+        for _ in range(count):
+            self.writer.add(
+                entity_type_id=ContentType.objects.get_for_model(Endpoint).pk,
+                entity_id=self.endpoint.pk,
+                **values,
+            )
+
+    def test_escape(self):
+        self.assertEqual(escape(None), "\\N")
+        self.assertEqual(escape(True), "t")
+        self.assertEqual(escape("a\tb\nc\\"), "a\\tb\\nc\\\\")
+
+    def test_rows_are_written_in_batches(self):
+        message = "tab\there\nnewline \\N"
+        self.add(4, status="DOWN", response_time=0.25, message=message)
+        self.assertEqual([len(batch) for batch in self.flushed], [3])
+        instances = self.writer.flush()
+        self.assertEqual([len(batch) for batch in self.flushed], [3, 1])
+        self.assertEqual(self.writer.flush(), [])
+        logs = Log.objects.filter(entity_id=self.endpoint.pk)
+        self.assertEqual(logs.count(), 4)
+        # the returned instances carry the ids of the rows
+        self.assertEqual(logs.get(pk=instances[0].pk).message, message)
+        self.assertEqual(set(logs.values_list("status", flat=True)), {"DOWN"})
+
+    def test_failed_copy_falls_back_to_bulk_create(self):
+        with mock.patch.object(
+            LogWriter, "copy", side_effect=DatabaseError("copy failed")
+        ), self.assertLogs("error_logger", "ERROR"):
+            self.add(2)
+            instances = self.writer.flush()
+        self.assertEqual(len(instances), 2)
+        self.assertEqual(Log.objects.filter(entity_id=self.endpoint.pk).count(), 2)
+
+
+class PartitionTests(TestCase):
+    def setUp(self):
+        if not is_partitioned("logger_log"):
+            self.skipTest("the log table is only partitioned on postgres")
+        self.endpoint = Endpoint.objects.create(url="http://api.local/")
+
+    def at(self, *args):
+        return datetime.datetime(*args, tzinfo=datetime.timezone.utc)
+
+    def test_partition_bounds(self):
+        moment = self.at(2031, 1, 1, 13, 30)
+        self.assertEqual(
+            get_partition_bounds(moment, "day"),
+            (self.at(2031, 1, 1), self.at(2031, 1, 2)),
+        )
+        # weeks start on monday
+        self.assertEqual(
+            get_partition_bounds(moment, "week"),
+            (self.at(2030, 12, 30), self.at(2031, 1, 6)),
+        )
+
+    @override_settings(LOG_PARTITION_INTERVAL="day")
+    def test_partitions_are_created_ahead(self):
+        now = self.at(2031, 1, 1, 12)
+        created = create_partitions("logger_log", now=now, ahead=1)
+        self.assertEqual(
+            created, ["logger_log_20310101_20310102", "logger_log_20310102_20310103"]
+        )
+        self.assertEqual(create_partitions("logger_log", now=now, ahead=1), [])
+        # a coarser interval skips the days which are already covered
+        with self.settings(LOG_PARTITION_INTERVAL="week"):
+            self.assertEqual(
+                create_partitions("logger_log", now=now, ahead=1),
+                ["logger_log_20310106_20310113"],
+            )
+
+    @override_settings(LOG_PARTITION_INTERVAL="day")
+    def test_rows_in_the_default_partition_are_moved(self):
+        created_at = self.at(2032, 6, 1, 12)
+        # bulk_create skips the log index
+        Log.objects.bulk_create([Log(target=self.endpoint, created_at=created_at)])
+        self.assertEqual(
+            create_partitions("logger_log", now=created_at, ahead=0),
+            ["logger_log_20320601_20320602"],
+        )
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT count(*) FROM logger_log_20320601_20320602")
+            self.assertEqual(cursor.fetchone()[0], 1)
+            cursor.execute("SELECT count(*) FROM logger_log_default")
+            self.assertEqual(cursor.fetchone()[0], 0)
+        self.assertTrue(Log.objects.filter(created_at=created_at).exists())
+
+    @override_settings(LOG_PARTITION_INTERVAL="day")
+    def test_partitions_past_retention_are_dropped(self):
+        create_partitions("logger_log", now=self.at(2031, 1, 1), ahead=1)
+        Log.objects.bulk_create(
+            [
+                Log(target=self.endpoint, created_at=self.at(2031, 1, 1, 12)),
+                Log(target=self.endpoint, created_at=self.at(2031, 1, 2, 12)),
+            ]
+        )
+        # the rows were inserted within the test's transaction, check their foreign keys before dropping
+        with connection.cursor() as cursor:
+            cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+        now = self.at(2031, 1, 12, 12)
+        self.assertEqual(drop_partitions("logger_log", retention_days=0, now=now), [])
+        dropped = drop_partitions("logger_log", retention_days=10, now=now)
+        # the partition still holding rows within the retention period is kept
+        self.assertIn("logger_log_20310101_20310102", dropped)
+        self.assertNotIn("logger_log_20310102_20310103", dropped)
+        names = [name for name, _, _ in get_partitions("logger_log")]
+        self.assertNotIn("logger_log_20310101_20310102", names)
+        self.assertEqual(Log.objects.filter(entity_id=self.endpoint.pk).count(), 1)
+
+
+class RollupTests(TestCase):
+    def setUp(self):
+        self.moment = datetime.datetime(
+            2031, 1, 1, 13, 30, 15, tzinfo=datetime.timezone.utc
+        )
+
+    def get_logs(self, response_times, status="UP", entity_id=1):
+        return [
+            Log(
+                entity_id=entity_id,
+                status=status,
+                response_time=response_time,
+                created_at=self.moment,
+            )
+            for response_time in response_times
+        ]
+
+    def test_buckets(self):
+        self.assertEqual(
+            get_bucket(self.moment, "minute"), self.moment.replace(second=0)
+        )
+        self.assertEqual(
+            get_bucket(self.moment, "hour"), self.moment.replace(minute=0, second=0)
+        )
+        self.assertEqual(
+            get_bucket(self.moment, "day"),
+            self.moment.replace(hour=0, minute=0, second=0),
+        )
+
+    def test_percentiles_are_within_five_percent(self):
+        rollup = Rollup()
+        (partial, *_) = aggregate(
+            self.get_logs([i / 100 for i in range(1, 101)]), {}
+        ).values()
+        merge(rollup, partial)
+        self.assertEqual(
+            (rollup.min_response_time, rollup.max_response_time), (0.01, 1)
+        )
+        self.assertAlmostEqual(rollup.mean_response_time, 0.505)
+        for percentile, exact in [(50, 0.5), (95, 0.95), (99, 0.99)]:
+            value = getattr(rollup, f"p{percentile}_response_time")
+            self.assertLessEqual(abs(value - exact) / exact, 0.05, percentile)
+
+    def test_percentiles_stay_within_the_observed_range(self):
+        histogram = {"100": 3}
+        self.assertEqual(get_histogram_percentile(histogram, 50, 0.12, 0.125), 0.125)
+        self.assertEqual(get_histogram_percentile(histogram, 50, 0.2, 0.3), 0.2)
+
+    def test_merging_batches_matches_merging_once(self):
+        first = self.get_logs([0.1, 0.2, 0.3]) + self.get_logs([None], status="DOWN")
+        second = self.get_logs([0.4, 2.5])
+        (once, *_) = aggregate(first + second, {}).values()
+        merged_once = Rollup()
+        merge(merged_once, once)
+        merged_twice = Rollup()
+        for logs in (first, second):
+            (partial, *_) = aggregate(logs, {}).values()
+            merge(merged_twice, partial)
+        for field in [
+            "count",
+            "up_count",
+            "down_count",
+            "min_response_time",
+            "max_response_time",
+            "p50_response_time",
+            "p99_response_time",
+            "histogram",
+        ]:
+            self.assertEqual(
+                getattr(merged_twice, field), getattr(merged_once, field), field
+            )
+        self.assertAlmostEqual(merged_twice.mean_response_time, 0.7)
+        self.assertEqual(merged_twice.down_count, 1)
+
+    def test_rollups_of_endpoints_and_services(self):
+        logs = self.get_logs([0.1, 0.3], entity_id=1) + self.get_logs(
+            [0.2], entity_id=2
+        )
+        services = {1: [10], 2: [10]}
+        update_rollups(logs, services)
+        update_rollups(self.get_logs([None], status="DOWN", entity_id=1), services)
+        self.assertEqual(Rollup.objects.count(), 9)
+        for grain, _ in Rollup.GRAIN_CHOICES:
+            endpoint = Rollup.objects.get(entity="endpoint", entity_id=1, grain=grain)
+            self.assertEqual((endpoint.count, endpoint.down_count), (3, 1))
+            self.assertAlmostEqual(endpoint.mean_response_time, 0.2)
+            service = Rollup.objects.get(entity="service", entity_id=10, grain=grain)
+            self.assertEqual((service.count, service.up_count), (4, 3))
+            self.assertEqual(service.bucket, get_bucket(self.moment, grain))
+
+
+class ScheduleTests(SimpleTestCase):
+    def test_runs_keep_the_phase_of_the_endpoint(self):
+        after = datetime.datetime(2031, 1, 1, 12, tzinfo=datetime.timezone.utc)
+        offset = get_phase_offset(42, 60)
+        self.assertEqual(get_phase_offset(42, 60), offset)
+        first = get_next_run(42, 60, after)
+        self.assertEqual(first.timestamp() % 60, offset)
+        self.assertGreater(first, after)
+        self.assertLessEqual(first - after, datetime.timedelta(seconds=60))
+        # strictly after, the run at `after` itself is the previous one
+        self.assertEqual(
+            get_next_run(42, 60, first), first + datetime.timedelta(seconds=60)
+        )
+
+    def test_missed_runs_are_skipped(self):
+        after = datetime.datetime(2031, 1, 1, 12, tzinfo=datetime.timezone.utc)
+        late = after + datetime.timedelta(minutes=10)
+        self.assertEqual(
+            get_next_run(42, 60, late) - get_next_run(42, 60, after),
+            datetime.timedelta(minutes=10),
+        )
+
+    def test_endpoints_are_spread_across_the_interval(self):
+        offsets = {get_phase_offset(entity_id, 300) for entity_id in range(100)}
+        self.assertGreater(len(offsets), 50)
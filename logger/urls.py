@@ -19,5 +19,10 @@ router.register(
 urlpatterns = [
     path("team-subscribe/", views.teammate_subscribe, name="team-subscribe"),
     path("guest-subscribe/", views.guest_subscribe, name="guest-subscribe"),
+    path("heartbeat/<str:token>/", views.cron_heartbeat, name="cron-heartbeat"),
+    path("metrics/probe-rate/", views.probe_rate, name="probe-rate"),
+    path("metrics/match-time/", views.match_time, name="match-time"),
+    path("metrics/dns/", views.dns_stats, name="dns-stats"),
+    path("metrics/log-writes/", views.log_writes, name="log-writes"),
     path("", include(router.urls)),
 ]
@@ -1,7 +1,11 @@
 import re
+import datetime
 from django.shortcuts import render
 from django.shortcuts import get_object_or_404
 from django.core.exceptions import ValidationError
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from rest_framework import viewsets
 from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
@@ -24,6 +28,7 @@ from .models import (
     Service,
     Incident,
     Log,
+    Rollup,
 )
 from users.models import User, Guest
 from .serializers import (
@@ -35,8 +40,63 @@ from .serializers import (
     ServiceSerializer,
     IncidentSerializer,
     LogDocumentSerializer,
+    RollupSerializer,
 )
 from .documents import LogDocument
+from incident.tasks import record_heartbeat
+from util.rollup_util import get_rollups
+from util.sla_util import compute_sla
+from util.archive_util import query_logs
+from util.metrics_util import (
+    get_probe_rate,
+    get_slowest_matches,
+    get_dns_stats,
+    get_log_write_stats,
+)
+
+
+def get_window(request, default):
+    """
+    Returns the [`start`, `end`) of the request as aware datetimes, `end` is now and the window lasts `default` unless given
+    Raises ValueError with the error to report when they're invalid
+    """
+    start = request.query_params.get("start")
+    end = request.query_params.get("end")
+    try:
+        # parse_datetime returns None when the format is off, raises when the date doesn't exist
+        end = parse_datetime(end) if end else timezone.now()
+        start = parse_datetime(start) if start else end and end - default
+    except ValueError:
+        start = None
+    if start is None or end is None:
+        raise ValueError("Start and end should be ISO 8601.")
+    start, end = (
+        timezone.make_aware(moment) if timezone.is_naive(moment) else moment
+        for moment in (start, end)
+    )
+    if start >= end:
+        raise ValueError("Start should be before end.")
+    return start, end
+
+
+def rollup_response(request, entity, entity_id):
+    """
+    Rollups of the endpoint or service at the `grain` in [`start`, `end`), the last day by default
+    """
+    grain = request.query_params.get("grain", "hour")
+    if grain not in dict(Rollup.GRAIN_CHOICES):
+        return Response(
+            {"error": "Grain should be one of minute, hour or day."}, status=400
+        )
+    try:
+        start, end = get_window(request, datetime.timedelta(days=1))
+    except ValueError as error:
+        return Response({"error": str(error)}, status=400)
+    rollups = get_rollups(entity, entity_id, grain, start, end)
+    return Response(
+        {"rollups": RollupSerializer(rollups, many=True).data},
+        status=200,
+    )
 
 
 class RequestHandlerViewset(viewsets.ModelViewSet):
@@ -61,6 +121,45 @@ class ServiceViewset(viewsets.ModelViewSet):
             status=200,
         )
 
+    @action(detail=False, methods=["get"])
+    def sla(self, request):
+        """
+        Uptime, downtime and error budget of the `ids` services, all active ones by default,
+        over [`start`, `end`), the last 30 days by default, against `target` percent
+        """
+        services = Service.objects.filter(is_active=True)
+        ids = request.query_params.get("ids")
+        try:
+            if ids:
+                services = Service.objects.filter(
+                    pk__in=[int(pk) for pk in ids.split(",")]
+                )
+            target = float(request.query_params.get("target", settings.SLA_TARGET))
+        except ValueError:
+            return Response(
+                {"error": "Ids should be integers and target a number."}, status=400
+            )
+        if not 0 < target <= 100:
+            return Response({"error": "Target should be a percentage."}, status=400)
+        try:
+            start, end = get_window(request, datetime.timedelta(days=30))
+        except ValueError as error:
+            return Response({"error": str(error)}, status=400)
+        return Response(
+            {
+                "start": start,
+                "end": end,
+                "target": target,
+                "services": compute_sla(services.order_by("pk"), start, end, target),
+            },
+            status=200,
+        )
+
+    @action(detail=True, methods=["get"])
+    def rollups(self, request, pk=None):
+        service = get_object_or_404(Service, pk=pk)
+        return rollup_response(request, "service", service.pk)
+
     @action(detail=True, methods=["get"])
     def subscribers(self, request, pk=None):
         service = get_object_or_404(Service, pk=pk)
@@ -90,6 +189,23 @@ class EndpointViewset(viewsets.ModelViewSet):
     queryset = Endpoint.objects.all()
     serializer_class = EndpointSerializer
 
+    @action(detail=True, methods=["get"])
+    def rollups(self, request, pk=None):
+        endpoint = get_object_or_404(Endpoint, pk=pk)
+        return rollup_response(request, "endpoint", endpoint.pk)
+
+    @action(detail=True, methods=["get"])
+    def history(self, request, pk=None):
+        """
+        Logs of the endpoint in [`start`, `end`), the last day by default, from the log table and the archive
+        """
+        endpoint = get_object_or_404(Endpoint, pk=pk)
+        try:
+            start, end = get_window(request, datetime.timedelta(days=1))
+        except ValueError as error:
+            return Response({"error": str(error)}, status=400)
+        return Response(query_logs("endpoint", endpoint.pk, start, end), status=200)
+
 
 class CronHandlerViewset(viewsets.ModelViewSet):
     queryset = CronHandler.objects.all()
@@ -193,6 +309,64 @@ def guest_subscribe(request, pk=None):
     return Response({"success": message}, status=201)
 
 
+@api_view(["GET", "POST"])
+@permission_classes([AllowAny])
+def cron_heartbeat(request, token=None):
+    """
+    Pushes the heartbeat deadline of the cron forward by its period and ends its outage
+    """
+    cron = get_object_or_404(CronHandler, token=token)
+    CronHandler.objects.filter(pk=cron.pk).update(
+        next_run_at=timezone.now() + datetime.timedelta(seconds=cron.period)
+    )
+    record_heartbeat(cron)
+    return Response({"success": "Heartbeat recorded."}, status=200)
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def probe_rate(request):
+    """
+    Probes released per second, over the last `window` seconds
+    """
+    try:
+        window = int(request.query_params.get("window", 60))
+    except ValueError:
+        return Response({"error": "Window should be an integer."}, status=400)
+    return Response(get_probe_rate(window=window), status=200)
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def match_time(request):
+    """
+    Endpoints with the most expensive keyword/status patterns
+    """
+    try:
+        limit = int(request.query_params.get("limit", 20))
+    except ValueError:
+        return Response({"error": "Limit should be an integer."}, status=400)
+    return Response({"endpoints": get_slowest_matches(limit=limit)}, status=200)
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def dns_stats(request):
+    """
+    Hit rate of the resolver cache shared by the probes
+    """
+    return Response(get_dns_stats(), status=200)
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def log_writes(request):
+    """
+    Rows written by the log writers and their throughput
+    """
+    return Response(get_log_write_stats(), status=200)
+
+
 class LogViewset(DocumentViewSet):
     document = LogDocument
     serializer_class = LogDocumentSerializer
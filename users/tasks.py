@@ -1,10 +1,8 @@
 from core.celery import app
 from .models import User, Team, TeamAssignment
-from logger.tasks import (
-    send_email_notification,
-    send_text_notification,
-    send_webhook_notification,
-)
+
+# logger.tasks imports this module too, names are looked up when the tasks run
+from logger import tasks as logger_tasks
 
 
 @app.task
@@ -20,33 +18,33 @@ def notify_user(user_id, team_id, incident_id, priority="Low"):
         assignment = TeamAssignment.objects.get(user=user, team=team)
         if priority == "Low":
             if assignment.notify_via_email_low_priority:
-                send_email_notification(
+                logger_tasks.send_email_notification(
                     email=email,
                     incident_id=incident_id,
                 )
             if assignment.notify_via_phone_low_priority:
-                send_text_notification(
+                logger_tasks.send_text_notification(
                     phone_number=user.phone_number,
                     incident_id=incident_id,
                 )
             if assignment.notify_via_webhooks_low_priority:
-                send_webhook_notification(
+                logger_tasks.send_webhook_notification(
                     webhook_url=assignment.webhook_url,
                     incident_id=incident_id,
                 )
         else:
             if assignment.notify_via_email_high_priority:
-                send_email_notification(
+                logger_tasks.send_email_notification(
                     email=email,
                     incident_id=incident_id,
                 )
             if assignment.notify_via_phone_high_priority:
-                send_text_notification(
+                logger_tasks.send_text_notification(
                     phone_number=user.phone_number,
                     incident_id=incident_id,
                 )
             if assignment.notify_via_webhooks_high_priority:
-                send_webhook_notification(
+                logger_tasks.send_webhook_notification(
                     webhook_url=assignment.webhook_url,
                     incident_id=incident_id,
                 )
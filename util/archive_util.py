@@ -0,0 +1,189 @@
+import os
+import json
+import shutil
+import datetime
+import numpy as np
+from pathlib import Path
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from logger.models import Log
+
+# one directory per entity and day, e.g. endpoint/42/2023-10-18/, holding a file per column
+# timestamps are unix milliseconds, sorted
+TIMESTAMPS = "timestamps.npy"
+# 1 when the log is DOWN, packed 8 logs per byte
+STATUSES = "statuses.npy"
+# seconds, NaN when there's none
+RESPONSE_TIMES = "response_times.npy"
+# index in the day's messages, 0 when there's none
+MESSAGE_CODES = "message_codes.npy"
+MESSAGES = "messages.json"
+
+
+def get_day_path(model, entity_id, day):
+    return Path(settings.LOG_ARCHIVE_ROOT) / model / str(entity_id) / day.isoformat()
+
+
+def to_milliseconds(moment):
+    return int(moment.timestamp() * 1000)
+
+
+def read_day(model, entity_id, day):
+    """
+    Returns the columns archived for the entity on that day, memory-mapped, or None when there's no archive
+    """
+    path = get_day_path(model, entity_id, day)
+    if not path.exists():
+        return None
+    timestamps = np.load(path / TIMESTAMPS, mmap_mode="r")
+    return {
+        "timestamps": timestamps,
+        "down": np.unpackbits(np.load(path / STATUSES, mmap_mode="r"))[
+            : len(timestamps)
+        ].astype(bool),
+        "response_times": np.load(path / RESPONSE_TIMES, mmap_mode="r"),
+        "message_codes": np.load(path / MESSAGE_CODES, mmap_mode="r"),
+        "messages": json.loads((path / MESSAGES).read_text()),
+    }
+
+
+def write_day(model, entity_id, day, timestamps, down, response_times, messages):
+    """
+    Writes the logs of the entity on that day, merged with what's already archived
+    Rows already in the archive aren't added twice, so an interrupted archive can be run again
+    The day is written next to the old one and swapped in, readers never see half a day
+    """
+    codes = {None: 0}
+    message_codes = [codes.setdefault(message, len(codes)) for message in messages]
+    existing = read_day(model, entity_id, day)
+    if existing is not None:
+        for message in existing["messages"][1:]:
+            codes.setdefault(message, len(codes))
+        # codes of the archived messages in the merged day
+        remap = np.array(
+            [codes[message] for message in existing["messages"]], dtype=np.uint32
+        )
+        timestamps = np.concatenate([existing["timestamps"], timestamps])
+        down = np.concatenate([existing["down"], down])
+        response_times = np.concatenate([existing["response_times"], response_times])
+        message_codes = np.concatenate(
+            [remap[existing["message_codes"]], message_codes]
+        )
+
+    rows = np.empty(
+        len(timestamps),
+        dtype=[
+            ("timestamp", np.int64),
+            ("down", bool),
+            ("response_time", np.float32),
+            ("message_code", np.uint32),
+        ],
+    )
+    rows["timestamp"] = timestamps
+    rows["down"] = down
+    rows["response_time"] = response_times
+    rows["message_code"] = message_codes
+    # sorts by timestamp, then the other columns, and drops duplicates
+    # NaN never equals itself, duplicates are found on a copy without them
+    key = rows.copy()
+    key["response_time"] = np.nan_to_num(key["response_time"], nan=-np.inf)
+    rows = rows[np.unique(key, return_index=True)[1]]
+
+    path = get_day_path(model, entity_id, day)
+    staging = path.with_name(path.name + ".tmp")
+    shutil.rmtree(staging, ignore_errors=True)
+    staging.mkdir(parents=True)
+    np.save(staging / TIMESTAMPS, rows["timestamp"])
+    np.save(staging / STATUSES, np.packbits(rows["down"]))
+    np.save(staging / RESPONSE_TIMES, rows["response_time"])
+    # the fewest bits which hold every code of the day
+    np.save(
+        staging / MESSAGE_CODES,
+        rows["message_code"].astype(np.min_scalar_type(len(codes))),
+    )
+    (staging / MESSAGES).write_text(json.dumps(list(codes)))
+    if path.exists():
+        retired = path.with_name(path.name + ".old")
+        shutil.rmtree(retired, ignore_errors=True)
+        os.replace(path, retired)
+        os.replace(staging, path)
+        shutil.rmtree(retired)
+    else:
+        os.replace(staging, path)
+    return len(rows)
+
+
+def read_slice(model, entity_id, day, start, end):
+    """
+    Returns the columns archived for the entity on that day, restricted to [start, end)
+    """
+    archive = read_day(model, entity_id, day)
+    # timestamps are sorted, slice the memory-mapped columns instead of scanning them
+    low, high = np.searchsorted(
+        archive["timestamps"], [to_milliseconds(start), to_milliseconds(end)]
+    )
+    return {
+        name: values if name == "messages" else values[low:high]
+        for name, values in archive.items()
+    }
+
+
+def get_archived_days(model, entity_id, start, end):
+    """
+    Returns the days in [start, end) which have an archive for the entity
+    """
+    day = start.astimezone(datetime.timezone.utc).date()
+    last = end.astimezone(datetime.timezone.utc).date()
+    days = []
+    while day <= last:
+        if get_day_path(model, entity_id, day).exists():
+            days.append(day)
+        day += datetime.timedelta(days=1)
+    return days
+
+
+def query_logs(model, entity_id, start, end):
+    """
+    Returns the logs of the entity in [start, end) as columns, from the archive for the days it holds
+    and from the log table for the rest
+    """
+    archived_days = set(get_archived_days(model, entity_id, start, end))
+    columns = {"timestamps": [], "statuses": [], "response_times": [], "messages": []}
+
+    for day in sorted(archived_days):
+        archive = read_slice(model, entity_id, day, start, end)
+        messages = archive["messages"]
+        columns["timestamps"].extend(archive["timestamps"].tolist())
+        columns["statuses"].extend("DOWN" if down else "UP" for down in archive["down"])
+        columns["response_times"].extend(
+            # float32 keeps about 7 digits, the log table keeps 4 decimals
+            None if np.isnan(value) else round(value, 4)
+            for value in archive["response_times"].tolist()
+        )
+        columns["messages"].extend(
+            messages[code] for code in archive["message_codes"].tolist()
+        )
+
+    logs = (
+        Log.objects.between(start, end)
+        .filter(
+            entity_type=ContentType.objects.get_by_natural_key("logger", model),
+            entity_id=entity_id,
+        )
+        .order_by("created_at")
+        .values_list("created_at", "status", "response_time", "message")
+    )
+    for created_at, status, response_time, message in logs.iterator():
+        # days being archived can still be in the log table, the archive has them all
+        if created_at.astimezone(datetime.timezone.utc).date() in archived_days:
+            continue
+        columns["timestamps"].append(to_milliseconds(created_at))
+        columns["statuses"].append(status)
+        columns["response_times"].append(
+            None if response_time is None else float(response_time)
+        )
+        columns["messages"].append(message)
+
+    # archived days come before the hot ones, except when the log table still holds older days
+    order = np.argsort(np.array(columns["timestamps"], dtype=np.int64), kind="stable")
+    return {name: [values[i] for i in order] for name, values in columns.items()}
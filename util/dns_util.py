@@ -0,0 +1,153 @@
+import time
+import socket
+import asyncio
+import ipaddress
+import dns.resolver
+import dns.exception
+import dns.asyncresolver
+from aiohttp.abc import AbstractResolver
+from django.conf import settings
+
+# record types looked up for every host, along with their address family
+RECORD_TYPES = (("A", socket.AF_INET), ("AAAA", socket.AF_INET6))
+
+
+class ResolverCache:
+    """
+    Worker-lifetime resolver cache shared by every probe
+    Answers are kept for their TTL, hosts which don't resolve are cached for DNS_NEGATIVE_TTL
+    Concurrent lookups of the same host share a single query
+    """
+
+    def __init__(self):
+        self.entries = {}
+        self.pending = {}
+        self.resolver = None
+        self.stats = {"hits": 0, "misses": 0, "negative_hits": 0}
+
+    def get_resolver(self):
+        if self.resolver is None:
+            self.resolver = dns.asyncresolver.Resolver()
+            self.resolver.lifetime = settings.DNS_TIMEOUT
+        return self.resolver
+
+    async def resolve(self, host):
+        """
+        Returns the list of (family, address) pairs for the given host
+        Raises OSError when the host doesn't resolve
+        """
+        try:
+            address = ipaddress.ip_address(host)
+            family = socket.AF_INET6 if address.version == 6 else socket.AF_INET
+            return [(family, host)]
+        except ValueError:
+            pass
+
+        entry = self.entries.get(host)
+        if entry is not None and entry[1] > time.monotonic():
+            if entry[0] is None:
+                self.stats["negative_hits"] += 1
+                raise OSError(f"Couldn't resolve {host} (cached)")
+            self.stats["hits"] += 1
+            return entry[0]
+
+        self.stats["misses"] += 1
+        future = self.pending.get(host)
+        if future is None:
+            future = asyncio.ensure_future(self.lookup(host))
+            self.pending[host] = future
+            future.add_done_callback(lambda _: self.pending.pop(host, None))
+        addresses = await asyncio.shield(future)
+        if addresses is None:
+            raise OSError(f"Couldn't resolve {host}")
+        return addresses
+
+    async def lookup(self, host):
+        """
+        Queries the A and AAAA records concurrently and caches the answer
+        Falls back to the system resolver, so /etc/hosts and search domains keep working
+        """
+        resolver = self.get_resolver()
+        answers = await asyncio.gather(
+            *[resolver.resolve(host, record) for record, _ in RECORD_TYPES],
+            return_exceptions=True,
+        )
+
+        addresses = []
+        ttl = settings.DNS_MAX_TTL
+        for (_, family), answer in zip(RECORD_TYPES, answers):
+            if isinstance(answer, BaseException):
+                continue
+            ttl = min(ttl, answer.rrset.ttl)
+            addresses.extend((family, record.address) for record in answer)
+
+        if not addresses:
+            try:
+                infos = await asyncio.get_running_loop().getaddrinfo(
+                    host, None, type=socket.SOCK_STREAM
+                )
+                addresses = [(info[0], info[4][0]) for info in infos]
+                ttl = settings.DNS_MIN_TTL
+            except OSError:
+                pass
+
+        if addresses:
+            ttl = max(ttl, settings.DNS_MIN_TTL)
+            self.entries[host] = (addresses, time.monotonic() + ttl)
+            return addresses
+
+        # only cache definite answers, timeouts are retried on the next lookup
+        if any(
+            isinstance(answer, (dns.resolver.NXDOMAIN, dns.resolver.NoAnswer))
+            for answer in answers
+        ):
+            self.entries[host] = (
+                None,
+                time.monotonic() + settings.DNS_NEGATIVE_TTL,
+            )
+        return None
+
+    def pop_stats(self):
+        """
+        Returns the hit/miss counters since the last call and resets them
+        """
+        stats = self.stats
+        self.stats = {"hits": 0, "misses": 0, "negative_hits": 0}
+        return stats
+
+
+class CachingResolver(AbstractResolver):
+    """
+    aiohttp resolver backed by the shared resolver cache
+    """
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    async def resolve(self, host, port=0, family=socket.AF_INET):
+        addresses = await self.cache.resolve(host)
+        return [
+            {
+                "hostname": host,
+                "host": address,
+                "port": port,
+                "family": address_family,
+                "proto": 0,
+                "flags": socket.AI_NUMERICHOST,
+            }
+            for address_family, address in addresses
+            if family == socket.AF_UNSPEC or family == address_family
+        ]
+
+    async def close(self):
+        pass
+
+
+resolver_cache = ResolverCache()
+
+
+def resolve(host):
+    """
+    Resolves the host through the shared resolver cache, outside of the probe engine
+    """
+    return asyncio.run(resolver_cache.resolve(host))
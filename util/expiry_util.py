@@ -0,0 +1,154 @@
+import json
+import socket
+import datetime
+import ipaddress
+import requests
+from urllib.parse import urlsplit
+from cryptography import x509
+from django.conf import settings
+from .redis_util import get_redis
+from .tls_util import get_ssl_context
+from .socket_util import IMPLICIT_TLS_PORTS, get_address
+
+CERTIFICATE_KEY = "expiry:certificate:{}:{}"
+DOMAIN_KEY = "expiry:domain:{}"
+CHECK_KEY = "expiry:checked:{}:{}"
+
+
+def is_ip_address(host):
+    try:
+        ipaddress.ip_address(host)
+        return True
+    except ValueError:
+        return False
+
+
+def get_tls_address(url, port=None, logger_type=None):
+    """
+    Returns the host of the endpoint and the port its certificate is served on
+    The port is None when the endpoint doesn't speak TLS
+    """
+    if logger_type in IMPLICIT_TLS_PORTS:
+        host, port = get_address(url, port, logger_type)
+        return host, port if port in IMPLICIT_TLS_PORTS[logger_type] else None
+    parts = urlsplit(url)
+    if parts.scheme.lower() == "https":
+        return parts.hostname, parts.port or 443
+    return parts.hostname, None
+
+
+def fetch_certificate_expiry(host, port):
+    """
+    Returns when the certificate served by host:port expires
+    Verification is skipped, so expired and self-signed certificates are still read
+    """
+    context = get_ssl_context(verify_ssl=False)
+    with socket.create_connection(
+        (host, port), timeout=settings.EXPIRY_TIMEOUT
+    ) as sock:
+        with context.wrap_socket(sock, server_hostname=host) as ssock:
+            certificate = x509.load_der_x509_certificate(
+                ssock.getpeercert(binary_form=True)
+            )
+    return certificate.not_valid_after.replace(tzinfo=datetime.timezone.utc)
+
+
+def fetch_domain_expiry(domain):
+    """
+    Returns when the registration of the domain expires, through RDAP
+    Returns False when the registry doesn't know the domain, None when it doesn't publish the date
+    Lookups which fail raise
+    """
+    response = requests.get(
+        settings.RDAP_URL + domain,
+        timeout=settings.EXPIRY_TIMEOUT,
+        headers={"Accept": "application/rdap+json"},
+    )
+    if response.status_code == 404:
+        return False
+    response.raise_for_status()
+    for event in response.json().get("events", []):
+        if event.get("eventAction") == "expiration":
+            return datetime.datetime.fromisoformat(
+                event["eventDate"].replace("Z", "+00:00")
+            )
+    return None
+
+
+def cached(key, fetch):
+    """
+    Returns the cached expiry date, fetching it at most once per EXPIRY_CACHE_TTL
+    Failed lookups return False and are cached for EXPIRY_RETRY_TTL, so an unreachable host isn't retried on every run
+    """
+    client = get_redis()
+    value = client.get(key)
+    if value is not None:
+        value = json.loads(value)
+        return datetime.datetime.fromisoformat(value) if value else value
+
+    ttl = settings.EXPIRY_CACHE_TTL
+    try:
+        expires_at = fetch()
+    except (OSError, ValueError, requests.RequestException):
+        expires_at = False
+        ttl = settings.EXPIRY_RETRY_TTL
+    client.set(
+        key,
+        json.dumps(expires_at.isoformat() if expires_at else expires_at),
+        ex=ttl,
+    )
+    return expires_at
+
+
+def get_certificate_expiry(host, port=443):
+    return cached(
+        CERTIFICATE_KEY.format(host, port),
+        lambda: fetch_certificate_expiry(host, port),
+    )
+
+
+def get_domain_expiry(host):
+    """
+    Returns when the domain the host belongs to expires
+    Labels are stripped from the left until the registry answers for the domain, subdomains share the lookup
+    A lookup which fails moves on to the parent domain too, False is returned when no lookup got an answer
+    """
+    if is_ip_address(host):
+        return None
+    labels = host.rstrip(".").lower().split(".")
+    for index in range(len(labels) - 1):
+        domain = ".".join(labels[index:])
+        expires_at = cached(
+            DOMAIN_KEY.format(domain), lambda: fetch_domain_expiry(domain)
+        )
+        if expires_at is not False:
+            return expires_at
+    return False
+
+
+def claim_check(host, port=None):
+    """
+    Returns whether the host is due for a check, at most once per EXPIRY_CACHE_TTL
+    The claim is atomic, so overlapping runs don't check the same host twice
+    """
+    return bool(
+        get_redis().set(
+            CHECK_KEY.format(host, port), 1, nx=True, ex=settings.EXPIRY_CACHE_TTL
+        )
+    )
+
+
+def retry_check(host, port=None):
+    """
+    Shortens the claim on the host to EXPIRY_RETRY_TTL, once a lookup failed
+    Dates which were found stay cached, only the failed lookups are fetched again
+    """
+    get_redis().expire(CHECK_KEY.format(host, port), settings.EXPIRY_RETRY_TTL)
+
+
+def get_days_left(expires_at, now=None):
+    if not expires_at:
+        return None
+    if now is None:
+        now = datetime.datetime.now(datetime.timezone.utc)
+    return (expires_at - now).days
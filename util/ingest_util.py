@@ -0,0 +1,115 @@
+import io
+import time
+import logging
+import traceback
+from django.conf import settings
+from django.db import connection, transaction, DatabaseError
+from .metrics_util import record_log_writes
+
+
+def escape(value):
+    """
+    Returns the value in the text format of COPY, None is written as NULL
+    """
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+class LogWriter:
+    """
+    Buffers log rows and writes them in batches of at most LOG_FLUSH_SIZE rows, whatever is left on flush()
+    Postgres gets the rows through COPY FROM STDIN, other backends through bulk_create
+    """
+
+    def __init__(self, model, on_flush=None):
+        self.model = model
+        # called with the written instances, e.g. to update the search index
+        self.on_flush = on_flush
+        self.fields = [
+            field for field in model._meta.concrete_fields if not field.primary_key
+        ]
+        self.rows = []
+        # rows in the text format of COPY, without their id
+        self.lines = []
+
+    def add(self, **values):
+        """
+        Buffers a row given the values of its fields, missing fields get their default
+        """
+        row = {}
+        for field in self.fields:
+            row[field.attname] = values.get(field.attname, field.get_default())
+        self.rows.append(row)
+        if connection.vendor == "postgresql":
+            self.lines.append(
+                "\t".join(
+                    escape(field.get_db_prep_save(row[field.attname], connection))
+                    for field in self.fields
+                )
+            )
+        if len(self.rows) >= settings.LOG_FLUSH_SIZE:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes every buffered row and returns the written instances
+        Falls back to bulk_create when COPY fails, so a bad batch surfaces the failing row instead of being lost
+        """
+        if not self.rows:
+            return []
+        rows, lines = self.rows, self.lines
+        self.rows, self.lines = [], []
+
+        started = time.monotonic()
+        instances = None
+        if connection.vendor == "postgresql":
+            try:
+                instances = self.copy(rows, lines)
+            except (DatabaseError, connection.Database.Error):
+                # copy_expert raises the driver's errors, Django only wraps execute()
+                logging.getLogger("error_logger").error(traceback.format_exc())
+        if instances is None:
+            instances = self.model.objects.bulk_create(
+                [self.model(**row) for row in rows]
+            )
+        record_log_writes(len(instances), time.monotonic() - started)
+
+        if self.on_flush is not None:
+            self.on_flush(instances)
+        return instances
+
+    def copy(self, rows, lines):
+        """
+        Streams the rows into the table with COPY, ids are reserved from the sequence upfront
+        so the written instances can be returned, as bulk_create does
+        """
+        table = self.model._meta.db_table
+        pk = self.model._meta.pk.column
+        columns = ", ".join(
+            connection.ops.quote_name(column)
+            for column in [pk] + [field.column for field in self.fields]
+        )
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT nextval(pg_get_serial_sequence(%s, %s)) FROM generate_series(1, %s)",
+                [table, pk, len(rows)],
+            )
+            ids = [row[0] for row in cursor.fetchall()]
+            data = io.StringIO()
+            for log_id, line in zip(ids, lines):
+                data.write(f"{log_id}\t{line}\n")
+            data.seek(0)
+            cursor.cursor.copy_expert(
+                f"COPY {connection.ops.quote_name(table)} ({columns}) FROM STDIN",
+                data,
+            )
+        return [self.model(pk=log_id, **row) for log_id, row in zip(ids, rows)]
@@ -0,0 +1,110 @@
+import math
+from django.conf import settings
+from .redis_util import get_redis
+
+# per endpoint and region, most recent first, timeouts are kept as -1
+LATENCY_KEY = "latency:{}"
+TIMED_OUT = -1
+# weight of the newest sample in the moving average
+EWMA_ALPHA = 0.2
+
+
+def get_latency_key(endpoint_id, region=None):
+    return LATENCY_KEY.format(f"{endpoint_id}:{region}" if region else endpoint_id)
+
+
+def get_samples(endpoint_ids, region=None):
+    """
+    Returns {endpoint id: recent probe durations}, oldest first, None marks a timeout
+    Regions are far apart, each one keeps its own samples
+    """
+    pipeline = get_redis().pipeline()
+    for endpoint_id in endpoint_ids:
+        pipeline.lrange(get_latency_key(endpoint_id, region), 0, -1)
+    samples = {}
+    for endpoint_id, values in zip(endpoint_ids, pipeline.execute()):
+        samples[endpoint_id] = [
+            None if float(value) == TIMED_OUT else float(value)
+            for value in reversed(values)
+        ]
+    return samples
+
+
+def record_samples(results, samples=None):
+    """
+    Adds the duration of every probe which completed, or a timeout marker, to the endpoint's samples
+    Failures which aren't timeouts, such as refused connections, say nothing about latency
+    The samples returned by get_samples can be given to be kept up to date as well
+    """
+    pipeline = get_redis().pipeline()
+    for result in results:
+        if result.get("timed_out"):
+            sample = TIMED_OUT
+        elif result.get("response_time", -1) >= 0:
+            sample = result["response_time"] + (result.get("transfer_time") or 0)
+        else:
+            continue
+        key = get_latency_key(result["endpoint_id"], result.get("region"))
+        pipeline.lpush(key, sample)
+        pipeline.ltrim(key, 0, settings.LATENCY_SAMPLES - 1)
+        if samples is not None and result["endpoint_id"] in samples:
+            samples[result["endpoint_id"]].append(
+                None if sample == TIMED_OUT else sample
+            )
+    pipeline.execute()
+
+
+def get_ewma(values):
+    ewma = values[0]
+    for value in values[1:]:
+        ewma = EWMA_ALPHA * value + (1 - EWMA_ALPHA) * ewma
+    return ewma
+
+
+def get_percentile(values, percentile):
+    values = sorted(values)
+    index = math.ceil(percentile / 100 * len(values)) - 1
+    return values[max(index, 0)]
+
+
+def get_adaptive_timeout(samples, timeout):
+    """
+    Returns how long a probe may take before it's clearly outside of the endpoint's normal range
+    ADAPTIVE_MULTIPLIER times the larger of the moving average and the high percentile, never above the configured timeout
+    Falls back to the configured timeout until there are enough samples
+    """
+    durations = [sample for sample in samples if sample is not None]
+    if len(durations) < settings.ADAPTIVE_MIN_SAMPLES:
+        return timeout
+    normal = max(
+        get_ewma(durations), get_percentile(durations, settings.ADAPTIVE_PERCENTILE)
+    )
+    return min(
+        timeout,
+        max(settings.ADAPTIVE_MIN_TIMEOUT, settings.ADAPTIVE_MULTIPLIER * normal),
+    )
+
+
+def get_lane(samples, lane):
+    """
+    Returns the lane the endpoint belongs in given its recent samples
+    Endpoints which time out or are slow too often move to the slow lane
+    they come back once both are under half of the thresholds, so they don't flap between lanes
+    """
+    recent = samples[-settings.LANE_WINDOW :]
+    if len(recent) < settings.LANE_MIN_SAMPLES:
+        return lane
+    durations = [sample for sample in recent if sample is not None]
+    timeout_rate = 100 * (len(recent) - len(durations)) / len(recent)
+    latency = get_percentile(durations, 95) if durations else math.inf
+    if (
+        timeout_rate >= settings.SLOW_LANE_TIMEOUT_RATE
+        or latency >= settings.SLOW_LANE_LATENCY
+    ):
+        return "slow"
+    if (
+        timeout_rate < settings.SLOW_LANE_TIMEOUT_RATE / 2
+        and latency < settings.SLOW_LANE_LATENCY / 2
+    ):
+        return "fast"
+    return lane
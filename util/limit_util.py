@@ -0,0 +1,84 @@
+import time
+import asyncio
+
+# host => limiter, kept for the lifetime of the worker so the token buckets carry over between cycles
+_limiters = {}
+
+
+class TokenBucket:
+    """
+    Lets `rate` requests per second through, with bursts of up to `rate` requests
+    """
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.capacity = max(rate, 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(
+                self.capacity, self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class OriginLimiter:
+    """
+    Caps the requests in flight and, optionally, the requests per second sent to a single host
+    0 disables either limit
+    """
+
+    def __init__(self, concurrency=0, rate=0):
+        self.limits = (concurrency, rate)
+        self.semaphore = asyncio.Semaphore(concurrency) if concurrency else None
+        self.bucket = TokenBucket(rate) if rate else None
+
+    async def __aenter__(self):
+        if self.semaphore is not None:
+            await self.semaphore.acquire()
+        if self.bucket is not None:
+            await self.bucket.acquire()
+        return self
+
+    async def __aexit__(self, *args):
+        if self.semaphore is not None:
+            self.semaphore.release()
+
+
+def strictest(first, second):
+    """
+    Returns the lower of two limits, where 0 means unlimited
+    """
+    if not first or not second:
+        return first or second
+    return min(first, second)
+
+
+def get_limiters(requests):
+    """
+    Returns the limiter of every host the requests go to
+    Endpoints sharing a host share its limiter, which enforces the strictest limits among them
+    """
+    limits = {}
+    for request in requests:
+        concurrency, rate = limits.get(request["host"], (None, None))
+        limits[request["host"]] = (
+            strictest(concurrency, request["origin_concurrency"]),
+            strictest(rate, request["origin_rate"]),
+        )
+
+    limiters = {}
+    for host, (concurrency, rate) in limits.items():
+        limiter = _limiters.get(host)
+        if limiter is None or limiter.limits != (concurrency, rate):
+            limiter = OriginLimiter(concurrency, rate)
+            _limiters[host] = limiter
+        limiters[host] = limiter
+    return limiters
@@ -5,6 +5,11 @@ import ssl
 import re
 from random import choice
 from string import ascii_uppercase
+from .pool_util import session_pool
+from django.conf import settings
+from .match_util import search, stream_search
+from .dns_util import resolve
+from .tls_util import get_ssl_context, store_session
 
 # remove warnings
 # requests.packages.urllib3.disable_warnings(
@@ -15,20 +20,21 @@ requests.urllib3.disable_warnings()
 # TODO: hostname in serializer and auth credentials as nested serializers
 
 
-def get_dns_lookup_time(ip):
+def get_dns_lookup_time(hostname):
     """
-    Returns the dns lookup time in seconds
+    Returns the forward dns lookup time in seconds
+    The lookup goes through the resolver cache shared with the probes
     """
     try:
         start_time = time.time()
-        socket.gethostbyaddr(ip)
+        resolve(hostname)
         end_time = time.time()
         dns_lookup_time = end_time - start_time
         return dns_lookup_time
 
-    except socket.gaierror as e:
+    except OSError as e:
         # handle DNS resolution errors
-        print(ip, e)
+        print(hostname, e)
         return None
 
     except:
@@ -133,41 +139,27 @@ def get_ssl_handshake_time(
             username = auth.get("username", None)
             password = auth.get("password", None)
 
+        # the shared context offers the last session of the host, so repeated checks resume it
+        context = get_ssl_context(verify_ssl=True)
+        host = ip if hostname is None else hostname
         # start the timer
         start_time = time.monotonic()
-        context = ssl.create_default_context()
         elapsed_time = 0
-        if ip is None:
-            url = f"{protocol.lower()}://{hostname}"
-            with socket.create_connection((url, 443)) as sock:
-                with context.wrap_socket(sock, server_hostname=url) as ssock:
-                    end_time = 0
-
-                    if auth is None:
-                        end_time = time.monotonic()
-                    else:
-                        # Send authentication data to the server
-                        ssock.sendall(f"{username}:{password}".encode("utf-8"))
-                        # Manually perform the SSL/TLS handshake
-                        ssock.do_handshake()
-                        end_time = time.monotonic()
-
-                    elapsed_time = end_time - start_time
-        else:
-            with socket.create_connection((ip, 443)) as sock:
-                with context.wrap_socket(sock, server_hostname=ip) as ssock:
-                    end_time = 0
-
-                    if auth is None:
-                        end_time = time.monotonic()
-                    else:
-                        # Send authentication data to the server
-                        ssock.sendall(f"{username}:{password}".encode("utf-8"))
-                        # Manually perform the SSL/TLS handshake
-                        ssock.do_handshake()
-                        end_time = time.monotonic()
-
-                    elapsed_time = end_time - start_time
+        with socket.create_connection((host, port)) as sock:
+            with context.wrap_socket(sock, server_hostname=host) as ssock:
+                end_time = 0
+
+                if auth is None:
+                    end_time = time.monotonic()
+                else:
+                    # Send authentication data to the server
+                    ssock.sendall(f"{username}:{password}".encode("utf-8"))
+                    # Manually perform the SSL/TLS handshake
+                    ssock.do_handshake()
+                    end_time = time.monotonic()
+
+                elapsed_time = end_time - start_time
+                store_session(ssock)
         return elapsed_time
 
     except ssl.SSLError as e:
@@ -335,6 +327,8 @@ def process_endpoint(endpoint):
     message = ""
     context = {}
     response = None
+    reused = False
+    downloaded = 0
     try:
         headers = (
             {
@@ -355,25 +349,31 @@ def process_endpoint(endpoint):
             else None
         )
 
-        response = requests.request(
+        response, reused = session_pool.request(
             method=endpoint.request_handler.method,
             url=endpoint.url,
+            verify_ssl=endpoint.request_handler.verify_ssl,
             headers=headers,
             data=body,
             auth=auth,
             timeout=endpoint.timeout,
-            verify=endpoint.request_handler.verify_ssl,
         )
 
         response_time = response.elapsed.total_seconds()
 
-        regex = endpoint.regex
-
-        match = (
-            re.search(regex, str(response.status_code))
-            if endpoint.logger_type == "status"
-            else re.search(regex, str(response.content))
-        )
+        if endpoint.logger_type == "status":
+            match = search(endpoint.regex, str(response.status_code))
+            # drain the body, so the connection goes back to the pool
+            downloaded = len(response.content)
+        else:
+            # stop downloading as soon as the keyword shows up
+            match, downloaded, _ = stream_search(
+                endpoint.regex,
+                response.iter_content(settings.PROBE_CHUNK_SIZE),
+                response.encoding,
+                endpoint.max_body_size,
+            )
+        response.close()
 
         message = "Request sent successfully."
 
@@ -398,6 +398,8 @@ def process_endpoint(endpoint):
             "response_time": response_time,
             "status": "UP" if match else "DOWN",
             "message": message,
+            "reused": reused,
+            "downloaded_bytes": downloaded,
         }
 
         if not match:
@@ -0,0 +1,104 @@
+import re
+import time
+import codecs
+from functools import lru_cache
+from django.conf import settings
+
+# characters which turn a pattern into a regular expression
+REGEX_METACHARACTERS = frozenset(".^$*+?{}[]\\|()")
+
+
+@lru_cache(maxsize=settings.MATCH_CACHE_SIZE)
+def get_matcher(pattern):
+    """
+    Returns the (literal, regex) pair for the given pattern, only one of them is set
+    Compiled once per worker, literal-only patterns skip the regex engine altogether
+    """
+    if REGEX_METACHARACTERS.isdisjoint(pattern):
+        return pattern, None
+    return None, re.compile(pattern)
+
+
+def search(pattern, content, encoding=None):
+    """
+    Returns whether the pattern matches the content, content could be text or bytes
+    Literal patterns are looked up in the raw bytes, regexes run on the decoded text
+    """
+    literal, regex = get_matcher(pattern)
+    encoding = encoding or "utf-8"
+    if isinstance(content, bytes):
+        if literal is not None:
+            return literal.encode(encoding, errors="ignore") in content
+        content = content.decode(encoding, errors="replace")
+
+    if literal is not None:
+        return literal in content
+    return regex.search(content) is not None
+
+
+class StreamMatcher:
+    """
+    Matches a pattern against a body fed in chunks
+    The tail of the previous window is carried over, so matches spanning two chunks aren't missed
+    Regexes keep one more character before the tail and start searching after it, so `^` and `\\A`
+    only match at the beginning of the body and lookbehinds see the character before the tail
+    """
+
+    def __init__(self, pattern, encoding=None, overlap=None):
+        self.literal, self.regex = get_matcher(pattern)
+        try:
+            encoding = codecs.lookup(encoding or "utf-8").name
+        except LookupError:
+            encoding = "utf-8"
+        if self.literal is not None:
+            self.needle = self.literal.encode(encoding, errors="ignore")
+            self.overlap = max(len(self.needle) - 1, 0)
+            self.tail = b""
+        else:
+            self.decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+            self.overlap = overlap or settings.MATCH_OVERLAP
+            self.tail = ""
+            # where the search starts within the window, past the beginning once it was cut off
+            self.pos = 0
+        # time spent matching, in seconds
+        self.elapsed = 0
+
+    def feed(self, chunk):
+        """
+        Returns whether the pattern matched within the window ending with the given chunk
+        """
+        start_time = time.perf_counter()
+        if self.literal is not None:
+            window = self.tail + chunk
+            matched = self.needle in window
+            self.tail = window[-self.overlap :] if self.overlap else window[:0]
+        else:
+            window = self.tail + self.decoder.decode(chunk)
+            matched = self.regex.search(window, self.pos) is not None
+            if len(window) > self.overlap + 1:
+                self.tail = window[-(self.overlap + 1) :]
+                self.pos = 1
+            else:
+                self.tail = window
+        self.elapsed += time.perf_counter() - start_time
+        return matched
+
+
+def stream_search(pattern, chunks, encoding=None, max_bytes=None):
+    """
+    Matches the pattern against an iterable of body chunks, stops as soon as it matches
+    Returns whether it matched, the bytes downloaded and the time spent matching
+    """
+    matcher = StreamMatcher(pattern, encoding)
+    max_bytes = max_bytes or settings.PROBE_MAX_BODY_SIZE
+    downloaded = 0
+    matched = False
+    for chunk in chunks:
+        chunk = chunk[: max_bytes - downloaded]
+        downloaded += len(chunk)
+        if matcher.feed(chunk):
+            matched = True
+            break
+        if downloaded >= max_bytes:
+            break
+    return matched, downloaded, matcher.elapsed
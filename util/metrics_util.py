@@ -0,0 +1,125 @@
+import time
+from .redis_util import get_redis
+
+PROBE_RATE_KEY = "metrics:probes:{}"
+MATCH_TIME_KEY = "metrics:match_time"
+DNS_STATS_KEY = "metrics:dns"
+LOG_WRITES_KEY = "metrics:log_writes"
+# per-second buckets are kept around for this many seconds
+PROBE_RATE_RETENTION = 3600
+
+
+def record_probes(count, timestamp=None):
+    """
+    Adds the given number of released probes to the current one-second bucket
+    """
+    if timestamp is None:
+        timestamp = time.time()
+    key = PROBE_RATE_KEY.format(int(timestamp))
+    pipeline = get_redis().pipeline()
+    pipeline.incrby(key, count)
+    pipeline.expire(key, PROBE_RATE_RETENTION)
+    pipeline.execute()
+
+
+def get_probe_rate(window=60):
+    """
+    Returns the probes released per second over the last `window` seconds
+    """
+    window = max(1, min(window, PROBE_RATE_RETENTION))
+    now = int(time.time())
+    seconds = list(range(now - window + 1, now + 1))
+    counts = get_redis().mget([PROBE_RATE_KEY.format(second) for second in seconds])
+    series = [
+        {"timestamp": second, "probes": int(count or 0)}
+        for second, count in zip(seconds, counts)
+    ]
+    total = sum(point["probes"] for point in series)
+    return {
+        "window": window,
+        "current": series[-1]["probes"],
+        "peak": max(point["probes"] for point in series),
+        "average": total / window,
+        "series": series,
+    }
+
+
+def record_match_times(match_times):
+    """
+    Keeps the latest keyword/status match time in seconds for each endpoint
+    """
+    if match_times:
+        get_redis().zadd(MATCH_TIME_KEY, match_times)
+
+
+def get_slowest_matches(limit=20):
+    """
+    Returns the endpoints with the most expensive patterns, slowest first
+    """
+    entries = get_redis().zrevrange(MATCH_TIME_KEY, 0, limit - 1, withscores=True)
+    return [
+        {"endpoint_id": int(endpoint_id), "match_time": match_time}
+        for endpoint_id, match_time in entries
+    ]
+
+
+def record_dns_stats(stats):
+    """
+    Adds the resolver cache counters of a probe cycle to the running totals
+    """
+    if any(stats.values()):
+        pipeline = get_redis().pipeline()
+        for name, count in stats.items():
+            pipeline.hincrby(DNS_STATS_KEY, name, count)
+        pipeline.execute()
+
+
+def get_dns_stats():
+    """
+    Returns the resolver cache counters and the hit rate across the probe fleet
+    """
+    stats = {
+        name.decode(): int(count)
+        for name, count in get_redis().hgetall(DNS_STATS_KEY).items()
+    }
+    hits = stats.get("hits", 0)
+    negative_hits = stats.get("negative_hits", 0)
+    lookups = hits + negative_hits + stats.get("misses", 0)
+    return {
+        "hits": hits,
+        "negative_hits": negative_hits,
+        "misses": stats.get("misses", 0),
+        "hit_rate": (hits + negative_hits) / lookups if lookups else None,
+    }
+
+
+def record_log_writes(rows, seconds):
+    """
+    Adds a flush of the log writer to the running totals
+    """
+    pipeline = get_redis().pipeline()
+    pipeline.hincrby(LOG_WRITES_KEY, "rows", rows)
+    pipeline.hincrby(LOG_WRITES_KEY, "flushes", 1)
+    pipeline.hincrbyfloat(LOG_WRITES_KEY, "seconds", seconds)
+    pipeline.hset(
+        LOG_WRITES_KEY, "last_rows_per_second", rows / seconds if seconds else 0
+    )
+    pipeline.execute()
+
+
+def get_log_write_stats():
+    """
+    Returns the rows written, the flushes and the write throughput in rows per second
+    """
+    stats = {
+        name.decode(): float(value)
+        for name, value in get_redis().hgetall(LOG_WRITES_KEY).items()
+    }
+    rows = int(stats.get("rows", 0))
+    seconds = stats.get("seconds", 0)
+    return {
+        "rows": rows,
+        "flushes": int(stats.get("flushes", 0)),
+        "rows_per_second": rows / seconds if seconds else None,
+        "last_rows_per_second": stats.get("last_rows_per_second"),
+    }
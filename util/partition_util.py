@@ -0,0 +1,143 @@
+import re
+import datetime
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+# partitions are named after their bounds, e.g. logger_log_20231018_20231019
+PARTITION_NAME = "{table}_{start:%Y%m%d}_{end:%Y%m%d}"
+PARTITION_PATTERN = re.compile(r"_(\d{8})_(\d{8})$")
+# catches the rows outside of every partition, e.g. when the partitions weren't created in time
+DEFAULT_PARTITION_NAME = "{table}_default"
+
+
+def is_partitioned(table):
+    if connection.vendor != "postgresql":
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)",
+            [table],
+        )
+        return cursor.fetchone() is not None
+
+
+def get_partition_bounds(moment, interval=None):
+    """
+    Returns the [start, end) of the day or the week (from monday) the moment falls in, in UTC
+    """
+    interval = interval or settings.LOG_PARTITION_INTERVAL
+    day = moment.astimezone(datetime.timezone.utc).date()
+    if interval == "week":
+        start, length = day - datetime.timedelta(days=day.weekday()), 7
+    else:
+        start, length = day, 1
+    start = datetime.datetime.combine(start, datetime.time(), datetime.timezone.utc)
+    return start, start + datetime.timedelta(days=length)
+
+
+def get_partitions(table):
+    """
+    Returns the (name, start, end) of the range partitions of the table, the default partition is left out
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT child.relname FROM pg_inherits
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE pg_inherits.inhparent = to_regclass(%s)
+            """,
+            [table],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    partitions = []
+    for name in names:
+        match = PARTITION_PATTERN.search(name)
+        if match:
+            start, end = (
+                datetime.datetime.strptime(bound, "%Y%m%d").replace(
+                    tzinfo=datetime.timezone.utc
+                )
+                for bound in match.groups()
+            )
+            partitions.append((name, start, end))
+    return sorted(partitions, key=lambda partition: partition[1])
+
+
+def create_partition(cursor, table, name, start, end):
+    """
+    Creates the partition holding [start, end)
+    Rows which already landed in the default partition for that range are moved into it
+    """
+    parent = connection.ops.quote_name(table)
+    default = connection.ops.quote_name(DEFAULT_PARTITION_NAME.format(table=table))
+    create = (
+        f"CREATE TABLE {connection.ops.quote_name(name)} "
+        f"PARTITION OF {parent} FOR VALUES FROM (%s) TO (%s)"
+    )
+    cursor.execute(
+        f"SELECT 1 FROM {default} WHERE created_at >= %s AND created_at < %s LIMIT 1",
+        [start, end],
+    )
+    if cursor.fetchone() is None:
+        cursor.execute(create, [start, end])
+        return
+    with transaction.atomic():
+        cursor.execute(f"ALTER TABLE {parent} DETACH PARTITION {default}")
+        cursor.execute(create, [start, end])
+        cursor.execute(
+            f"WITH moved AS (DELETE FROM {default} WHERE created_at >= %s AND created_at < %s RETURNING *) "
+            f"INSERT INTO {parent} SELECT * FROM moved",
+            [start, end],
+        )
+        cursor.execute(f"ALTER TABLE {parent} ATTACH PARTITION {default} DEFAULT")
+
+
+def create_partitions(table, start=None, now=None, ahead=None):
+    """
+    Creates the partitions from the one holding start, now by default, up to LOG_PARTITIONS_AHEAD intervals ahead of now
+    Ranges overlapping an existing partition are skipped, so the interval can be changed at any time
+    Returns the names of the created partitions
+    """
+    now = now or timezone.now()
+    ahead = settings.LOG_PARTITIONS_AHEAD if ahead is None else ahead
+    existing = get_partitions(table)
+    last = now
+    for _ in range(ahead):
+        last = get_partition_bounds(last)[1]
+
+    created = []
+    bound = get_partition_bounds(start or now)[0]
+    with connection.cursor() as cursor:
+        while bound <= last:
+            bound, end = get_partition_bounds(bound)
+            if not any(
+                bound < other_end and other_start < end
+                for _, other_start, other_end in existing
+            ):
+                name = PARTITION_NAME.format(table=table, start=bound, end=end)
+                create_partition(cursor, table, name, bound, end)
+                created.append(name)
+            bound = end
+    return created
+
+
+def drop_partitions(table, retention_days=None, now=None):
+    """
+    Drops the partitions which only hold rows older than the retention period, 0 keeps everything
+    Dropping a partition is instant, unlike deleting its rows
+    Returns the names of the dropped partitions
+    """
+    retention_days = (
+        settings.LOG_RETENTION_DAYS if retention_days is None else retention_days
+    )
+    if not retention_days:
+        return []
+    cutoff = (now or timezone.now()) - datetime.timedelta(days=retention_days)
+    dropped = []
+    with connection.cursor() as cursor:
+        for name, _, end in get_partitions(table):
+            if end <= cutoff:
+                cursor.execute(f"DROP TABLE {connection.ops.quote_name(name)}")
+                dropped.append(name)
+    return dropped
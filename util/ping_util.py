@@ -0,0 +1,295 @@
+import time
+import socket
+import struct
+import asyncio
+import itertools
+from django.conf import settings
+from .dns_util import resolver_cache
+
+ICMP_PROTOCOLS = {
+    socket.AF_INET: socket.IPPROTO_ICMP,
+    socket.AF_INET6: socket.IPPROTO_ICMPV6,
+}
+ICMP_ECHO_REQUEST = {socket.AF_INET: 8, socket.AF_INET6: 128}
+ICMP_ECHO_REPLY = {socket.AF_INET: 0, socket.AF_INET6: 129}
+# the tcp fallback connects here when the endpoint has no port
+# a refused connection still proves the host is up
+FALLBACK_PORT = 80
+# replies of a whole round arrive in a burst, the kernel drops whatever doesn't fit the buffer
+RECEIVE_BUFFER_SIZE = 4 * 1024 * 1024
+# echo requests sent before yielding, so the replies are drained while sending
+SEND_BATCH_SIZE = 64
+
+
+def checksum(data):
+    if len(data) % 2:
+        data += b"\x00"
+    total = sum(struct.unpack(f"!{len(data) // 2}H", data))
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+    return ~total & 0xFFFF
+
+
+def build_echo(family, sequence, payload):
+    """
+    Returns an ICMP echo request, the identifier is filled in by the kernel
+    """
+    header = struct.pack("!BBHHH", ICMP_ECHO_REQUEST[family], 0, 0, 0, sequence)
+    if family == socket.AF_INET6:
+        # the kernel computes ICMPv6 checksums over the pseudo header
+        return header + payload
+    return (
+        struct.pack(
+            "!BBHHH",
+            ICMP_ECHO_REQUEST[family],
+            0,
+            checksum(header + payload),
+            0,
+            sequence,
+        )
+        + payload
+    )
+
+
+def open_socket(family):
+    """
+    Returns an unprivileged ICMP datagram socket, or None when the host doesn't allow them
+    Linux gates them behind net.ipv4.ping_group_range
+    """
+    try:
+        sock = socket.socket(family, socket.SOCK_DGRAM, ICMP_PROTOCOLS[family])
+    except OSError:
+        return None
+    sock.setblocking(False)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECEIVE_BUFFER_SIZE)
+    except OSError:
+        pass
+    return sock
+
+
+async def sock_sendto(loop, sock, data, address):
+    """
+    Sends a datagram on the non-blocking socket, waiting for room in the send buffer
+    loop.sock_sendto only exists from Python 3.11
+    """
+    while True:
+        try:
+            return sock.sendto(data, address)
+        except (BlockingIOError, InterruptedError):
+            pass
+        writable = loop.create_future()
+        loop.add_writer(
+            sock.fileno(), lambda: writable.done() or writable.set_result(None)
+        )
+        try:
+            await writable
+        finally:
+            loop.remove_writer(sock.fileno())
+
+
+class Pinger:
+    """
+    Pings many addresses in one pass, with one ICMP socket per address family
+    The kernel routes replies to the socket by identifier, they're matched to their target by sequence
+    """
+
+    def __init__(self, count=None, interval=None):
+        self.count = count or settings.PING_COUNT
+        self.interval = (interval or settings.PING_INTERVAL) / 1000
+        self.payload = b"\x00" * settings.PING_PAYLOAD_SIZE
+        self.sequences = itertools.count()
+        # (address, sequence) => sent at
+        self.pending = {}
+        # address => round trip times, in seconds
+        self.replies = {}
+        self.drained = None
+
+    def on_readable(self, sock, family):
+        while True:
+            try:
+                packet, source = sock.recvfrom(65535)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                # icmp errors queued on the socket, the target counts as lost
+                continue
+            if len(packet) < 8 or packet[0] != ICMP_ECHO_REPLY[family]:
+                continue
+            sequence = struct.unpack("!H", packet[6:8])[0]
+            sent_at = self.pending.pop((source[0], sequence), None)
+            if sent_at is not None:
+                self.replies[source[0]].append(time.monotonic() - sent_at)
+                if not self.pending:
+                    self.drained.set()
+
+    async def ping(self, targets):
+        """
+        Pings the given {address: (family, timeout)} targets
+        Returns {address: round trip times}, None for addresses which need the tcp fallback
+        """
+        loop = asyncio.get_running_loop()
+        self.drained = asyncio.Event()
+        sockets = {}
+        for family in {family for family, _ in targets.values()}:
+            sock = open_socket(family)
+            if sock is not None:
+                loop.add_reader(sock.fileno(), self.on_readable, sock, family)
+                sockets[family] = sock
+
+        try:
+            for address, (family, _) in targets.items():
+                if family in sockets:
+                    self.replies[address] = []
+
+            for index in range(self.count):
+                if index:
+                    await asyncio.sleep(self.interval)
+                for position, (address, (family, _)) in enumerate(targets.items()):
+                    if family not in sockets:
+                        continue
+                    if position and not position % SEND_BATCH_SIZE:
+                        await asyncio.sleep(0)
+                    sequence = next(self.sequences) & 0xFFFF
+                    self.pending[(address, sequence)] = time.monotonic()
+                    try:
+                        await sock_sendto(
+                            loop,
+                            sockets[family],
+                            build_echo(family, sequence, self.payload),
+                            (address, 0),
+                        )
+                    except OSError:
+                        # unreachable network, counted as lost
+                        self.pending.pop((address, sequence), None)
+
+            deadline = loop.time() + max(timeout for _, timeout in targets.values())
+            while self.pending and loop.time() < deadline:
+                self.drained.clear()
+                try:
+                    await asyncio.wait_for(self.drained.wait(), deadline - loop.time())
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            for sock in sockets.values():
+                loop.remove_reader(sock.fileno())
+                sock.close()
+
+        # replies slower than the target's own timeout are lost
+        return {
+            address: (
+                [rtt for rtt in self.replies[address] if rtt <= timeout]
+                if address in self.replies
+                else None
+            )
+            for address, (_, timeout) in targets.items()
+        }
+
+
+async def tcp_ping(address, port, count, timeout, semaphore):
+    """
+    Reachability check for hosts without ICMP, times the TCP handshake
+    """
+    rtts = []
+    for _ in range(count):
+        async with semaphore:
+            start_time = time.monotonic()
+            try:
+                _, writer = await asyncio.wait_for(
+                    asyncio.open_connection(address, port), timeout
+                )
+                writer.close()
+            except ConnectionRefusedError:
+                # the host answered with a reset, so it's up
+                pass
+            except (asyncio.TimeoutError, OSError):
+                continue
+            rtts.append(time.monotonic() - start_time)
+    return rtts
+
+
+async def resolve(request):
+    """
+    Returns the first (family, address) of the request's host and the time it took
+    """
+    start_time = time.monotonic()
+    if not request["host"]:
+        return None, 0
+    try:
+        addresses = await resolver_cache.resolve(request["host"])
+        return addresses[0], time.monotonic() - start_time
+    except OSError:
+        return None, time.monotonic() - start_time
+
+
+async def ping_requests(requests, semaphore):
+    """
+    Pings every request in a single pass
+    Returns the result dicts in the same order as the given requests
+    """
+    resolved = await asyncio.gather(*[resolve(request) for request in requests])
+
+    # endpoints sharing an address share the echo requests
+    targets = {}
+    for request, (address, _) in zip(requests, resolved):
+        if address is not None:
+            family, timeout = address[0], request["timeout"]
+            if address[1] in targets:
+                timeout = max(timeout, targets[address[1]][1])
+            targets[address[1]] = (family, timeout)
+
+    pinger = Pinger()
+    rtts = await pinger.ping(targets) if targets else {}
+
+    fallbacks = {}
+    for request, (address, _) in zip(requests, resolved):
+        if address is not None and rtts[address[1]] is None:
+            key = (address[1], request["port"] or FALLBACK_PORT)
+            fallbacks[key] = request["timeout"]
+    fallback_rtts = await asyncio.gather(
+        *[
+            tcp_ping(address, port, pinger.count, timeout, semaphore)
+            for (address, port), timeout in fallbacks.items()
+        ]
+    )
+    fallback_rtts = dict(zip(fallbacks, fallback_rtts))
+
+    results = []
+    for request, (address, dns_time) in zip(requests, resolved):
+        method = "icmp"
+        replies = []
+        if address is None:
+            message = "Host couldn't be resolved. Please try with a different URL."
+        else:
+            replies = rtts[address[1]]
+            if replies is None:
+                method = "tcp"
+                replies = fallback_rtts[(address[1], request["port"] or FALLBACK_PORT)]
+            if replies:
+                message = "Ping replied successfully."
+            else:
+                message = "Host is unreachable. No replies were received."
+
+        # prepare a context object, same shape as the other probes
+        context = {
+            "response_time": sum(replies) / len(replies) if replies else -1,
+            "status": "UP" if replies else "DOWN",
+            "message": message,
+            "reused": False,
+            "match_time": None,
+            "downloaded_bytes": None,
+            "dns_time": dns_time,
+            "connect_time": None,
+            "tls_time": None,
+            "handshake": None,
+            "ttfb": None,
+            "transfer_time": None,
+            "ping_method": method,
+            "rtt_min": min(replies) if replies else None,
+            "rtt_max": max(replies) if replies else None,
+            "packet_loss": 100 * (1 - len(replies) / pinger.count),
+        }
+        if not replies:
+            context["response_body"] = None
+        results.append(context)
+    return results
@@ -0,0 +1,182 @@
+import time
+import threading
+import aiohttp
+import requests
+from urllib.parse import urlsplit
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from django.conf import settings
+from .trace_util import PhaseTimingConnector, build_trace_config
+from .dns_util import CachingResolver, resolver_cache
+from .tls_util import get_ssl_context
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def get_pool_key(url, verify_ssl):
+    """
+    Returns the (scheme, host, port, verify_ssl) key a url is pooled under
+    """
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    port = parts.port or DEFAULT_PORTS.get(scheme)
+    return (scheme, parts.hostname, port, bool(verify_ssl))
+
+
+class RequestCounter:
+    """
+    Counts the requests sent over the connection's current socket, more than one means it was reused
+    Dropped connections open a new socket, which starts over
+    """
+
+    requests_sent = 0
+
+    def connect(self):
+        super().connect()
+        self.requests_sent = 0
+
+    def request(self, *args, **kwargs):
+        super().request(*args, **kwargs)
+        self.requests_sent += 1
+
+    def request_chunked(self, *args, **kwargs):
+        super().request_chunked(*args, **kwargs)
+        self.requests_sent += 1
+
+
+class CountingHTTPConnection(RequestCounter, HTTPConnection):
+    pass
+
+
+class CountingHTTPSConnection(RequestCounter, HTTPSConnection):
+    pass
+
+
+class CountingHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = CountingHTTPConnection
+
+
+class CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = CountingHTTPSConnection
+
+
+class CountingAdapter(requests.adapters.HTTPAdapter):
+    """
+    HTTPAdapter whose connections count the requests sent over them
+    """
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": CountingHTTPConnectionPool,
+            "https": CountingHTTPSConnectionPool,
+        }
+
+
+class SessionPool:
+    """
+    Worker-lifetime requests sessions, one per (scheme, host, port, verify_ssl)
+    Connections are kept alive between probes, sessions idle for too long are closed
+    """
+
+    def __init__(self, maxsize=None, idle_timeout=None):
+        self.maxsize = maxsize or settings.PROBE_POOL_MAXSIZE
+        self.idle_timeout = idle_timeout or settings.PROBE_POOL_IDLE_TIMEOUT
+        self.sessions = {}
+        self.lock = threading.Lock()
+        self.evicted_at = time.monotonic()
+
+    def get(self, url, verify_ssl):
+        """
+        Returns the session and adapter for the given url, creating them on first use
+        """
+        key = get_pool_key(url, verify_ssl)
+        with self.lock:
+            entry = self.sessions.get(key)
+            if entry is None:
+                session = requests.Session()
+                session.verify = bool(verify_ssl)
+                adapter = CountingAdapter(pool_connections=1, pool_maxsize=self.maxsize)
+                session.mount(f"{key[0]}://", adapter)
+                entry = [session, adapter, time.monotonic()]
+                self.sessions[key] = entry
+            entry[2] = time.monotonic()
+            return entry[0], entry[1]
+
+    def request(self, method, url, verify_ssl=False, **kwargs):
+        """
+        Sends the request through the pooled session
+        Returns the response and whether an existing connection was reused
+        The body is streamed, close the response once done so the connection is released
+        """
+        if time.monotonic() - self.evicted_at > self.idle_timeout:
+            self.evict_idle()
+        session, _ = self.get(url, verify_ssl)
+        response = session.request(method=method, url=url, stream=True, **kwargs)
+        # connections through a proxy aren't counted, they are reported as new
+        reused = getattr(response.raw.connection, "requests_sent", 0) > 1
+        return response, reused
+
+    def evict_idle(self):
+        """
+        Closes the sessions which haven't been used within the idle timeout
+        """
+        self.evicted_at = time.monotonic()
+        deadline = self.evicted_at - self.idle_timeout
+        with self.lock:
+            for key, entry in list(self.sessions.items()):
+                if entry[2] < deadline:
+                    entry[0].close()
+                    del self.sessions[key]
+
+
+class ClientSessionPool:
+    """
+    aiohttp counterpart of SessionPool, bound to the probe engine's event loop
+    Each key gets its own connector so the pool size is enforced per host
+    """
+
+    def __init__(self, maxsize=None, idle_timeout=None, keepalive=None):
+        self.maxsize = maxsize or settings.PROBE_POOL_MAXSIZE
+        self.idle_timeout = idle_timeout or settings.PROBE_POOL_IDLE_TIMEOUT
+        self.keepalive = keepalive or settings.PROBE_POOL_KEEPALIVE
+        self.sessions = {}
+        self.trace_config = build_trace_config()
+
+    def get(self, url, verify_ssl):
+        """
+        Returns the client session for the given url, creating it on first use
+        """
+        key = get_pool_key(url, verify_ssl)
+        entry = self.sessions.get(key)
+        if entry is None or entry[0].closed:
+            connector = PhaseTimingConnector(
+                # lookups go through the shared resolver cache, which respects the record TTLs
+                resolver=CachingResolver(resolver_cache),
+                use_dns_cache=False,
+                limit=0,
+                limit_per_host=self.maxsize,
+                keepalive_timeout=self.keepalive,
+                # shared contexts, so TLS sessions can be resumed across connections
+                ssl=get_ssl_context(verify_ssl),
+            )
+            session = aiohttp.ClientSession(
+                connector=connector, trace_configs=[self.trace_config]
+            )
+            entry = [session, time.monotonic()]
+            self.sessions[key] = entry
+        entry[1] = time.monotonic()
+        return entry[0]
+
+    async def evict_idle(self):
+        """
+        Closes the sessions which haven't been used within the idle timeout
+        """
+        deadline = time.monotonic() - self.idle_timeout
+        for key, entry in list(self.sessions.items()):
+            if entry[1] < deadline:
+                del self.sessions[key]
+                await entry[0].close()
+
+
+session_pool = SessionPool()
@@ -0,0 +1,320 @@
+import re
+import time
+import asyncio
+import logging
+import traceback
+import aiohttp
+from django.conf import settings
+from .pool_util import ClientSessionPool
+from .match_util import search, StreamMatcher
+from .trace_util import new_phases, probe_phases
+from .dns_util import resolver_cache
+from .metrics_util import record_dns_stats
+from .tls_util import store_session
+from .socket_util import SOCKET_PROBES, get_address
+from .ping_util import ping_requests
+from .limit_util import get_limiters
+
+# the event loop and the connection pools outlive a single cycle, so keep-alive connections are reused
+_loop = None
+_client_pool = None
+
+
+def get_event_loop():
+    """
+    Returns the worker-lifetime event loop, creating it on first use
+    """
+    global _loop
+    if _loop is None or _loop.is_closed():
+        _loop = asyncio.new_event_loop()
+    return _loop
+
+
+def get_client_pool():
+    """
+    Returns the worker-lifetime client session pool
+    """
+    global _client_pool
+    if _client_pool is None:
+        _client_pool = ClientSessionPool()
+    return _client_pool
+
+
+def build_request(endpoint, timeout=None):
+    """
+    Flattens an endpoint and its request handler into a plain dict
+    ORM access isn't allowed inside the event loop, so everything is resolved upfront
+    A shorter, adaptive timeout can be given, the configured one stays the limit
+    """
+    handler = endpoint.request_handler
+    headers = {}
+    body = None
+    auth = None
+    if handler is not None:
+        if handler.header_name and handler.header_value:
+            headers = {handler.header_name: handler.header_value}
+        if handler.body:
+            body = handler.body
+        if handler.auth_username and handler.auth_password:
+            auth = (handler.auth_username, handler.auth_password)
+    host, port = get_address(endpoint.url, endpoint.port, endpoint.logger_type)
+
+    return {
+        "id": endpoint.pk,
+        "method": handler.method if handler is not None else "GET",
+        "url": endpoint.url,
+        "host": host,
+        "port": port,
+        "starttls": endpoint.starttls,
+        "headers": headers,
+        "data": body,
+        "auth": auth,
+        "timeout": timeout or endpoint.timeout,
+        "timeout_limit": endpoint.timeout,
+        "verify_ssl": handler.verify_ssl if handler is not None else False,
+        "log_response": handler.log_response if handler is not None else False,
+        "logger_type": endpoint.logger_type,
+        "regex": endpoint.regex,
+        "max_body_size": endpoint.max_body_size or settings.PROBE_MAX_BODY_SIZE,
+        "origin_concurrency": (
+            handler.max_concurrency
+            if handler is not None and handler.max_concurrency is not None
+            else settings.ORIGIN_CONCURRENCY
+        ),
+        "origin_rate": (
+            handler.max_rate
+            if handler is not None and handler.max_rate is not None
+            else settings.ORIGIN_RATE
+        ),
+    }
+
+
+async def stream_body(response, max_bytes, matcher=None, keep=False):
+    """
+    Reads the body in chunks until the matcher matches or max_bytes are downloaded
+    Returns whether it matched, the bytes downloaded and the body when asked to keep it
+    """
+    downloaded = 0
+    matched = False
+    chunks = []
+    async for chunk in response.content.iter_chunked(settings.PROBE_CHUNK_SIZE):
+        chunk = chunk[: max_bytes - downloaded]
+        downloaded += len(chunk)
+        if keep:
+            chunks.append(chunk)
+        if matcher is not None and matcher.feed(chunk):
+            matched = True
+            break
+        if downloaded >= max_bytes:
+            break
+    return matched, downloaded, b"".join(chunks)
+
+
+async def probe(pool, request, semaphore, limiter):
+    """
+    Waits for a slot within the global and the per-host limits, then probes the request
+    """
+    wait_start = time.monotonic()
+    async with limiter, semaphore:
+        # time spent queued behind the limits, kept out of the response time
+        wait_time = time.monotonic() - wait_start
+        context = await probe_once(pool, request)
+        elapsed = time.monotonic() - wait_start - wait_time
+    if context["timed_out"] and request["timeout"] < request["timeout_limit"]:
+        # gave up early on the adaptive timeout, confirm with what is left of the configured one
+        # the confirmation is a request of its own and waits for a fresh token
+        timeout = request["timeout_limit"] - elapsed
+        if timeout > 0:
+            wait_start = time.monotonic()
+            async with limiter, semaphore:
+                wait_time += time.monotonic() - wait_start
+                context = await probe_once(pool, dict(request, timeout=timeout))
+            context["retried"] = True
+    context["wait_time"] = wait_time
+    return context
+
+
+async def probe_once(pool, request):
+    """
+    Probes the request once, an unexpected error fails this probe and not the whole shard
+    """
+    try:
+        socket_probe = SOCKET_PROBES.get(request["logger_type"])
+        if socket_probe is not None:
+            return await socket_probe(request).run()
+        return await probe_http(pool, request)
+    except Exception:
+        logging.getLogger("error_logger").error(traceback.format_exc())
+        return {
+            "response_time": -1,
+            "status": "DOWN",
+            "message": "Request couldn't be fulfilled. Please try again later.",
+            "reused": False,
+            "match_time": None,
+            "downloaded_bytes": 0,
+            "dns_time": None,
+            "connect_time": None,
+            "tls_time": None,
+            "handshake": None,
+            "ttfb": None,
+            "transfer_time": None,
+            "timed_out": False,
+            "response_body": None,
+        }
+
+
+async def probe_http(pool, request):
+    """
+    Get response time
+    Get "OK or Down or Unknown" status
+    """
+    response_time = -1
+    match = False
+    message = ""
+    response_body = None
+    match_time = None
+    downloaded = 0
+    ttfb = None
+    transfer_time = None
+    timed_out = False
+    # every probe runs in its own task, so the connector only sees the phases of this probe
+    trace = new_phases()
+    probe_phases.set(trace)
+    try:
+        session = pool.get(request["url"], request["verify_ssl"])
+        auth = aiohttp.BasicAuth(*request["auth"]) if request["auth"] else None
+        start_time = time.monotonic()
+        async with session.request(
+            method=request["method"],
+            url=request["url"],
+            headers=request["headers"],
+            data=request["data"],
+            auth=auth,
+            timeout=aiohttp.ClientTimeout(total=request["timeout"]),
+            trace_request_ctx=trace,
+        ) as response:
+            # mirrors response.elapsed, which stops the clock once headers are parsed
+            headers_at = time.monotonic()
+            response_time = headers_at - start_time
+            ttfb = headers_at - (trace["sent_at"] or start_time)
+
+            if request["logger_type"] == "status":
+                match_start = time.perf_counter()
+                match = search(request["regex"], str(response.status))
+                match_time = time.perf_counter() - match_start
+                # read the body even when it isn't logged, a response released unread closes its connection
+                _, downloaded, body = await stream_body(
+                    response,
+                    request["max_body_size"],
+                    keep=not match and request["log_response"],
+                )
+            else:
+                # stop downloading as soon as the keyword shows up
+                matcher = StreamMatcher(request["regex"], response.charset)
+                match, downloaded, body = await stream_body(
+                    response,
+                    request["max_body_size"],
+                    matcher=matcher,
+                    keep=request["log_response"],
+                )
+                match_time = matcher.elapsed
+
+            transfer_time = time.monotonic() - headers_at
+
+            if not match and request["log_response"]:
+                response_body = body.decode(
+                    response.charset or "utf-8", errors="replace"
+                )
+
+        message = "Request sent successfully."
+        store_session(trace["ssl_object"])
+
+    except re.error:
+        message = "Regex pattern is invalid. Please try with a different pattern."
+    except asyncio.TimeoutError:
+        message = "Request timed out. Try exceeding the timeout limit."
+        timed_out = True
+    except aiohttp.TooManyRedirects:
+        message = "Request exceeds the configured number of maximum redirections. Try a different URL."
+    except aiohttp.ClientConnectionError:
+        # Network problem (DNS failure, refused connection, etc)
+        message = "Request couldn't be fulfilled. URL connection refused."
+    except aiohttp.ClientResponseError:
+        message = "HTTP response is invalid. Please try with a different URL."
+    except aiohttp.ClientError:
+        # catastrophic error. bail.
+        message = "Request couldn't be fulfilled. URL connection refused."
+
+    # prepare a context object, same shape as process_endpoint
+    context = {
+        "response_time": response_time,
+        "status": "UP" if match else "DOWN",
+        "message": message,
+        "reused": trace["reused"],
+        "match_time": match_time,
+        "downloaded_bytes": downloaded,
+        "dns_time": trace["dns"],
+        "connect_time": trace["connect"],
+        "tls_time": trace["tls"],
+        "handshake": trace["handshake"],
+        "ttfb": ttfb,
+        "transfer_time": transfer_time,
+        "timed_out": timed_out,
+    }
+
+    if not match:
+        context["response_body"] = response_body
+
+    return context
+
+
+async def probe_all(requests, concurrency):
+    """
+    Probes all the requests concurrently, with at most `concurrency` requests in flight
+    Requests to the same host are further held to the host's limits
+    Ping monitors are batched into a single pass
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    pool = get_client_pool()
+    await pool.evict_idle()
+    pings = [request for request in requests if request["logger_type"] == "ping"]
+    limiters = get_limiters(
+        [request for request in requests if request["logger_type"] != "ping"]
+    )
+    probed, pinged = await asyncio.gather(
+        asyncio.gather(
+            *[
+                probe(pool, request, semaphore, limiters[request["host"]])
+                for request in requests
+                if request["logger_type"] != "ping"
+            ]
+        ),
+        ping_requests(pings, semaphore),
+    )
+    record_dns_stats(resolver_cache.pop_stats())
+    probed, pinged = iter(probed), iter(pinged)
+    return [
+        next(pinged) if request["logger_type"] == "ping" else next(probed)
+        for request in requests
+    ]
+
+
+def process_endpoints(endpoints, concurrency=None, timeouts=None):
+    """
+    Probes a batch of endpoints concurrently
+    `timeouts` optionally maps endpoint ids to adaptive timeouts
+    Returns the result dicts in the same order as the given endpoints
+    """
+    if concurrency is None:
+        concurrency = settings.PROBE_CONCURRENCY
+
+    if timeouts is None:
+        timeouts = {}
+
+    requests = [
+        build_request(endpoint, timeouts.get(endpoint.pk)) for endpoint in endpoints
+    ]
+    if not requests:
+        return []
+
+    return get_event_loop().run_until_complete(probe_all(requests, concurrency))
@@ -0,0 +1,24 @@
+from django.conf import settings
+
+
+def get_queue(queue, region):
+    """
+    Returns the name of the region's copy of the given probe queue
+    """
+    return f"{queue}.{region}"
+
+
+def get_worker_queue():
+    """
+    Returns the probe queue the worker consumes, given the region and lane it declares
+    through PROBE_REGION and PROBE_LANE (fast, slow or priority), None when it doesn't declare a region
+    """
+    if not settings.PROBE_REGION:
+        return None
+    if settings.PROBE_LANE == "slow":
+        queue = settings.SLOW_LANE_QUEUE
+    elif settings.PROBE_LANE == "priority":
+        queue = settings.RECHECK_QUEUE
+    else:
+        queue = settings.PROBE_QUEUE
+    return get_queue(queue, settings.PROBE_REGION)
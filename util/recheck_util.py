@@ -0,0 +1,57 @@
+from django.conf import settings
+from .redis_util import get_redis
+from .state_util import SUSPECT, DOWN, RECOVERING, get_state_id
+
+# "endpoint id:region" => number of the last re-check scheduled, held while the endpoint is being re-checked
+RECHECK_KEY = "recheck:{}"
+
+
+def get_recheck_delay(attempt):
+    """
+    Returns how long to wait before the given re-check, doubling from RECHECK_INTERVAL up to RECHECK_MAX_INTERVAL
+    """
+    return min(settings.RECHECK_INTERVAL * 2**attempt, settings.RECHECK_MAX_INTERVAL)
+
+
+def needs_recheck(result, now):
+    """
+    Returns whether the endpoint should be probed again ahead of its regular schedule
+    Endpoints are re-checked until they're UP again or have been DOWN for RECHECK_STEADY_DOWN
+    """
+    state = result.get("state")
+    if state in (SUSPECT, RECOVERING):
+        return True
+    return (
+        state == DOWN
+        and now - result.get("state_since", now) < settings.RECHECK_STEADY_DOWN
+    )
+
+
+def plan_rechecks(results, now):
+    """
+    Returns {(region, attempt): [endpoint id]} of the re-checks to schedule after the given results
+    Results of regular probes start a chain of re-checks, unless one is already running for the endpoint
+    re-checks continue their own chain, and the chain ends once the regular schedule is as fast
+    """
+    client = get_redis()
+    planned = {}
+    for result in results:
+        key = RECHECK_KEY.format(
+            get_state_id(result["endpoint_id"], result.get("region"))
+        )
+        attempt = result.get("recheck")
+        next_attempt = 0 if attempt is None else attempt + 1
+        delay = get_recheck_delay(next_attempt)
+        if not needs_recheck(result, now) or delay >= result.get(
+            "check_frequency", delay
+        ):
+            if attempt is not None:
+                client.delete(key)
+            continue
+        # the claim outlives the delay, so it expires by itself if the chain is lost
+        if not client.set(key, next_attempt, ex=2 * delay, nx=attempt is None):
+            continue
+        planned.setdefault((result.get("region"), next_attempt), []).append(
+            result["endpoint_id"]
+        )
+    return planned
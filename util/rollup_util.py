@@ -0,0 +1,177 @@
+import math
+import datetime
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from logger.models import Rollup
+
+# histogram buckets grow by 5%, percentiles are read within 5% of the exact value
+HISTOGRAM_BASE = 1.05
+# response times below 1ms share the first bucket
+HISTOGRAM_MIN = 0.001
+ROLLUP_FIELDS = [
+    "count",
+    "up_count",
+    "down_count",
+    "min_response_time",
+    "max_response_time",
+    "mean_response_time",
+    "p50_response_time",
+    "p95_response_time",
+    "p99_response_time",
+    "sum_response_time",
+    "histogram",
+]
+
+
+def get_bucket(moment, grain):
+    """
+    Returns the start of the minute, hour or day the moment falls in
+    """
+    if grain == "minute":
+        return moment.replace(second=0, microsecond=0)
+    if grain == "hour":
+        return moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def get_histogram_index(value):
+    if value <= HISTOGRAM_MIN:
+        return 0
+    return math.ceil(math.log(value / HISTOGRAM_MIN, HISTOGRAM_BASE))
+
+
+def get_histogram_percentile(histogram, percentile, low, high):
+    """
+    Returns the upper bound of the bucket holding the percentile, within the observed min and max
+    """
+    total = sum(histogram.values())
+    rank = max(math.ceil(percentile / 100 * total), 1)
+    seen = 0
+    for index in sorted(histogram, key=int):
+        seen += histogram[index]
+        if seen >= rank:
+            return min(max(HISTOGRAM_MIN * HISTOGRAM_BASE ** int(index), low), high)
+    return high
+
+
+def aggregate(logs, services):
+    """
+    Returns {(entity, entity id, grain, bucket): partial rollup} of the endpoint logs
+    services maps every endpoint id to the ids of its services
+    """
+    partials = {}
+    for log in logs:
+        response_time = log.response_time
+        is_up = log.status == "UP"
+        targets = [("endpoint", log.entity_id)] + [
+            ("service", service_id) for service_id in services.get(log.entity_id, [])
+        ]
+        for grain, _ in Rollup.GRAIN_CHOICES:
+            bucket = get_bucket(log.created_at, grain)
+            for entity, entity_id in targets:
+                partial = partials.setdefault(
+                    (entity, entity_id, grain, bucket),
+                    {"count": 0, "up_count": 0, "down_count": 0, "response_times": []},
+                )
+                partial["count"] += 1
+                partial["up_count" if is_up else "down_count"] += 1
+                if is_up and response_time is not None and response_time >= 0:
+                    partial["response_times"].append(float(response_time))
+    return partials
+
+
+def merge(rollup, partial):
+    """
+    Adds the partial rollup to the stored one, the mean and percentiles are recomputed from the merged histogram
+    """
+    rollup.count += partial["count"]
+    rollup.up_count += partial["up_count"]
+    rollup.down_count += partial["down_count"]
+    response_times = partial["response_times"]
+    if not response_times:
+        return
+    histogram = rollup.histogram
+    for response_time in response_times:
+        index = str(get_histogram_index(response_time))
+        histogram[index] = histogram.get(index, 0) + 1
+    rollup.sum_response_time += sum(response_times)
+    rollup.min_response_time = min(
+        response_times + [rollup.min_response_time or math.inf]
+    )
+    rollup.max_response_time = max(response_times + [rollup.max_response_time or 0])
+    rollup.mean_response_time = rollup.sum_response_time / sum(histogram.values())
+    for percentile in (50, 95, 99):
+        setattr(
+            rollup,
+            f"p{percentile}_response_time",
+            get_histogram_percentile(
+                histogram,
+                percentile,
+                rollup.min_response_time,
+                rollup.max_response_time,
+            ),
+        )
+
+
+def update_rollups(logs, services):
+    """
+    Merges a batch of endpoint logs into the rollups of their endpoints and services, at every grain
+    Rows are created if missing then locked in a consistent order, so concurrent writers don't lose updates
+    """
+    partials = aggregate(logs, services)
+    if not partials:
+        return
+    groups = {}
+    for entity, entity_id, grain, bucket in partials:
+        ids, buckets = groups.setdefault((entity, grain), (set(), set()))
+        ids.add(entity_id)
+        buckets.add(bucket)
+
+    with transaction.atomic():
+        Rollup.objects.bulk_create(
+            [
+                Rollup(entity=entity, entity_id=entity_id, grain=grain, bucket=bucket)
+                for entity, entity_id, grain, bucket in partials
+            ],
+            ignore_conflicts=True,
+        )
+        updated = []
+        for (entity, grain), (ids, buckets) in sorted(groups.items()):
+            rollups = (
+                Rollup.objects.select_for_update()
+                .filter(
+                    entity=entity, grain=grain, entity_id__in=ids, bucket__in=buckets
+                )
+                .order_by("id")
+            )
+            for rollup in rollups:
+                partial = partials.get((entity, rollup.entity_id, grain, rollup.bucket))
+                if partial is not None:
+                    merge(rollup, partial)
+                    updated.append(rollup)
+        Rollup.objects.bulk_update(updated, ROLLUP_FIELDS)
+
+
+def prune_rollups(now=None):
+    """
+    Deletes the rollups older than the retention of their grain, 0 keeps everything
+    """
+    now = now or timezone.now()
+    for grain, retention_days in settings.ROLLUP_RETENTION_DAYS.items():
+        if retention_days:
+            Rollup.objects.filter(
+                grain=grain, bucket__lt=now - datetime.timedelta(days=retention_days)
+            ).delete()
+
+
+def get_rollups(entity, entity_id, grain, start, end=None):
+    """
+    Returns the rollups of the endpoint or service in [start, end), oldest first
+    """
+    rollups = Rollup.objects.filter(
+        entity=entity, entity_id=entity_id, grain=grain, bucket__gte=start
+    )
+    if end is not None:
+        rollups = rollups.filter(bucket__lt=end)
+    return rollups.order_by("bucket")
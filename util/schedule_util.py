@@ -0,0 +1,21 @@
+import zlib
+import datetime
+
+
+def get_phase_offset(entity_id, frequency):
+    """
+    Returns a stable offset in seconds within the check interval for the given entity
+    """
+    return zlib.crc32(str(entity_id).encode()) % frequency
+
+
+def get_next_run(entity_id, frequency, after):
+    """
+    Returns the first run strictly after the given time, aligned to the entity's phase offset
+    Missed runs are skipped instead of being replayed
+    """
+    offset = get_phase_offset(entity_id, frequency)
+    periods = (after.timestamp() - offset) // frequency + 1
+    return datetime.datetime.fromtimestamp(
+        periods * frequency + offset, tz=datetime.timezone.utc
+    )
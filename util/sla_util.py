@@ -0,0 +1,195 @@
+import math
+import datetime
+import numpy as np
+from django.conf import settings
+from django.db.models import FloatField
+from django.db.models.functions import Cast
+from django.contrib.contenttypes.models import ContentType
+from logger.models import Endpoint, Log
+from .archive_util import get_archived_days, read_slice, to_milliseconds
+
+UNKNOWN = -1
+UP = 0
+DOWN = 1
+
+
+def get_resolution(start, end):
+    """
+    Returns the length in seconds of the slots the window is split in, SLA_RESOLUTION unless
+    the window would need more than SLA_MAX_SLOTS of them
+    """
+    seconds = (end - start).total_seconds()
+    return max(settings.SLA_RESOLUTION, math.ceil(seconds / settings.SLA_MAX_SLOTS))
+
+
+def load_series(endpoint_ids, start, end):
+    """
+    Returns the endpoint, seconds since start, down flag and response time of every log in the window, as arrays
+    Days moved to the archive are read from it, the rest from the log table
+    """
+    archived_days = {
+        endpoint_id: set(get_archived_days("endpoint", endpoint_id, start, end))
+        for endpoint_id in endpoint_ids
+    }
+    endpoints, offsets, down, response_times = [], [], [], []
+    start_ms = to_milliseconds(start)
+    for endpoint_id, days in archived_days.items():
+        for day in sorted(days):
+            archive = read_slice("endpoint", endpoint_id, day, start, end)
+            endpoints.append(
+                np.full(len(archive["timestamps"]), endpoint_id, dtype=np.int64)
+            )
+            offsets.append((archive["timestamps"] - start_ms) / 1000)
+            down.append(np.asarray(archive["down"], dtype=bool))
+            response_times.append(archive["response_times"].astype(np.float64))
+
+    logs = (
+        Log.objects.between(start, end)
+        .filter(
+            entity_type=ContentType.objects.get_for_model(Endpoint),
+            entity_id__in=endpoint_ids,
+        )
+        .annotate(response_seconds=Cast("response_time", FloatField()))
+        .values_list("entity_id", "created_at", "status", "response_seconds")
+    )
+    rows = [
+        row
+        for row in logs.iterator(chunk_size=10000)
+        # days being archived can still be in the log table, the archive has them all
+        if row[1].astimezone(datetime.timezone.utc).date() not in archived_days[row[0]]
+    ]
+    endpoints.append(np.array([row[0] for row in rows], dtype=np.int64))
+    offsets.append(
+        np.array([(row[1] - start).total_seconds() for row in rows], dtype=np.float64)
+    )
+    down.append(np.array([row[2] == "DOWN" for row in rows], dtype=bool))
+    response_times.append(
+        np.array(
+            [np.nan if row[3] is None else row[3] for row in rows], dtype=np.float64
+        )
+    )
+    return (
+        np.concatenate(endpoints),
+        np.concatenate(offsets),
+        np.concatenate(down),
+        np.concatenate(response_times),
+    )
+
+
+def get_slot_states(endpoints, offsets, down, endpoint_count, slot_count, resolution):
+    """
+    Returns the endpoints x slots matrix of UP, DOWN or UNKNOWN
+    A slot is DOWN if any probe in it failed, slots without probes keep the last known state
+    """
+    slots = np.minimum((offsets // resolution).astype(np.int64), slot_count - 1)
+    cells = endpoints * slot_count + slots
+    probes = np.bincount(cells, minlength=endpoint_count * slot_count)
+    failures = np.bincount(cells, weights=down, minlength=endpoint_count * slot_count)
+    states = np.where(probes > 0, (failures > 0).astype(np.int8), UNKNOWN)
+    states = states.reshape(endpoint_count, slot_count).astype(np.int8)
+
+    # forward fill, every slot takes the state of the last slot with probes
+    known = np.where(states != UNKNOWN, np.arange(slot_count), 0)
+    last = np.maximum.accumulate(known, axis=1)
+    filled = np.take_along_axis(states, last, axis=1)
+    seen = np.maximum.accumulate(states != UNKNOWN, axis=1)
+    return np.where(seen, filled, UNKNOWN)
+
+
+def compute_sla(services, start, end, target=None):
+    """
+    Returns the uptime, downtime, error budget and response time of every service over [start, end)
+    Coupled services are down whenever one of their endpoints is, decoupled ones only when all of them are
+    and degraded when some are
+    The burned error budget covers the whole window, the burn rate only its last SLA_BURN_WINDOW seconds
+    """
+    target = settings.SLA_TARGET if target is None else target
+    services = list(services)
+    memberships = list(
+        Endpoint.service.through.objects.filter(
+            service_id__in=[service.pk for service in services]
+        ).values_list("service_id", "endpoint_id")
+    )
+    endpoint_ids = sorted({endpoint_id for _, endpoint_id in memberships})
+    endpoint_index = {endpoint_id: i for i, endpoint_id in enumerate(endpoint_ids)}
+    service_index = {service.pk: i for i, service in enumerate(services)}
+
+    resolution = get_resolution(start, end)
+    slot_count = max(math.ceil((end - start).total_seconds() / resolution), 1)
+    endpoint_count = len(endpoint_ids)
+
+    # services x endpoints
+    members = np.zeros((len(services), endpoint_count), dtype=bool)
+    for service_id, endpoint_id in memberships:
+        members[service_index[service_id], endpoint_index[endpoint_id]] = True
+
+    entity_ids, offsets, down, response_times = load_series(endpoint_ids, start, end)
+    endpoints = np.array(
+        [endpoint_index[entity_id] for entity_id in entity_ids], dtype=np.int64
+    )
+    states = get_slot_states(
+        endpoints, offsets, down, endpoint_count, slot_count, resolution
+    )
+
+    # services x slots, number of known and DOWN endpoints in every slot
+    known = members.astype(np.int32) @ (states != UNKNOWN).astype(np.int32)
+    failing = members.astype(np.int32) @ (states == DOWN).astype(np.int32)
+    coupled = np.array([service.service_type == "coupled" for service in services])
+    service_down = np.where(
+        coupled[:, None], failing > 0, (failing == known) & (known > 0)
+    )
+    degraded = ~coupled[:, None] & (failing > 0) & (failing < known)
+    known_slots = (known > 0).sum(axis=1)
+    down_slots = service_down.sum(axis=1)
+    # the burn rate only looks at the end of the window, how fast the budget is being spent right now
+    recent = slice(-max(math.ceil(settings.SLA_BURN_WINDOW / resolution), 1), None)
+    recent_known_slots = (known[:, recent] > 0).sum(axis=1)
+    recent_down_slots = service_down[:, recent].sum(axis=1)
+
+    # mean response time of the UP probes of every service
+    up = ~down & ~np.isnan(response_times)
+    per_endpoint_sum = np.bincount(
+        endpoints[up], weights=response_times[up], minlength=endpoint_count
+    )
+    per_endpoint_count = np.bincount(endpoints[up], minlength=endpoint_count)
+    response_sum = members @ per_endpoint_sum
+    response_count = members @ per_endpoint_count
+
+    minutes = resolution / 60
+    budget = (100 - target) / 100
+    with np.errstate(divide="ignore", invalid="ignore"):
+        uptime = np.where(
+            known_slots > 0, 100 * (known_slots - down_slots) / known_slots, np.nan
+        )
+        allowed = budget * known_slots * minutes
+        burned = np.where(allowed > 0, down_slots * minutes / allowed, np.nan)
+        down_rate = np.where(
+            recent_known_slots > 0, recent_down_slots / recent_known_slots, np.nan
+        )
+        # how many times faster than the target allows the budget is spent, 1 spends it exactly
+        burn_rate = down_rate / budget if budget > 0 else np.full(len(services), np.nan)
+        mean_response_time = np.where(
+            response_count > 0, response_sum / response_count, np.nan
+        )
+
+    def to_json(value):
+        return None if np.isnan(value) else float(value)
+
+    return [
+        {
+            "service": service.pk,
+            "service_type": service.service_type,
+            "uptime_percentage": to_json(uptime[i]),
+            "downtime_minutes": float(down_slots[i] * minutes),
+            "degraded_minutes": float(degraded[i].sum() * minutes),
+            "monitored_minutes": float(known_slots[i] * minutes),
+            "error_budget_minutes": float(allowed[i]),
+            "error_budget_remaining_minutes": float(
+                allowed[i] - down_slots[i] * minutes
+            ),
+            "error_budget_burned": to_json(burned[i]),
+            "burn_rate": to_json(burn_rate[i]),
+            "mean_response_time": to_json(mean_response_time[i]),
+        }
+        for i, service in enumerate(services)
+    ]
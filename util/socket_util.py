@@ -0,0 +1,405 @@
+import re
+import ssl
+import time
+import asyncio
+from urllib.parse import urlsplit
+from django.conf import settings
+from .dns_util import resolver_cache
+from .match_util import search, StreamMatcher
+from .tls_util import get_ssl_context, store_session
+from .trace_util import new_phases, add_phase
+
+# ports which speak TLS from the first byte, the others upgrade through STARTTLS
+IMPLICIT_TLS_PORTS = {"smtp": (465,), "pop": (995,), "imap": (993,)}
+DEFAULT_PORTS = {"smtp": 25, "pop": 110, "imap": 143}
+# how long a udp monitor without a pattern waits for the port to be reported unreachable
+UDP_SILENCE_WAIT = 1
+
+# socket monitors by logger type, filled in by @register
+SOCKET_PROBES = {}
+
+
+class ProtocolError(Exception):
+    """
+    Raised when the server replies with something the protocol doesn't allow
+    """
+
+
+def register(logger_type):
+    def decorator(cls):
+        SOCKET_PROBES[logger_type] = cls
+        return cls
+
+    return decorator
+
+
+def get_address(url, port=None, logger_type=None):
+    """
+    Returns the (host, port) a socket monitor connects to
+    The explicit port wins over the one in the url, the protocol default comes last
+    """
+    parts = urlsplit(url if "://" in url else f"//{url}")
+    try:
+        port = int(port) if port else parts.port
+    except ValueError:
+        port = None
+    return parts.hostname, port or DEFAULT_PORTS.get(logger_type)
+
+
+class SocketProbe:
+    """
+    Base class of the socket monitors, subclasses implement check()
+    check() returns whether the server passed and the banner it sent
+    """
+
+    def __init__(self, request):
+        self.request = request
+        self.host = request["host"]
+        self.port = request["port"]
+        self.phases = new_phases()
+        self.downloaded = 0
+        self.match_time = 0
+        self.banner_at = None
+        self.plain_writer = None
+
+    async def resolve(self):
+        start_time = time.monotonic()
+        try:
+            return await resolver_cache.resolve(self.host)
+        finally:
+            add_phase(self.phases, "dns", time.monotonic() - start_time)
+
+    async def connect(self):
+        """
+        Opens a TCP connection to the first address which accepts it
+        """
+        error = None
+        for _, address in await self.resolve():
+            start_time = time.monotonic()
+            try:
+                reader, writer = await asyncio.open_connection(
+                    address, self.port, limit=settings.PROBE_CHUNK_SIZE
+                )
+                add_phase(self.phases, "connect", time.monotonic() - start_time)
+                return reader, writer
+            except OSError as e:
+                add_phase(self.phases, "connect", time.monotonic() - start_time)
+                error = e
+        raise error or OSError(f"Couldn't connect to {self.host}")
+
+    async def start_tls(self, writer):
+        """
+        Negotiates TLS on the open connection, through the shared contexts
+        Returns the reader and writer of the upgraded connection
+        StreamWriter.start_tls only exists from Python 3.11, this goes through the loop like open_connection does
+        """
+        start_time = time.monotonic()
+        await writer.drain()
+        loop = asyncio.get_running_loop()
+        reader = asyncio.StreamReader(limit=settings.PROBE_CHUNK_SIZE)
+        protocol = asyncio.StreamReaderProtocol(reader)
+        transport = await loop.start_tls(
+            writer.transport,
+            protocol,
+            get_ssl_context(self.request["verify_ssl"]),
+            server_hostname=self.host,
+        )
+        protocol.connection_made(transport)
+        # the plain writer closes the socket once collected, keep it until the probe is done
+        self.plain_writer = writer
+        writer = asyncio.StreamWriter(transport, protocol, reader, loop)
+        add_phase(self.phases, "tls", time.monotonic() - start_time)
+        ssl_object = writer.get_extra_info("ssl_object")
+        self.phases["ssl_object"] = ssl_object
+        self.phases["handshake"] = "resumed" if ssl_object.session_reused else "full"
+        return reader, writer
+
+    async def read_line(self, reader):
+        line = await reader.readline()
+        if not line:
+            raise ProtocolError("Connection closed by the server.")
+        self.downloaded += len(line)
+        if self.banner_at is None:
+            self.banner_at = time.monotonic()
+        return line
+
+    def match(self, banner):
+        match_start = time.perf_counter()
+        matched = search(self.request["regex"], banner)
+        self.match_time += time.perf_counter() - match_start
+        return matched
+
+    async def check(self):
+        raise NotImplementedError
+
+    async def run(self):
+        """
+        Runs the check within the endpoint timeout
+        Returns a context object, same shape as the HTTP probes
+        """
+        response_time = -1
+        match = False
+        timed_out = False
+        banner = b""
+        start_time = time.monotonic()
+        try:
+            if not self.host or not self.port:
+                raise ValueError
+            match, banner = await asyncio.wait_for(
+                self.check(), timeout=self.request["timeout"]
+            )
+            response_time = (self.banner_at or time.monotonic()) - start_time
+            message = "Connection established successfully."
+            store_session(self.phases["ssl_object"])
+        except re.error:
+            message = "Regex pattern is invalid. Please try with a different pattern."
+        except ValueError:
+            message = "Host or port is invalid. Please try with a different URL."
+        except asyncio.TimeoutError:
+            message = "Connection timed out. Try exceeding the timeout limit."
+            timed_out = True
+        except ProtocolError as e:
+            message = f"Server replied with an unexpected response. {e}"
+        except ssl.SSLError:
+            message = "TLS negotiation failed. Please check the server certificate."
+        except OSError:
+            # Network problem (DNS failure, refused connection, etc)
+            message = "Connection couldn't be established. Port refused the connection."
+
+        connected_at = start_time + self.phases["dns"] + self.phases["connect"]
+        context = {
+            "response_time": response_time,
+            "status": "UP" if match else "DOWN",
+            "message": message,
+            "reused": False,
+            "match_time": self.match_time,
+            "downloaded_bytes": self.downloaded,
+            "dns_time": self.phases["dns"],
+            "connect_time": self.phases["connect"],
+            "tls_time": self.phases["tls"],
+            "handshake": self.phases["handshake"],
+            # time to the banner, once the connection is up
+            "ttfb": self.banner_at - connected_at if self.banner_at else None,
+            "transfer_time": None,
+            "timed_out": timed_out,
+        }
+
+        if not match:
+            context["response_body"] = (
+                banner.decode("utf-8", errors="replace")
+                if banner and self.request["log_response"]
+                else None
+            )
+
+        return context
+
+
+@register("tcp")
+class TCPProbe(SocketProbe):
+    """
+    Connects and optionally sends the request body
+    Passes on connect, unless a pattern is set which then has to match what the server sends back
+    """
+
+    async def check(self):
+        reader, writer = await self.connect()
+        try:
+            if self.request["data"]:
+                writer.write(self.request["data"].encode("utf-8"))
+                await writer.drain()
+            if not self.request["regex"]:
+                return True, b""
+
+            matcher = StreamMatcher(self.request["regex"])
+            chunks = []
+            try:
+                while self.downloaded < self.request["max_body_size"]:
+                    chunk = await reader.read(settings.PROBE_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    if self.banner_at is None:
+                        self.banner_at = time.monotonic()
+                    chunk = chunk[: self.request["max_body_size"] - self.downloaded]
+                    self.downloaded += len(chunk)
+                    chunks.append(chunk)
+                    if matcher.feed(chunk):
+                        return True, b"".join(chunks)
+            finally:
+                self.match_time += matcher.elapsed
+            return False, b"".join(chunks)
+        finally:
+            writer.close()
+
+
+class DatagramProtocol(asyncio.DatagramProtocol):
+    def __init__(self):
+        self.reply = asyncio.get_running_loop().create_future()
+
+    def datagram_received(self, data, addr):
+        if not self.reply.done():
+            self.reply.set_result(data)
+
+    def error_received(self, exc):
+        if not self.reply.done():
+            self.reply.set_exception(exc)
+
+    def connection_lost(self, exc):
+        if not self.reply.done():
+            self.reply.set_exception(exc or OSError("Connection closed"))
+
+
+@register("udp")
+class UDPProbe(SocketProbe):
+    """
+    Sends the request body as a single datagram
+    Without a pattern, silence passes as long as the port isn't reported unreachable
+    """
+
+    async def check(self):
+        family, address = (await self.resolve())[0]
+        start_time = time.monotonic()
+        transport, protocol = await asyncio.get_running_loop().create_datagram_endpoint(
+            DatagramProtocol, remote_addr=(address, self.port), family=family
+        )
+        add_phase(self.phases, "connect", time.monotonic() - start_time)
+        try:
+            transport.sendto((self.request["data"] or "").encode("utf-8"))
+            if self.request["regex"]:
+                reply = await protocol.reply
+            else:
+                try:
+                    reply = await asyncio.wait_for(protocol.reply, UDP_SILENCE_WAIT)
+                except asyncio.TimeoutError:
+                    return True, b""
+            self.banner_at = time.monotonic()
+            reply = reply[: self.request["max_body_size"]]
+            self.downloaded = len(reply)
+            return self.match(reply), reply
+        finally:
+            transport.close()
+
+
+class MailProbe(SocketProbe):
+    """
+    Reads the greeting of a mail server and optionally upgrades the connection through STARTTLS
+    Implicit TLS ports negotiate TLS before the greeting
+    """
+
+    async def greet(self, reader, writer):
+        # returns the greeting, after checking it's positive
+        raise NotImplementedError
+
+    async def upgrade(self, reader, writer):
+        # returns the reader and writer of the upgraded connection
+        raise NotImplementedError
+
+    async def quit(self, reader, writer):
+        raise NotImplementedError
+
+    async def check(self):
+        reader, writer = await self.connect()
+        try:
+            logger_type = self.request["logger_type"]
+            implicit_tls = self.port in IMPLICIT_TLS_PORTS[logger_type]
+            if implicit_tls:
+                reader, writer = await self.start_tls(writer)
+            banner = await self.greet(reader, writer)
+            matched = self.match(banner)
+            if matched and self.request["starttls"] and not implicit_tls:
+                reader, writer = await self.upgrade(reader, writer)
+            try:
+                # be polite, a failed goodbye doesn't fail the check
+                await asyncio.wait_for(self.quit(reader, writer), 1)
+            except (asyncio.TimeoutError, ProtocolError, OSError):
+                pass
+            return matched, banner
+        finally:
+            writer.close()
+
+
+@register("smtp")
+class SMTPProbe(MailProbe):
+    async def read_reply(self, reader):
+        """
+        Returns the code and the lines of a (multiline) SMTP reply
+        """
+        lines = []
+        while True:
+            line = await self.read_line(reader)
+            lines.append(line)
+            if line[3:4] != b"-":
+                return line[:3], b"".join(lines)
+
+    async def command(self, reader, writer, command, expected):
+        writer.write(command + b"\r\n")
+        await writer.drain()
+        code, reply = await self.read_reply(reader)
+        if code != expected:
+            raise ProtocolError(reply.decode("utf-8", errors="replace").strip())
+        return reply
+
+    async def greet(self, reader, writer):
+        code, banner = await self.read_reply(reader)
+        if code != b"220":
+            raise ProtocolError(banner.decode("utf-8", errors="replace").strip())
+        return banner
+
+    async def upgrade(self, reader, writer):
+        reply = await self.command(reader, writer, b"EHLO pulse", b"250")
+        if b"STARTTLS" not in reply.upper():
+            raise ProtocolError("STARTTLS isn't supported.")
+        await self.command(reader, writer, b"STARTTLS", b"220")
+        reader, writer = await self.start_tls(writer)
+        await self.command(reader, writer, b"EHLO pulse", b"250")
+        return reader, writer
+
+    async def quit(self, reader, writer):
+        await self.command(reader, writer, b"QUIT", b"221")
+
+
+@register("pop")
+class POPProbe(MailProbe):
+    async def command(self, reader, writer, command):
+        writer.write(command + b"\r\n")
+        await writer.drain()
+        return await self.greet(reader, writer)
+
+    async def greet(self, reader, writer):
+        line = await self.read_line(reader)
+        if not line.startswith(b"+OK"):
+            raise ProtocolError(line.decode("utf-8", errors="replace").strip())
+        return line
+
+    async def upgrade(self, reader, writer):
+        await self.command(reader, writer, b"STLS")
+        return await self.start_tls(writer)
+
+    async def quit(self, reader, writer):
+        await self.command(reader, writer, b"QUIT")
+
+
+@register("imap")
+class IMAPProbe(MailProbe):
+    async def command(self, reader, writer, tag, command):
+        writer.write(tag + b" " + command + b"\r\n")
+        await writer.drain()
+        # untagged responses come first, the tagged one closes the command
+        while True:
+            line = await self.read_line(reader)
+            if line.startswith(tag + b" "):
+                if line[len(tag) + 1 :].startswith(b"OK"):
+                    return line
+                raise ProtocolError(line.decode("utf-8", errors="replace").strip())
+
+    async def greet(self, reader, writer):
+        line = await self.read_line(reader)
+        if not line.startswith((b"* OK", b"* PREAUTH")):
+            raise ProtocolError(line.decode("utf-8", errors="replace").strip())
+        return line
+
+    async def upgrade(self, reader, writer):
+        await self.command(reader, writer, b"a1", b"STARTTLS")
+        return await self.start_tls(writer)
+
+    async def quit(self, reader, writer):
+        await self.command(reader, writer, b"a2", b"LOGOUT")
@@ -0,0 +1,199 @@
+import time
+from redis.exceptions import WatchError
+from .redis_util import get_redis
+
+# "endpoint id:region" or "cron:cron id" => state code followed by the unix time the state was entered, e.g. "S1697650000"
+STATE_KEY = "state:endpoints"
+# state ids of the service which are DOWN or RECOVERING
+OUTAGE_KEY = "state:service:{}:outage"
+
+UP = "U"
+SUSPECT = "S"
+DOWN = "D"
+RECOVERING = "R"
+STATE_NAMES = {UP: "UP", SUSPECT: "SUSPECT", DOWN: "DOWN", RECOVERING: "RECOVERING"}
+
+
+def transition(state, since, status, now, confirmation_period, recovery_period):
+    """
+    Returns the next (state, since) of an endpoint given the status it was just observed in
+    Failures have to last the confirmation period before the endpoint goes DOWN
+    and successes have to last the recovery period before it's UP again
+    """
+    if status == "DOWN":
+        if state in (DOWN, RECOVERING):
+            return DOWN, since if state == DOWN else now
+        if state != SUSPECT:
+            state, since = SUSPECT, now
+        if now - since >= confirmation_period:
+            return DOWN, now
+        return state, since
+
+    if state in (UP, SUSPECT):
+        return UP, since if state == UP else now
+    if state != RECOVERING:
+        state, since = RECOVERING, now
+    if now - since >= recovery_period:
+        return UP, now
+    return state, since
+
+
+def get_state_id(endpoint_id, region=None):
+    """
+    Every region keeps its own state of the endpoint, so regions don't flap each other
+    """
+    return f"{endpoint_id}:{region}" if region else str(endpoint_id)
+
+
+def get_cron_state_id(cron_id):
+    """
+    Crons go through the same state machine as endpoints, under their own ids
+    """
+    return f"cron:{cron_id}"
+
+
+def get_result_state_id(result):
+    # results of crons carry a cron_id instead of an endpoint_id
+    if "cron_id" in result:
+        return get_cron_state_id(result["cron_id"])
+    return get_state_id(result["endpoint_id"], result.get("region"))
+
+
+def get_state_owner(state_id):
+    """
+    Returns ("endpoint", id) or ("cron", id), the monitor the state id belongs to
+    """
+    kind, _, rest = state_id.partition(":")
+    if kind == "cron":
+        return "cron", int(rest)
+    return "endpoint", int(kind)
+
+
+def get_states(state_ids, client=None):
+    """
+    Returns {state id: (state, since)}, endpoints without a state are UP
+    """
+    client = client or get_redis()
+    values = client.hmget(STATE_KEY, state_ids) if state_ids else []
+    states = {}
+    for state_id, value in zip(state_ids, values):
+        if value is None:
+            states[state_id] = (UP, 0)
+        else:
+            value = value.decode()
+            states[state_id] = (value[0], int(value[1:]))
+    return states
+
+
+def apply_results(results, now=None):
+    """
+    Moves every endpoint through the state machine
+    Returns the services whose outage just started and the ones whose outage just ended
+    Every result is tagged with the state and since of its endpoint
+    A service is in an outage as long as one of its endpoints is DOWN or RECOVERING in any region
+    The states are read and written in a single transaction, it starts over when a concurrent batch
+    changed them in between
+    """
+    if now is None:
+        now = int(time.time())
+    state_ids = [get_result_state_id(result) for result in results]
+    with get_redis().pipeline() as pipeline:
+        while True:
+            try:
+                pipeline.watch(STATE_KEY)
+                return apply_states(pipeline, state_ids, results, now)
+            except WatchError:
+                continue
+
+
+def apply_states(pipeline, state_ids, results, now):
+    """
+    Runs the results through the state machine within the watching pipeline, see apply_results
+    """
+    states = get_states(state_ids, pipeline)
+    changed = {}
+    # (state id, result, whether the endpoint's outage opened or closed)
+    transitions = []
+    for state_id, result in zip(state_ids, results):
+        state, since = states[state_id]
+        next_state, next_since = transition(
+            state,
+            since,
+            result.get("status", "UP"),
+            now,
+            result.get("confirmation_period", 0),
+            result.get("recovery_period", 0),
+        )
+        result["state"], result["state_since"] = next_state, next_since
+        if (next_state, next_since) == (state, since):
+            continue
+        changed[state_id] = f"{next_state}{next_since}"
+        if next_state == DOWN and state not in (DOWN, RECOVERING):
+            transitions.append((state_id, result, True))
+        elif next_state == UP and state in (DOWN, RECOVERING):
+            transitions.append((state_id, result, False))
+
+    if not changed:
+        return set(), set()
+
+    pipeline.multi()
+    pipeline.hset(STATE_KEY, mapping=changed)
+    outages = []
+    for state_id, result, opening in transitions:
+        for service_id in result.get("service_ids", []):
+            key = OUTAGE_KEY.format(service_id)
+            if opening:
+                pipeline.sadd(key, state_id)
+            else:
+                pipeline.srem(key, state_id)
+            pipeline.scard(key)
+            outages.append((service_id, opening))
+    replies = pipeline.execute()[1:]
+
+    started = set()
+    ended = set()
+    for (service_id, opening), updated, remaining in zip(
+        outages, replies[::2], replies[1::2]
+    ):
+        # the first endpoint to go DOWN opens the outage, the last one to recover ends it
+        if opening and updated and remaining == 1:
+            started.add(service_id)
+        elif not opening and updated and remaining == 0:
+            ended.add(service_id)
+    return started, ended
+
+
+def get_outages(service_ids):
+    """
+    Returns {service id: state ids the service's outage is made of}
+    """
+    pipeline = get_redis().pipeline()
+    for service_id in service_ids:
+        pipeline.smembers(OUTAGE_KEY.format(service_id))
+    return {
+        service_id: {state_id.decode() for state_id in members}
+        for service_id, members in zip(service_ids, pipeline.execute())
+    }
+
+
+def leave_outages(stale):
+    """
+    Takes {service id: state ids} out of the services' outages, once they no longer belong to the services
+    Returns the services whose outage ended with them
+    """
+    service_ids = [service_id for service_id, state_ids in stale.items() if state_ids]
+    if not service_ids:
+        return set()
+    pipeline = get_redis().pipeline()
+    for service_id in service_ids:
+        key = OUTAGE_KEY.format(service_id)
+        pipeline.srem(key, *stale[service_id])
+        pipeline.scard(key)
+    replies = pipeline.execute()
+    return {
+        service_id
+        for service_id, removed, remaining in zip(
+            service_ids, replies[::2], replies[1::2]
+        )
+        if removed and remaining == 0
+    }
@@ -0,0 +1,78 @@
+import ssl
+
+_contexts = {}
+
+
+class ResumingSSLContext(ssl.SSLContext):
+    """
+    Client SSLContext which offers the last TLS session of a host on every new connection
+    asyncio doesn't pass sessions through start_tls, so they are injected when the socket is wrapped
+    """
+
+    def __init__(self, *args, **kwargs):
+        # SSLContext is set up in __new__, only the session cache is added here
+        self.sessions = {}
+
+    def wrap_socket(
+        self,
+        sock,
+        server_side=False,
+        do_handshake_on_connect=True,
+        suppress_ragged_eofs=True,
+        server_hostname=None,
+        session=None,
+    ):
+        if session is None and server_hostname:
+            session = self.sessions.get(server_hostname)
+        return super().wrap_socket(
+            sock,
+            server_side=server_side,
+            do_handshake_on_connect=do_handshake_on_connect,
+            suppress_ragged_eofs=suppress_ragged_eofs,
+            server_hostname=server_hostname,
+            session=session,
+        )
+
+    def wrap_bio(
+        self, incoming, outgoing, server_side=False, server_hostname=None, session=None
+    ):
+        if session is None and server_hostname:
+            session = self.sessions.get(server_hostname)
+        return super().wrap_bio(
+            incoming,
+            outgoing,
+            server_side=server_side,
+            server_hostname=server_hostname,
+            session=session,
+        )
+
+
+def get_ssl_context(verify_ssl):
+    """
+    Returns the worker-lifetime SSL context, one verifies certificates and the other doesn't
+    """
+    verify_ssl = bool(verify_ssl)
+    context = _contexts.get(verify_ssl)
+    if context is None:
+        context = ResumingSSLContext(ssl.PROTOCOL_TLS_CLIENT)
+        if verify_ssl:
+            context.load_default_certs()
+        else:
+            context.check_hostname = False
+            context.verify_mode = ssl.CERT_NONE
+        _contexts[verify_ssl] = context
+    return context
+
+
+def store_session(ssl_object):
+    """
+    Keeps the TLS session of the connection, so the next connection to the host can resume it
+    TLS 1.3 tickets arrive after the handshake, call this once the response has been read
+    """
+    if ssl_object is None or not ssl_object.server_hostname:
+        return
+    context = ssl_object.context
+    session = ssl_object.session
+    if isinstance(context, ResumingSSLContext) and session is not None:
+        if session.has_ticket or session.id:
+            context.sessions[ssl_object.server_hostname] = session
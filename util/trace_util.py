@@ -0,0 +1,102 @@
+import time
+import contextvars
+import aiohttp
+
+# phase timings of the probe running in the current task, shared with the connector
+probe_phases = contextvars.ContextVar("probe_phases", default=None)
+
+
+def new_phases():
+    """
+    Returns an empty set of phase timings, durations are in seconds
+    """
+    return {
+        "reused": False,
+        "dns": 0,
+        "connect": 0,
+        "tls": 0,
+        "sent_at": None,
+        "handshake": None,
+        "ssl_object": None,
+    }
+
+
+def add_phase(phases, name, duration):
+    if phases is not None:
+        phases[name] += duration
+
+
+class PhaseTimingConnector(aiohttp.TCPConnector):
+    """
+    TCPConnector which opens the TCP connection and negotiates TLS as two separate steps
+    Both steps are timed into the phases of the current probe
+    Overrides private hooks of aiohttp 3.8, logger.tests.PhaseTimingTests fails once an upgrade stops calling them
+    """
+
+    async def _wrap_create_connection(
+        self,
+        *args,
+        req,
+        timeout,
+        client_error=aiohttp.ClientConnectorError,
+        **kwargs,
+    ):
+        phases = probe_phases.get()
+        sslcontext = kwargs.pop("ssl", None)
+        kwargs.pop("server_hostname", None)
+
+        start_time = time.monotonic()
+        transport, protocol = await super()._wrap_create_connection(
+            *args, req=req, timeout=timeout, client_error=client_error, **kwargs
+        )
+        add_phase(phases, "connect", time.monotonic() - start_time)
+        if not sslcontext:
+            return transport, protocol
+
+        start_time = time.monotonic()
+        tls_transport, tls_protocol = await self._start_tls_connection(
+            transport, req=req, timeout=timeout, client_error=client_error
+        )
+        add_phase(phases, "tls", time.monotonic() - start_time)
+        if phases is not None:
+            # kept so the session can be stored once its ticket has arrived
+            ssl_object = tls_transport.get_extra_info("ssl_object")
+            phases["ssl_object"] = ssl_object
+            if ssl_object is not None:
+                phases["handshake"] = "resumed" if ssl_object.session_reused else "full"
+        return tls_transport, tls_protocol
+
+
+async def on_dns_resolvehost_start(session, trace_config_ctx, params):
+    trace_config_ctx.dns_start = time.monotonic()
+
+
+async def on_dns_resolvehost_end(session, trace_config_ctx, params):
+    add_phase(
+        trace_config_ctx.trace_request_ctx,
+        "dns",
+        time.monotonic() - trace_config_ctx.dns_start,
+    )
+
+
+async def on_connection_reuseconn(session, trace_config_ctx, params):
+    if trace_config_ctx.trace_request_ctx is not None:
+        trace_config_ctx.trace_request_ctx["reused"] = True
+
+
+async def on_request_headers_sent(session, trace_config_ctx, params):
+    # overwritten on every redirect, time to first byte is measured from the last hop
+    if trace_config_ctx.trace_request_ctx is not None:
+        trace_config_ctx.trace_request_ctx["sent_at"] = time.monotonic()
+
+
+def build_trace_config():
+    """
+    Returns the trace config which records connection reuse and the DNS phase
+    """
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_dns_resolvehost_start.append(on_dns_resolvehost_start)
+    trace_config.on_dns_resolvehost_end.append(on_dns_resolvehost_end)
+    trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+    trace_config.on_request_headers_sent.append(on_request_headers_sent)
+    return trace_config